@@ -0,0 +1,160 @@
+"""A local stand-in for the Aerobotics `farming/surveys` and `tree_surveys` endpoints.
+
+Serves synthetic orchards (see synthetic_orchard.py) with a configurable latency and payload size:
+
+    PYTHONPATH=. python -m benchmarks.aerobotics_stub --port 8089 --latency-ms 150 --trees 5000
+    AEROBOTICS_BASE_URL=http://127.0.0.1:8089 make run
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic_orchard import generate_orchard
+
+
+class StubOrchards:
+    def __init__(self, trees_per_orchard: int = 1200, missing_fraction: float = 0.03):
+        self.trees_per_orchard = trees_per_orchard
+        self.missing_fraction = missing_fraction
+        self._lock = threading.Lock()
+        self._surveys = {}
+        self._tree_surveys = {}
+        self._next_survey_id = 1000
+
+    def _generate(self, orchard_id: str, survey_id: int):
+        side = max(2, math.ceil(math.sqrt(self.trees_per_orchard / (1 - self.missing_fraction))))
+        orchard = generate_orchard(
+            rows=side,
+            trees_per_row=side,
+            missing_fraction=self.missing_fraction,
+            survey_id=survey_id,
+            orchard_id=int(orchard_id) if orchard_id.isdigit() else 0,
+            seed=survey_id,
+        )
+        # Responses are encoded once, so the stand-in stays cheap next to the app under test
+        self._surveys[orchard_id] = json.dumps(orchard["survey"]).encode()
+        self._tree_surveys[survey_id] = json.dumps(orchard["tree_survey"]).encode()
+
+    def publish_survey(self, orchard_id: str) -> int:
+        with self._lock:
+            survey_id = self._next_survey_id
+            self._next_survey_id += 1
+            self._generate(orchard_id, survey_id)
+            return survey_id
+
+    def survey(self, orchard_id: str) -> bytes:
+        with self._lock:
+            if orchard_id not in self._surveys:
+                survey_id = self._next_survey_id
+                self._next_survey_id += 1
+                self._generate(orchard_id, survey_id)
+            return self._surveys[orchard_id]
+
+    def tree_survey(self, survey_id: int):
+        with self._lock:
+            return self._tree_surveys.get(survey_id)
+
+
+def make_handler(orchards: StubOrchards, latency_ms: float, latency_jitter_ms: float):
+    class AeroboticsStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status: int, body: bytes):
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up waiting, which the deadline tests do on purpose
+                self.close_connection = True
+
+        def do_GET(self):
+            time.sleep(max(0.0, latency_ms + random.uniform(-latency_jitter_ms, latency_jitter_ms)) / 1000)
+
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return self.send_json(401, b'{"detail": "Authentication credentials were not provided."}')
+
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+
+            if parts == ["farming", "surveys"]:
+                orchard_id = parse_qs(url.query).get("orchard_id", [""])[0]
+                if not orchard_id:
+                    return self.send_json(400, b'{"detail": "orchard_id is required"}')
+                return self.send_json(200, orchards.survey(orchard_id))
+
+            if len(parts) == 4 and parts[:2] == ["farming", "surveys"] and parts[3] == "tree_surveys":
+                body = orchards.tree_survey(int(parts[2])) if parts[2].isdigit() else None
+                if body is None:
+                    return self.send_json(404, b'{"detail": "Not found."}')
+                return self.send_json(200, body)
+
+            return self.send_json(404, b'{"detail": "Not found."}')
+
+    return AeroboticsStubHandler
+
+
+class AeroboticsStub:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        latency_jitter_ms: float = 0.0,
+        trees_per_orchard: int = 1200,
+    ):
+        self.orchards = StubOrchards(trees_per_orchard)
+        self.server = ThreadingHTTPServer((host, port), make_handler(self.orchards, latency_ms, latency_jitter_ms))
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "AeroboticsStub":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--trees", type=int, default=1200, help="Trees per orchard, which sets the payload size")
+    args = parser.parse_args()
+
+    stub = AeroboticsStub(args.host, args.port, args.latency_ms, args.latency_jitter_ms, args.trees)
+    print(f"Aerobotics stand-in listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Load test the API under gunicorn against a local stand-in for Aerobotics (benchmarks/aerobotics_stub.py).
+
+For each gunicorn workers x threads configuration, ramps up the number of concurrent clients and reports
+throughput, latency percentiles, the error rate and the resident memory of each worker:
+
+    PYTHONPATH=. python -m benchmarks.load_test --configs 1x1 2x1 2x4 --concurrency 1 4 16
+
+With --dispatcher, the same workers x threads are run as dispatcher mode analysis workers (src/dispatcher.py).
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+import requests
+
+from benchmarks.aerobotics_stub import AeroboticsStub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT_SECONDS = 60
+
+
+def parse_config(config: str) -> tuple:
+    workers, threads = config.lower().split("x")
+    return int(workers), int(threads)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def worker_pids(master_pid: int) -> list:
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                # The process name is in brackets and may contain spaces, the parent pid follows the state
+                parent_pid = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent_pid == master_pid:
+            pids.append(int(entry))
+    return pids
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class MemorySampler:
+    """Samples the peak resident memory of every worker while a load level runs"""
+
+    def __init__(self, pids: Callable[[], list], interval_seconds: float = 0.2):
+        self.pids = pids
+        self.interval_seconds = interval_seconds
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            for pid in self.pids():
+                self.peaks[pid] = max(self.peaks.get(pid, 0.0), rss_mb(pid))
+            self._stop.wait(self.interval_seconds)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class GunicornServer:
+    def __init__(
+        self,
+        workers: int,
+        threads: int,
+        stub_url: str,
+        working_directory: str,
+        single_flight_ttl_seconds: float,
+        recent_analyses: int,
+    ):
+        self.workers = workers
+        self.threads = threads
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(
+            os.environ,
+            AEROBOTICS_BASE_URL=stub_url,
+            PYTHONPATH=REPO_ROOT,
+            RECENT_ANALYSES_MAX_ENTRIES=str(recent_analyses),
+            SINGLE_FLIGHT_RESULT_TTL_SECONDS=str(single_flight_ttl_seconds),
+        )
+        self.working_directory = working_directory
+        self.process = None
+
+    def command(self) -> list:
+        return [
+            sys.executable, "-m", "gunicorn",
+            "--workers", str(self.workers),
+            "--threads", str(self.threads),
+            "--bind", f"127.0.0.1:{self.port}",
+            "--timeout", "120",
+            "--log-level", "warning",
+            "src.app:app",
+        ]
+
+    def worker_pids(self) -> list:
+        return worker_pids(self.process.pid)
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            self.command(),
+            cwd=self.working_directory,
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self._wait_until_healthy()
+        return self
+
+    def _wait_until_healthy(self):
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {self.process.returncode}")
+            try:
+                # Every worker imports the app before serving, so wait for all of them to answer
+                healthy = requests.get(f"{self.url}/health", timeout=1).ok
+                if healthy and len(self.worker_pids()) >= self.workers:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"gunicorn did not become healthy within {STARTUP_TIMEOUT_SECONDS}s")
+
+    def __exit__(self, *exc_info):
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class DispatcherServer(GunicornServer):
+    """Dispatcher mode: the workers are long-lived analysis workers, each owning its share of the orchards"""
+
+    def __init__(self, workers: int, threads: int, *args, **kwargs):
+        super().__init__(workers, threads, *args, **kwargs)
+        self.env.update(
+            DISPATCHER_SOCKET_DIR=os.path.join(self.working_directory, "dispatcher"),
+            DISPATCHER_WORKER_THREADS=str(threads),
+            DISPATCHER_WORKERS=str(workers),
+        )
+
+    def command(self) -> list:
+        return [
+            sys.executable, "-m", "uvicorn", "src.dispatcher:app",
+            "--port", str(self.port),
+            "--log-level", "warning",
+        ]
+
+    def worker_pids(self) -> list:
+        # Each analysis worker is a single gunicorn worker process under its own gunicorn master
+        return [pid for master_pid in worker_pids(self.process.pid) for pid in worker_pids(master_pid)]
+
+
+def run_level(base_url: str, path: str, orchard_ids: list, concurrency: int, total_requests: int) -> dict:
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    headers = {"Authorization": "Bearer load-test"}
+
+    def one_request(index: int):
+        url = f"{base_url}/api/orchards/{orchard_ids[index % len(orchard_ids)]}/{path}"
+        start = time.perf_counter()
+        try:
+            ok = session.get(url, headers=headers, timeout=120).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one_request, range(total_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, _ in results])
+    errors = sum(1 for _, ok in results if not ok)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "throughput": total_requests / elapsed,
+        "p50": p50,
+        "p95": p95,
+        "p99": p99,
+        "error_rate": errors / total_requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="+", type=parse_config, default=[(1, 1), (2, 1), (2, 4), (4, 2)],
+                        help="gunicorn workers x threads")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=4, help="Requests per concurrent client at each level")
+    parser.add_argument("--orchards", type=int, default=8, help="Distinct orchards the requests are spread over")
+    parser.add_argument("--trees", type=int, default=1200, help="Trees per orchard, which sets the payload size")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Latency the stand-in adds to each call")
+    parser.add_argument("--latency-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--endpoint", default="missing-trees",
+                        choices=["missing-trees", "missing-trees/geojson", "missing-trees/columnar"])
+    # With the default of 0 every request runs the pipeline unless it joins an identical one in flight. Pass the
+    # production TTL to measure how much the shared results save instead.
+    parser.add_argument("--single-flight-ttl", type=float, default=0.0)
+    # Likewise each worker keeps no analyses in memory unless asked to. With some, compare the worker memory of
+    # gunicorn's workers (every worker holds every orchard) against --dispatcher (each orchard is held once).
+    parser.add_argument("--recent-analyses", type=int, default=0)
+    parser.add_argument("--dispatcher", action="store_true", help="Serve in dispatcher mode (src/dispatcher.py)")
+    args = parser.parse_args()
+
+    orchard_ids = [str(216269 + i) for i in range(args.orchards)]
+    print(f"{args.orchards} orchards of {args.trees} trees, upstream latency {args.latency_ms:.0f}ms, "
+          f"GET /api/orchards/<id>/{args.endpoint}")
+    print(f"{'config':>7} {'clients':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} "
+          f"{'worker MB mean':>14} {'worker MB max':>13}")
+
+    with AeroboticsStub(latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms,
+                        trees_per_orchard=args.trees) as stub, tempfile.TemporaryDirectory() as working_directory:
+        for workers, threads in args.configs:
+            server_class = DispatcherServer if args.dispatcher else GunicornServer
+            server = server_class(
+                workers, threads, stub.url, working_directory, args.single_flight_ttl, args.recent_analyses
+            )
+            with server:
+                for concurrency in args.concurrency:
+                    with MemorySampler(server.worker_pids) as memory:
+                        level = run_level(
+                            server.url, args.endpoint, orchard_ids, concurrency, concurrency * args.requests
+                        )
+                    peaks = list(memory.peaks.values()) or [0.0]
+                    print(f"{workers}x{threads:<5} {concurrency:>7} {level['throughput']:>7.1f} {level['p50']:>8.0f} "
+                          f"{level['p95']:>8.0f} {level['p99']:>8.0f} {level['error_rate']:>7.1%} "
+                          f"{np.mean(peaks):>14.0f} {max(peaks):>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
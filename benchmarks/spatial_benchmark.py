@@ -0,0 +1,191 @@
+"""Benchmarks for the spatial pipeline on synthetic orchards.
+
+    PYTHONPATH=. python -m benchmarks.spatial_benchmark map --trees 50000
+    PYTHONPATH=. python -m benchmarks.spatial_benchmark index --sizes 30x40 120x160
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+from scipy.spatial import cKDTree
+from shapely.geometry import Point
+from shapely.strtree import STRtree
+
+from benchmarks.synthetic_orchard import generate_orchard
+from src.config.settings import DEFAULT_GEOGRAPHIC_CRS, DEFAULT_PROJECTED_CRS, TREE_SPACING
+from src.config.settings import (
+    GRID_SPACING_MULTIPLIER,
+    MAP_RENDER_MODES,
+    MAX_DISTANCE_MULTIPLIER,
+    NEARBY_SEARCH_MULTIPLIER,
+    OVERLAP_THRESHOLD_METRES,
+    SPATIAL_INDEX_CELL_MULTIPLIER,
+    TREE_RADIUS_MULTIPLIER,
+)
+from src.utils import spatial, visualisation
+from src.utils.spatial_index import UniformGridIndex
+
+
+def parse_size(size: str) -> tuple:
+    rows, trees_per_row = size.lower().split("x")
+    return int(rows), int(trees_per_row)
+
+
+def run_quietly(function, *args, **kwargs):
+    # Keep anything the pipeline writes to stdout out of the table
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def timed(function, *args, repeats=3):
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        runs.append((time.perf_counter() - start) * 1000)
+    return result, min(runs)
+
+
+def benchmark_index(sizes: list, cell_multipliers: list, repeats: int):
+    """Times the grid index against the cKDTree and STRtree it replaced, on the queries the pipeline makes"""
+    print(f"{'orchard':>9} {'query':>22} {'queries':>8} {'cKDTree ms':>11} {'STRtree ms':>11} "
+          + " ".join(f"{f'grid x{multiplier} ms':>13}" for multiplier in cell_multipliers))
+    for rows, trees_per_row in sizes:
+        orchard = generate_orchard(rows=rows, trees_per_row=trees_per_row, missing_fraction=0.03, seed=rows)
+        tree_gdf = spatial.create_geodataframe_from_tree_data(orchard["tree_data"])
+        trees = np.array(spatial.extract_tree_coordinates(tree_gdf))
+        outer_polygon = (
+            gpd.GeoSeries([orchard["outer_polygon"]], crs=DEFAULT_GEOGRAPHIC_CRS)
+            .to_crs(epsg=DEFAULT_PROJECTED_CRS)
+            .iloc[0]
+        )
+        candidates = np.vstack(
+            list(spatial.rasterize_polygon_grid(
+                outer_polygon, TREE_SPACING * GRID_SPACING_MULTIPLIER, chunk_size=spatial.MIN_CHUNK_SIZE
+            ))
+        )
+        label = f"{rows}x{trees_per_row}"
+        tree_radius = TREE_SPACING * TREE_RADIUS_MULTIPLIER
+        max_distance = TREE_SPACING * MAX_DISTANCE_MULTIPLIER
+        nearby_radius = TREE_SPACING * NEARBY_SEARCH_MULTIPLIER
+
+        kdtree, kdtree_build_ms = timed(cKDTree, trees, repeats=repeats)
+        strtree, strtree_build_ms = timed(lambda: STRtree([Point(x, y) for x, y in trees]), repeats=repeats)
+        grids = [
+            timed(UniformGridIndex, trees, TREE_SPACING * multiplier, repeats=repeats)
+            for multiplier in cell_multipliers
+        ]
+
+        # Each query: how cKDTree and STRtree answer it, and how the grid does. The answers must agree.
+        queries = [
+            ("build", len(trees), None, lambda: None, lambda grid: None),
+            (
+                f"overlap r={tree_radius:g}",
+                len(candidates),
+                lambda: cKDTree.query_ball_point(kdtree, candidates, tree_radius, return_length=True) > 0,
+                lambda: np.array([len(strtree.query(Point(x, y).buffer(tree_radius))) > 0 for x, y in candidates]),
+                lambda grid: grid.count_radius(candidates, tree_radius) > 0,
+            ),
+            (
+                f"nearest <={max_distance:g}",
+                len(candidates),
+                lambda: kdtree.query(candidates, distance_upper_bound=max_distance)[0],
+                None,
+                lambda grid: grid.nearest(candidates, max_distance)[0],
+            ),
+            (
+                f"count r={nearby_radius:g}",
+                len(candidates),
+                lambda: kdtree.query_ball_point(candidates, nearby_radius, return_length=True),
+                None,
+                lambda grid: grid.count_radius(candidates, nearby_radius),
+            ),
+            (
+                f"pairs r={OVERLAP_THRESHOLD_METRES:g}",
+                len(trees),
+                lambda: kdtree.query_ball_point(trees, OVERLAP_THRESHOLD_METRES, return_length=True).sum(),
+                None,
+                lambda grid: len(grid.query_radius(trees, OVERLAP_THRESHOLD_METRES)[0]),
+            ),
+        ]
+
+        for name, query_count, kdtree_query, strtree_query, grid_query in queries:
+            if name == "build":
+                kdtree_ms, strtree_ms = kdtree_build_ms, strtree_build_ms
+                grid_ms = [build_ms for _, build_ms in grids]
+            else:
+                expected, kdtree_ms = timed(kdtree_query, repeats=repeats)
+                strtree_ms = float("nan")
+                if strtree_query is not None:
+                    _, strtree_ms = timed(strtree_query, repeats=1)
+                grid_ms = []
+                for grid, _ in grids:
+                    found, elapsed = timed(grid_query, grid, repeats=repeats)
+                    assert np.array_equal(found, expected), f"grid index disagrees with cKDTree on {name}"
+                    grid_ms.append(elapsed)
+            print(
+                f"{label:>9} {name:>22} {query_count:>8} {kdtree_ms:>11.1f} {strtree_ms:>11.1f} "
+                + " ".join(f"{elapsed:>13.1f}" for elapsed in grid_ms)
+            )
+
+
+def benchmark_map(tree_count: int, render_modes: list):
+    """Times building and saving the debugging map, and reports the size of the HTML it writes"""
+    side = math.ceil(math.sqrt(tree_count / 0.97))
+    orchard = generate_orchard(rows=side, trees_per_row=side, missing_fraction=0.03, seed=tree_count)
+    tree_data = orchard["tree_data"]
+    outer_polygon = orchard["outer_polygon"]
+    inner_boundary = spatial.inner_boundary_visualisation(outer_polygon)
+
+    tree_polygons, polygons_ms = run_quietly(spatial.create_tree_polygons, tree_data, 4326)
+    print(f"{len(tree_data)} trees, create_tree_polygons {polygons_ms:.1f} ms")
+    print(f"{'mode':>11} {'create ms':>10} {'save ms':>9} {'html MB':>8}")
+
+    for render_mode in render_modes:
+        folium_map, create_ms = run_quietly(
+            visualisation.create_orchard_map,
+            tree_polygons=tree_polygons,
+            outer_polygon=outer_polygon,
+            inner_boundary=inner_boundary,
+            trees=tree_data,
+            render_mode=render_mode,
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, "map.html")
+            _, save_ms = run_quietly(folium_map.save, output_path)
+            html_mb = os.path.getsize(output_path) / 1e6
+        print(f"{render_mode:>11} {create_ms:>10.1f} {save_ms:>9.1f} {html_mb:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    map_parser = subparsers.add_parser("map", help="HTML size and render time of the map render modes")
+    map_parser.add_argument("--trees", type=int, default=50000)
+    map_parser.add_argument("--modes", nargs="+", choices=MAP_RENDER_MODES, default=list(MAP_RENDER_MODES))
+
+    index_parser = subparsers.add_parser("index", help="Grid index against cKDTree and STRtree")
+    index_parser.add_argument("--sizes", nargs="+", type=parse_size, default=[(30, 40), (120, 160)])
+    index_parser.add_argument(
+        "--cell-multipliers", nargs="+", type=float, default=[0.5, SPATIAL_INDEX_CELL_MULTIPLIER, 2.0]
+    )
+    index_parser.add_argument("--repeats", type=int, default=3)
+
+    args = parser.parse_args()
+    if args.benchmark == "map":
+        benchmark_map(args.trees, args.modes)
+    elif args.benchmark == "index":
+        benchmark_index(args.sizes, args.cell_multipliers, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
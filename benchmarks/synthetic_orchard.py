@@ -0,0 +1,83 @@
+import numpy as np
+from pyproj import Transformer
+from shapely.geometry import Polygon
+
+from src.config.settings import DEFAULT_PROJECTED_CRS
+
+# Somewhere in the Ceres valley, inside UTM zone 34S
+DEFAULT_ORIGIN = (300000.0, 6420000.0)
+
+
+def generate_orchard(
+    rows: int = 30,
+    trees_per_row: int = 40,
+    tree_spacing: float = 5.0,
+    row_spacing: float = 6.0,
+    missing_fraction: float = 0.05,
+    jitter: float = 0.2,
+    rotation_degrees: float = 0.0,
+    survey_id: int = 1,
+    orchard_id: int = 1,
+    seed: int = 0,
+    origin: tuple = DEFAULT_ORIGIN,
+) -> dict:
+    """Build an orchard in the shape of the Aerobotics survey and tree survey responses."""
+    rng = np.random.default_rng(seed)
+    to_geographic = Transformer.from_crs(DEFAULT_PROJECTED_CRS, 4326, always_xy=True)
+
+    columns, row_numbers = np.meshgrid(np.arange(trees_per_row), np.arange(rows))
+    local_x = columns.ravel() * tree_spacing
+    local_y = row_numbers.ravel() * row_spacing
+
+    # The boundary sits a little outside the outermost trees, with a wider headland on the bottom and left
+    width, height = (trees_per_row - 1) * tree_spacing, (rows - 1) * row_spacing
+    boundary_x = np.array([-6.0, width + 2.0, width + 2.0, -6.0])
+    boundary_y = np.array([-8.0, -8.0, height + 2.0, height + 2.0])
+
+    angle = np.radians(rotation_degrees)
+
+    def to_projected(x, y):
+        return (
+            origin[0] + x * np.cos(angle) - y * np.sin(angle),
+            origin[1] + x * np.sin(angle) + y * np.cos(angle),
+        )
+
+    tree_x, tree_y = to_projected(local_x, local_y)
+    tree_x = tree_x + rng.normal(0, jitter, tree_x.size)
+    tree_y = tree_y + rng.normal(0, jitter, tree_y.size)
+    present = rng.random(tree_x.size) >= missing_fraction
+
+    lng, lat = to_geographic.transform(tree_x[present], tree_y[present])
+    areas = rng.uniform(5.0, 15.0, int(present.sum()))
+
+    polygon_lng, polygon_lat = to_geographic.transform(*to_projected(boundary_x, boundary_y))
+    polygon_coords = list(zip(polygon_lng, polygon_lat))
+    polygon_coords.append(polygon_coords[0])
+
+    missing_lng, missing_lat = to_geographic.transform(tree_x[~present], tree_y[~present])
+
+    tree_data = [
+        {"lat": float(tree_lat), "lng": float(tree_lng), "area": float(area)}
+        for tree_lat, tree_lng, area in zip(lat, lng, areas)
+    ]
+    return {
+        "survey": {
+            "count": 1,
+            "results": [{
+                "id": survey_id,
+                "orchard_id": orchard_id,
+                "date": "2025-07-01",
+                "polygon": " ".join(f"{x},{y}" for x, y in polygon_coords),
+            }],
+        },
+        "tree_survey": {
+            "count": len(tree_data),
+            "results": [
+                dict(tree, id=index + 1, survey_id=survey_id, ndre=0.6, ndvi=0.8, volume=tree["area"] * 2)
+                for index, tree in enumerate(tree_data)
+            ],
+        },
+        "tree_data": tree_data,
+        "outer_polygon": Polygon(polygon_coords),
+        "removed_trees": [{"lat": float(a), "lng": float(b)} for a, b in zip(missing_lat, missing_lng)],
+    }
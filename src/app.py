@@ -1,42 +1,82 @@
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify, make_response, send_from_directory
 from functools import wraps
-import asyncio
 import logging
-import os
 import sys
+import time
+
+from src.utils.structured_logging import REQUEST_ID_HEADER, configure_logging, log_context
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 try:
     from src.clients.aerobotics_api_client import AeroboticsAPIClient
-    from src.utils.helpers import convert_result_to_analysis, orchard_result_to_dict
-    from src.validation.aerobotics import (
-        validate_survey_response,
-        validate_tree_survey_response,
+    from src.config.settings import PROFILE_ARTIFACT_DIR
+    from src.services.analysis_requests import (
+        AnalysisLookup,
+        bearer_token_from_headers,
+        export_response_parts,
+        log_request_summary,
+        missing_trees_body,
+        parse_analysis_request,
+        request_id_from_headers,
     )
-    from src.utils.api_error import ApiError
-    from src.utils.visualisation import create_orchard_map
-    from src.utils.spatial import (
-        build_outer_polygon_from_survey,
-        create_tree_polygons,
-        find_missing_tree_positions,
-        inner_boundary_visualisation,
+    from src.services.errors import analysis_error_response
+    from src.utils.deadline import request_deadline
+    from src.utils.export import COLUMNAR_MIMETYPE, analysis_to_arrays, to_columnar, to_geojson
+    from src.utils.profiling import (
+        PROFILE_ID_HEADER,
+        is_profiling_admin,
+        list_artifacts,
+        profile_stage,
+        profiling_requested,
+        profiling_session,
     )
-    print("All imports successful", file=sys.stdout, flush=True)
-except Exception as e:
-    print(f"Import failed: {e}", file=sys.stderr, flush=True)
-    import traceback
-    traceback.print_exc()
+    from src.utils.single_flight import SingleFlight
+    logger.info("All imports successful")
+except Exception:
+    logger.exception("Import failed")
     sys.exit(1)
 
 
 app = Flask(__name__)
 app.logger.setLevel(logging.INFO)
 
+analyses = AnalysisLookup(SingleFlight())
+
 
 def extract_bearer_token():
-    auth_header = request.headers.get('Authorization', '')
-    if not auth_header.startswith('Bearer '):
-        return None
-    return auth_header.replace('Bearer ', '')
+    return bearer_token_from_headers(request.headers)
+
+
+def profiled_request(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profiling_requested(extract_bearer_token(), request.headers):
+            return view(*args, **kwargs)
+
+        label = "_".join(str(value) for value in kwargs.values()) or view.__name__
+        with profiling_session(label) as session:
+            response = make_response(view(*args, **kwargs))
+
+        if session is not None:
+            artifacts = session.write_artifacts()
+            app.logger.info("Profile artifacts written: %s", artifacts)
+            response.headers[PROFILE_ID_HEADER] = session.profile_id
+        return response
+    return wrapper
+
+
+def require_profiling_admin(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        bearer_token = extract_bearer_token()
+        if not bearer_token:
+            return jsonify({"error": "Bearer token required"}), 401
+        if not is_profiling_admin(bearer_token):
+            return jsonify({"error": "Profiling artifacts are restricted to admins"}), 403
+        return view(*args, **kwargs)
+    return wrapper
 
 
 @app.route('/health')
@@ -44,93 +84,79 @@ def health_check():
     return jsonify({'status': 'healthy'}), 200
 
 
-@app.route('/api/orchards/<orchard_id>/missing-trees', methods=['GET'])
-def missing_trees(orchard_id: str):
-    app.logger.info(f"Missing tree endpoint invoked for orchard: {orchard_id}")
-    
-    bearer_token = extract_bearer_token()
-    if not bearer_token:
-        return jsonify({"error": "Bearer token required"}), 401
-
-    app.logger.info("Setting up AeroboticsAPIClient and invoking API...")
-    client = AeroboticsAPIClient(bearer_token)
-    
+@app.route('/api/profiles', methods=['GET'])
+@require_profiling_admin
+def profile_artifacts():
+    return jsonify({"artifacts": list_artifacts()}), 200
+
+
+@app.route('/api/profiles/<path:filename>', methods=['GET'])
+@require_profiling_admin
+def profile_artifact(filename: str):
+    return send_from_directory(PROFILE_ARTIFACT_DIR, filename, as_attachment=True)
+
+
+def orchard_analysis_view(view):
+    """Run (or join) the analysis for the requested orchard and pass it to the view as `analysis`.
+
+    The request handling itself is in src/services/analysis_requests.py, shared with the ASGI app.
+    """
+    @wraps(view)
+    def wrapper(orchard_id: str):
+        started = time.monotonic()
+        request_id = request_id_from_headers(request.headers)
+        with log_context(request_id=request_id, orchard_id=orchard_id):
+            response = make_response(analysis_response(view, orchard_id))
+            log_request_summary(view.__name__, response.status_code, started, g.pop("deadline", None))
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    return wrapper
+
+
+def analysis_response(view, orchard_id: str):
+    """The body of orchard_analysis_view: validate the request, then run (or join) the analysis."""
+    app.logger.info("%s endpoint invoked for orchard: %s", view.__name__, orchard_id)
     try:
-        survey = client.get_survey(orchard_id)
-        valid, error_msg = validate_survey_response(survey)
-        if not valid:
-            return jsonify({
-                "error": f"The upstream data source did not return required fields: {error_msg}"
-            }), 500
-
-        survey_id = survey["results"][0]["id"]
-
-        tree_survey = client.get_tree_survey(survey_id)
-        valid, error_msg = validate_tree_survey_response(tree_survey)
-        if not valid:
-            return jsonify({
-                "error": f"The upstream data source did not return required fields: {error_msg}"
-            }), 500
-
-        tree_data = [
-            {
-                "lat": tree["lat"],
-                "lng": tree["lng"],
-                "area": tree["area"],
-            }
-            for tree in tree_survey["results"]
-        ]
-
-        app.logger.info("Kicking off spatial calculations...")
-        app.logger.info("...Creating outer polygon")
-        outer_polygon = build_outer_polygon_from_survey(survey)
-        
-        app.logger.info("...Creating inner boundary")
-        inner_boundary_geographic = inner_boundary_visualisation(outer_polygon)
-        
-        app.logger.info("...Creating tree polygons")
-        tree_polygons = create_tree_polygons(tree_data)
-        
-        app.logger.info("...Finding missing trees")
-        results = find_missing_tree_positions(tree_data, outer_polygon)
-
-        app.logger.info("Creating orchard map...")
-        # {RL 28/06/2025} Purely for developer to help debug with visualization
-        folium_map = create_orchard_map(
-            tree_polygons=tree_polygons,
-            outer_polygon=outer_polygon,
-            inner_boundary=inner_boundary_geographic,
-            missing_points=results["missing_coords"],
-        )
-        
-        output_dir = os.path.join(os.getcwd(), 'temp')
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, f"tree_gaps_map_{orchard_id}.html")
-        folium_map.save(output_path)
-
-        app.logger.info("Analysing results...")
-        result_to_analysis = convert_result_to_analysis(results)
-        orchard_results_dict = orchard_result_to_dict(result_to_analysis)
-
-        app.logger.info("Returning 200 OK")
-        return jsonify(orchard_results_dict), 200
-
-    except ApiError as e:
-        return jsonify({
-            "error": {
-                "message": e.message, 
-                "status": e.status
-            }
-        }), e.status
-    
+        analysis_request = parse_analysis_request(orchard_id, request.headers, request.args)
+        client = AeroboticsAPIClient(analysis_request.bearer_token)
+        with request_deadline(analysis_request.deadline_seconds) as deadline:
+            g.deadline = deadline
+            analysis = analyses.get(client, analysis_request)
+            return view(orchard_id, analysis)
+
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        return jsonify({
-            "error": {
-                "message": "Internal server error",
-                "status": 500
-            }
-        }), 500
+        body, status, headers = analysis_error_response(e, orchard_id)
+        return jsonify(body), status, headers
+
+
+def export_response(payload: bytes, mimetype: str):
+    return make_response(*export_response_parts(payload, mimetype, request.headers))
+
+
+@app.route('/api/orchards/<orchard_id>/missing-trees', methods=['GET'])
+@profiled_request
+@orchard_analysis_view
+def missing_trees(orchard_id: str, analysis: dict):
+    app.logger.info("Returning 200 OK")
+    return jsonify(missing_trees_body(analysis)), 200
+
+
+@app.route('/api/orchards/<orchard_id>/missing-trees/geojson', methods=['GET'])
+@profiled_request
+@orchard_analysis_view
+def missing_trees_geojson(orchard_id: str, analysis: dict):
+    with profile_stage("export_geojson"):
+        payload = to_geojson(analysis_to_arrays(analysis))
+    return export_response(payload, "application/geo+json")
+
+
+@app.route('/api/orchards/<orchard_id>/missing-trees/columnar', methods=['GET'])
+@profiled_request
+@orchard_analysis_view
+def missing_trees_columnar(orchard_id: str, analysis: dict):
+    with profile_stage("export_columnar"):
+        payload = to_columnar(analysis_to_arrays(analysis))
+    return export_response(payload, COLUMNAR_MIMETYPE)
 
 
 @app.errorhandler(404)
@@ -147,4 +173,4 @@ def method_not_allowed(error):
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
-print("App setup complete", file=sys.stdout, flush=True)
\ No newline at end of file
+logger.info("App setup complete")
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""ASGI serving mode: the same analysis endpoints as src/app.py on an event loop.
+
+Upstream calls go through a shared httpx.AsyncClient and analyses run in a process pool, so one worker keeps many
+orchards in flight. Run it with `uvicorn src.asgi:app`, or under gunicorn with `-k uvicorn.workers.UvicornWorker`.
+The WSGI app in src/app.py is unchanged and remains the default.
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from src.clients.aerobotics_api_client import AsyncAeroboticsAPIClient
+from src.config.settings import ASGI_ANALYSIS_PROCESSES
+from src.services.analysis_requests import (
+    AnalysisLookup,
+    export_response_parts,
+    log_request_summary,
+    missing_trees_body,
+    parse_analysis_request,
+    request_id_from_headers,
+)
+from src.services.errors import analysis_error_response
+from src.utils.deadline import request_deadline
+from src.utils.export import COLUMNAR_MIMETYPE, analysis_to_arrays, to_columnar, to_geojson
+from src.utils.single_flight import AsyncSingleFlight
+from src.utils.structured_logging import REQUEST_ID_HEADER, configure_logging, log_context
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+analyses = AnalysisLookup(AsyncSingleFlight())
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    # Spawned rather than forked, as the event loop and the HTTP client's connections must not be copied. Each
+    # analysis process logs through its own queue and writer.
+    app.state.executor = ProcessPoolExecutor(
+        max_workers=ASGI_ANALYSIS_PROCESSES,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=configure_logging,
+    )
+    app.state.http_client = httpx.AsyncClient()
+    try:
+        yield
+    finally:
+        await app.state.http_client.aclose()
+        app.state.executor.shutdown(cancel_futures=True)
+
+
+def orchard_analysis_view(view):
+    """Run (or join) the analysis for the requested orchard and pass it to the view as `analysis`.
+
+    The request handling itself is in src/services/analysis_requests.py, shared with the WSGI app.
+    """
+    @functools.wraps(view)
+    async def wrapper(request: Request):
+        started = time.monotonic()
+        orchard_id = request.path_params["orchard_id"]
+        request_id = request_id_from_headers(request.headers)
+        with log_context(request_id=request_id, orchard_id=orchard_id):
+            response = await analysis_response(view, request, orchard_id)
+            log_request_summary(
+                view.__name__, response.status_code, started, getattr(request.state, "deadline", None)
+            )
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    return wrapper
+
+
+async def analysis_response(view, request: Request, orchard_id: str) -> Response:
+    """The body of orchard_analysis_view: validate the request, then run (or join) the analysis."""
+    logger.info("%s endpoint invoked for orchard: %s", view.__name__, orchard_id)
+    try:
+        analysis_request = parse_analysis_request(orchard_id, request.headers, request.query_params)
+        client = AsyncAeroboticsAPIClient(analysis_request.bearer_token, request.app.state.http_client)
+        with request_deadline(analysis_request.deadline_seconds) as deadline:
+            request.state.deadline = deadline
+            analysis = await analyses.get_async(client, analysis_request, request.app.state.executor)
+            return await view(request, orchard_id, analysis)
+
+    except Exception as e:
+        body, status, headers = analysis_error_response(e, orchard_id)
+        return JSONResponse(body, status, headers)
+
+
+def export_response(request: Request, payload: bytes, media_type: str) -> Response:
+    body, status, headers = export_response_parts(payload, media_type, request.headers)
+    return Response(body, status, headers)
+
+
+async def health_check(request: Request):
+    return JSONResponse({"status": "healthy"})
+
+
+@orchard_analysis_view
+async def missing_trees(request: Request, orchard_id: str, analysis: dict):
+    return JSONResponse(missing_trees_body(analysis))
+
+
+@orchard_analysis_view
+async def missing_trees_geojson(request: Request, orchard_id: str, analysis: dict):
+    payload = await asyncio.to_thread(lambda: to_geojson(analysis_to_arrays(analysis)))
+    return export_response(request, payload, "application/geo+json")
+
+
+@orchard_analysis_view
+async def missing_trees_columnar(request: Request, orchard_id: str, analysis: dict):
+    payload = await asyncio.to_thread(lambda: to_columnar(analysis_to_arrays(analysis)))
+    return export_response(request, payload, COLUMNAR_MIMETYPE)
+
+
+async def not_found(request: Request, exc: Exception):
+    return JSONResponse({"error": "Endpoint not found"}, 404)
+
+
+async def method_not_allowed(request: Request, exc: Exception):
+    return JSONResponse({"error": "Method not allowed"}, 405)
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health_check),
+        Route("/api/orchards/{orchard_id}/missing-trees", missing_trees),
+        Route("/api/orchards/{orchard_id}/missing-trees/geojson", missing_trees_geojson),
+        Route("/api/orchards/{orchard_id}/missing-trees/columnar", missing_trees_columnar),
+    ],
+    exception_handlers={404: not_found, 405: method_not_allowed},
+    lifespan=lifespan,
+)
@@ -1,35 +1,59 @@
+import logging
+
+import httpx
 import requests
+from src.config.settings import AEROBOTICS_BASE_URL
 from src.utils.api_error import ApiError
+from src.utils.deadline import DeadlineExceeded, check_deadline, current_deadline, remaining_seconds
 from src.utils.time_utils import start_time_in_ms, log_elapsed_time_in_ms
 
+logger = logging.getLogger(__name__)
+
+
+def parse_response(response) -> dict:
+    """The JSON body of a `requests` or `httpx` response, raising ApiError for anything but a 200."""
+    try:
+        body = response.json()
+    except Exception:
+        body = {"message": "Invalid JSON response"}
+
+    if response.status_code != 200:
+        error_message = body.get("detail") or body.get("message") or f"API returned {response.status_code}"
+        raise ApiError(status=response.status_code, message=error_message, body=body)
+
+    return body
+
+
+def request_headers(bearer_token: str) -> dict:
+    return {
+        "Accept": "application/json",
+        "Authorization": f"Bearer {bearer_token}",
+        "Content-Type": "application/json",
+    }
+
 
 class AeroboticsAPIClient:
-    def __init__(self, bearer_token: str):
-        self.base_url = "https://api.aerobotics.com"
-        self.headers = {
-            "Accept": "application/json",
-            "Authorization": f"Bearer {bearer_token}",
-            "Content-Type": "application/json",
-        }
+    def __init__(self, bearer_token: str, base_url: str = AEROBOTICS_BASE_URL):
+        self.base_url = base_url.rstrip("/")
+        self.headers = request_headers(bearer_token)
 
     def _request(self, endpoint: str, description: str) -> dict:
         start = start_time_in_ms()
         url = f"{self.base_url}/{endpoint}"
-        print(f"** GET : {url}")
+        logger.info("** GET : %s", url)
         
         try:
-            response = requests.get(url, headers=self.headers)
-            
+            # Upstream calls only get whatever is left of the request's deadline
+            check_deadline(description)
             try:
-                body = response.json()
-            except Exception:
-                body = {"message": "Invalid JSON response"}
-
-            if response.status_code != 200:
-                error_message = body.get("detail") or body.get("message") or f"API returned {response.status_code}"
-                raise ApiError(status=response.status_code, message=error_message, body=body)
-
-            return body
+                response = requests.get(url, headers=self.headers, timeout=remaining_seconds())
+            except requests.Timeout:
+                deadline = current_deadline()
+                if deadline is None:
+                    raise
+                raise DeadlineExceeded(description, deadline.diagnostics())
+            
+            return parse_response(response)
         finally:
             log_elapsed_time_in_ms(start, description)
 
@@ -37,4 +61,38 @@ class AeroboticsAPIClient:
         return self._request(f"farming/surveys?orchard_id={orchard_id}", f"Get survey {orchard_id}")
 
     def get_tree_survey(self, survey_id: str) -> dict:
-        return self._request(f"farming/surveys/{survey_id}/tree_surveys/", f"Get tree survey {survey_id}")
\ No newline at end of file
+        return self._request(f"farming/surveys/{survey_id}/tree_surveys/", f"Get tree survey {survey_id}")
+
+
+class AsyncAeroboticsAPIClient:
+    """The same calls as AeroboticsAPIClient for the ASGI app, over a shared `httpx.AsyncClient`."""
+
+    def __init__(self, bearer_token: str, http_client: httpx.AsyncClient, base_url: str = AEROBOTICS_BASE_URL):
+        self.base_url = base_url.rstrip("/")
+        self.headers = request_headers(bearer_token)
+        self.http_client = http_client
+
+    async def _request(self, endpoint: str, description: str) -> dict:
+        start = start_time_in_ms()
+        url = f"{self.base_url}/{endpoint}"
+        logger.info("** GET : %s", url)
+
+        try:
+            check_deadline(description)
+            try:
+                response = await self.http_client.get(url, headers=self.headers, timeout=remaining_seconds())
+            except httpx.TimeoutException:
+                deadline = current_deadline()
+                if deadline is None:
+                    raise
+                raise DeadlineExceeded(description, deadline.diagnostics())
+
+            return parse_response(response)
+        finally:
+            log_elapsed_time_in_ms(start, description)
+
+    async def get_survey(self, orchard_id: str) -> dict:
+        return await self._request(f"farming/surveys?orchard_id={orchard_id}", f"Get survey {orchard_id}")
+
+    async def get_tree_survey(self, survey_id: str) -> dict:
+        return await self._request(f"farming/surveys/{survey_id}/tree_surveys/", f"Get tree survey {survey_id}")
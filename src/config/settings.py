@@ -1,14 +1,102 @@
+import os
+
+# Cost model for admission control, fitted on synthetic orchards of 100 to 20,000 trees (analysis on one core)
+ADMISSION_MS_PER_GRID_POINT = 0.002
+ADMISSION_MS_PER_TREE = 0.45
 BOTTOM_BUFFER_MULTIPLIER = 3.5
 DEFAULT_GEOGRAPHIC_CRS = "EPSG:4326"
 DEFAULT_PROJECTED_CRS = 32734  # South Africa / Cape Town UTM Zone 34S
+DEFAULT_SEARCH_RESOLUTION = "fine"
+EXPORT_GZIP_LEVEL = 6
 GRID_SPACING_MULTIPLIER = 0.75
 HIGH_CONFIDENCE_DISTANCE_THRESHOLD = 4.5
 LEFT_BUFFER_MULTIPLIER = 3
+MAP_COORDINATE_DECIMALS = 7  # ~1 cm
+MAP_RENDER_MODES = ("per_crown", "collection", "circles")
+MAP_SIMPLIFY_TOLERANCE_DEGREES = 2e-6  # ~20 cm, small next to a crown but drops most buffer vertices
+MAP_SMOOTH_FACTOR = 2.0
 MAX_DISTANCE_MULTIPLIER = 2.5
 MAX_NEARBY_TREES = 4
+# Smallest chunk the pipeline works in, even when the memory budget is too small for it
+MIN_CHUNK_SIZE = 256
 MIN_DISTANCE_MULTIPLIER = 0.8
 NEARBY_SEARCH_MULTIPLIER = 1.5
 NORMAL_BUFFER_MULTIPLIER = 2
 OVERLAP_THRESHOLD_METRES = 7.2
+# The coarse-to-fine "multires" search was retired, as with the grid index it was no faster than "fine" without
+# missing gaps
+SEARCH_RESOLUTIONS = ("fine",)
+SPATIAL_INDEX_CELL_MULTIPLIER = 1.0
 TREE_RADIUS_MULTIPLIER = 0.4
 TREE_SPACING = 4.0
+
+# Profiling is opt-in: either for every request via PROFILE_REQUESTS=1, or per request by sending
+# the X-Profile-Request header with a bearer token listed in PROFILE_ADMIN_TOKENS (comma separated).
+PROFILE_ADMIN_TOKENS = [
+    token.strip() for token in os.environ.get("PROFILE_ADMIN_TOKENS", "").split(",") if token.strip()
+]
+PROFILE_ARTIFACT_DIR = os.environ.get("PROFILE_ARTIFACT_DIR", os.path.join(os.getcwd(), "temp", "profiles"))
+PROFILE_MAX_ARTIFACTS = int(os.environ.get("PROFILE_MAX_ARTIFACTS", "20"))
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "").lower() in ("1", "true", "yes")
+
+# Concurrent identical analyses share one computation. Results are handed to waiting workers through files in
+# SINGLE_FLIGHT_DIR, and a result is only handed out for SINGLE_FLIGHT_RESULT_TTL_SECONDS after it was computed.
+SINGLE_FLIGHT_DIR = os.environ.get("SINGLE_FLIGHT_DIR", os.path.join(os.getcwd(), "temp", "single_flight"))
+SINGLE_FLIGHT_RESULT_TTL_SECONDS = float(os.environ.get("SINGLE_FLIGHT_RESULT_TTL_SECONDS", "30"))
+
+# How the debugging map draws tree crowns: "per_crown" (one layer per crown), "collection" (one simplified
+# GeoJSON layer) or "circles" (canvas circles sized by crown area, which skips building the crown polygons).
+MAP_RENDER_MODE = os.environ.get("MAP_RENDER_MODE", "collection")
+if MAP_RENDER_MODE not in MAP_RENDER_MODES:
+    # Checked here so a typo stops the app at startup rather than failing every map render
+    raise ValueError(f"MAP_RENDER_MODE must be one of {MAP_RENDER_MODES}, not '{MAP_RENDER_MODE}'")
+
+# Every analysis request has a time budget: REQUEST_DEADLINE_SECONDS, unless the client sends a shorter or longer one
+# in the X-Request-Timeout-Ms header, which is capped at MAX_REQUEST_DEADLINE_SECONDS.
+MAX_REQUEST_DEADLINE_SECONDS = float(os.environ.get("MAX_REQUEST_DEADLINE_SECONDS", "120"))
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "30"))
+
+# Analyses estimated to take longer than ADMISSION_FAST_LANE_MAX_MS share ADMISSION_HEAVY_LANE_CONCURRENCY slots per
+# worker. They wait up to ADMISSION_HEAVY_LANE_WAIT_SECONDS for a slot before being rejected with a Retry-After hint.
+ADMISSION_FAST_LANE_MAX_MS = float(os.environ.get("ADMISSION_FAST_LANE_MAX_MS", "2000"))
+ADMISSION_HEAVY_LANE_CONCURRENCY = int(os.environ.get("ADMISSION_HEAVY_LANE_CONCURRENCY", "1"))
+ADMISSION_HEAVY_LANE_WAIT_SECONDS = float(os.environ.get("ADMISSION_HEAVY_LANE_WAIT_SECONDS", "5"))
+
+# Processes the ASGI app (src/asgi.py) runs analyses in. Defaults to one per CPU.
+ASGI_ANALYSIS_PROCESSES = int(os.environ.get("ASGI_ANALYSIS_PROCESSES", "0")) or os.cpu_count()
+
+# Analyses precomputed by the prefetcher (src/services/prefetch.py), which the apps serve before computing anything.
+# The prefetcher polls PREFETCH_ORCHARD_IDS (comma separated) for new surveys every PREFETCH_INTERVAL_SECONDS with
+# PREFETCH_BEARER_TOKEN, and analyses them at PREFETCH_NICENESS so it yields the CPU to user requests. Each worker
+# can also keep the RECENT_ANALYSES_MAX_ENTRIES analyses it used last in memory. That is off by default, as a 20,000
+# tree analysis holds about 6 MB and every gunicorn worker would end up holding its own copy of every orchard.
+ANALYSIS_CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", os.path.join(os.getcwd(), "temp", "analysis_cache"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "200"))
+RECENT_ANALYSES_MAX_ENTRIES = int(os.environ.get("RECENT_ANALYSES_MAX_ENTRIES", "0"))
+PREFETCH_BEARER_TOKEN = os.environ.get("PREFETCH_BEARER_TOKEN", "")
+PREFETCH_INTERVAL_SECONDS = float(os.environ.get("PREFETCH_INTERVAL_SECONDS", "300"))
+PREFETCH_NICENESS = int(os.environ.get("PREFETCH_NICENESS", "10"))
+PREFETCH_ORCHARD_IDS = [
+    orchard_id.strip() for orchard_id in os.environ.get("PREFETCH_ORCHARD_IDS", "").split(",") if orchard_id.strip()
+]
+
+# Dispatcher mode (src/dispatcher.py) routes each orchard to one of DISPATCHER_WORKERS long-lived analysis workers
+# (defaults to one per CPU), each a single process with DISPATCHER_WORKER_THREADS threads listening on a unix socket
+# in DISPATCHER_SOCKET_DIR. Each orchard is held by one worker only, so unless RECENT_ANALYSES_MAX_ENTRIES is set the
+# workers keep their DISPATCHER_RECENT_ANALYSES_MAX_ENTRIES most recent analyses in memory.
+DISPATCHER_RECENT_ANALYSES_MAX_ENTRIES = int(os.environ.get("DISPATCHER_RECENT_ANALYSES_MAX_ENTRIES", "32"))
+DISPATCHER_SOCKET_DIR = os.environ.get("DISPATCHER_SOCKET_DIR", os.path.join(os.getcwd(), "temp", "dispatcher"))
+DISPATCHER_WORKER_THREADS = int(os.environ.get("DISPATCHER_WORKER_THREADS", "4"))
+DISPATCHER_WORKERS = int(os.environ.get("DISPATCHER_WORKERS", "0")) or os.cpu_count()
+
+# Logs are written as JSON lines by a background thread. Up to LOG_QUEUE_SIZE records wait for it; beyond that
+# records are dropped (and counted) rather than slowing requests down.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+# Each analysis sizes the chunks it works in to stay within its memory budget of working memory. This is the budget
+# of every analysis the app and the prefetcher start; analyse_orchard's callers can pass their own
+ANALYSIS_MEMORY_BUDGET_MB = int(os.environ.get("ANALYSIS_MEMORY_BUDGET_MB", "64"))
+
+# The Aerobotics API to call, which the load test points at a local stand-in (benchmarks/aerobotics_stub.py)
+AEROBOTICS_BASE_URL = os.environ.get("AEROBOTICS_BASE_URL", "https://api.aerobotics.com")
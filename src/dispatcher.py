@@ -0,0 +1,128 @@
+"""Dispatcher mode: one front process that routes each orchard to the same long-lived analysis worker.
+
+With gunicorn's own workers, requests for an orchard land on any worker, so every worker warms up (and holds) its own
+copy of every orchard's state. Here orchards are hashed onto a fixed set of DISPATCHER_WORKERS workers (see
+src/services/analysis_workers.py), so each orchard's state stays hot in one process. When a worker goes down its
+orchards move to the others, and they move back once it has restarted.
+
+    PYTHONPATH=. uvicorn src.dispatcher:app --port 5000
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from src.config.settings import DISPATCHER_WORKERS
+from src.services.analysis_workers import AnalysisWorkerPool
+from src.utils.structured_logging import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+WORKER_HEADER = "X-Analysis-Worker"
+HEALTH_CHECK_INTERVAL_SECONDS = 1.0
+STARTUP_TIMEOUT_SECONDS = 60
+
+# Connection headers are between the client and the dispatcher, and the body is re-framed by the server
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "host", "upgrade"}
+
+
+async def supervise(pool: AnalysisWorkerPool):
+    while True:
+        try:
+            await pool.check()
+        except Exception as e:
+            logger.exception("Dispatcher: worker check failed: %s", e)
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    pool = app.state.pool = AnalysisWorkerPool(DISPATCHER_WORKERS)
+    pool.start()
+    supervisor = asyncio.create_task(supervise(pool))
+    try:
+        # Serve once every worker has started, so orchards are spread over all of them from the first request
+        async with asyncio.timeout(STARTUP_TIMEOUT_SECONDS):
+            while len(pool.ring.members) < len(pool.workers):
+                await asyncio.sleep(0.1)
+        yield
+    finally:
+        supervisor.cancel()
+        await pool.stop()
+
+
+def forwarded_headers(headers) -> dict:
+    return {name: value for name, value in headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+
+
+async def dispatch(request: Request):
+    pool = request.app.state.pool
+    # Orchard requests go to the orchard's worker; anything else (profiles, unknown paths) is routed by path
+    key = request.path_params.get("orchard_id", request.url.path)
+    body = await request.body()
+
+    for _ in range(len(pool.workers)):
+        worker = pool.worker_for(key)
+        if worker is None:
+            break
+        try:
+            upstream = await worker.client.send(
+                worker.client.build_request(
+                    request.method,
+                    request.url.path,
+                    params=request.query_params,
+                    headers=forwarded_headers(request.headers),
+                    content=body,
+                ),
+                stream=True,
+            )
+            try:
+                # Passed through as is, compressed or not
+                content = b"".join([chunk async for chunk in upstream.aiter_raw()])
+            finally:
+                await upstream.aclose()
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            # The worker went away; the next healthiest owner of the orchard takes over until it is back
+            logger.warning("Dispatcher: %s unreachable (%s), rerouting %s", worker.name, e, key)
+            pool.mark_down(worker)
+            continue
+        except httpx.TimeoutException as e:
+            # A slow analysis, not a dead worker: running it again on another worker would only double the work
+            logger.warning("Dispatcher: %s timed out (%r) on %s", worker.name, e, key)
+            return JSONResponse({"error": "The analysis worker timed out"}, 504)
+        except httpx.TransportError as e:
+            # The worker took the request and dropped it, so it may have died part way through the analysis.
+            # It is out of the ring until it answers its health check again, but the request is not run twice.
+            logger.warning("Dispatcher: %s failed (%r) on %s", worker.name, e, key)
+            pool.mark_down(worker)
+            return JSONResponse({"error": "The analysis worker failed"}, 502)
+
+        headers = forwarded_headers(upstream.headers)
+        headers[WORKER_HEADER] = worker.name
+        return Response(content, upstream.status_code, headers)
+
+    return JSONResponse({"error": "No analysis workers available"}, 503, {"Retry-After": "1"})
+
+
+async def health_check(request: Request):
+    workers = request.app.state.pool.status()
+    healthy = any(worker["healthy"] for worker in workers.values())
+    return JSONResponse({"status": "healthy" if healthy else "unhealthy", "workers": workers}, 200 if healthy else 503)
+
+
+METHODS = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+
+app = Starlette(
+    routes=[
+        Route("/health", health_check),
+        Route("/api/orchards/{orchard_id}/{rest:path}", dispatch, methods=METHODS),
+        Route("/{path:path}", dispatch, methods=METHODS),
+    ],
+    lifespan=lifespan,
+)
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from typing import Dict, List, Optional
 
+import numpy as np
+
 
 @dataclass
 class TreePosition:
@@ -16,3 +18,39 @@ class OrchardAnalysisResult:
     missing_trees: List[TreePosition]
     summary: Dict[str, int]
 
+
+@dataclass
+class CandidatePositions:
+    """Candidate missing tree positions (in projected metres), one array per field rather than a dict per position."""
+    x: np.ndarray
+    y: np.ndarray
+    distance_to_nearest: np.ndarray
+    nearby_tree_count: np.ndarray
+
+    # x, y and distance_to_nearest as float64, nearby_tree_count as int32
+    BYTES_PER_POSITION = 3 * 8 + 4
+
+    @classmethod
+    def empty(cls) -> "CandidatePositions":
+        return cls(np.empty(0), np.empty(0), np.empty(0), np.empty(0, dtype=np.int32))
+
+    @classmethod
+    def from_points(cls, points: np.ndarray, distance_to_nearest: np.ndarray, nearby_tree_count: np.ndarray):
+        return cls(points[:, 0], points[:, 1], distance_to_nearest, nearby_tree_count.astype(np.int32))
+
+    @classmethod
+    def concatenate(cls, chunks: List["CandidatePositions"]) -> "CandidatePositions":
+        if not chunks:
+            return cls.empty()
+        return cls(*(np.concatenate([getattr(chunk, name) for chunk in chunks]) for name in cls.__dataclass_fields__))
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def __getitem__(self, selection) -> "CandidatePositions":
+        return CandidatePositions(
+            self.x[selection], self.y[selection], self.distance_to_nearest[selection], self.nearby_tree_count[selection]
+        )
+
+    def points(self) -> np.ndarray:
+        return np.column_stack([self.x, self.y])
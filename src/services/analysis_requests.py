@@ -0,0 +1,193 @@
+"""Analysis request handling shared by the WSGI app (src/app.py) and the ASGI app (src/asgi.py).
+
+Everything here works on plain header and query parameter mappings and returns plain values, so each app only
+adapts its framework's request and response objects: reading the request, running (or joining) the analysis
+under the request's deadline, and turning the result or the error into a response.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Optional
+
+from src.config.settings import (
+    ANALYSIS_MEMORY_BUDGET_MB,
+    DEFAULT_SEARCH_RESOLUTION,
+    EXPORT_GZIP_LEVEL,
+    SEARCH_RESOLUTIONS,
+)
+from src.services.orchard_analysis import analyse_orchard, analyse_orchard_async
+from src.utils.analysis_cache import AnalysisCache, RecentAnalyses, analysis_key
+from src.utils.api_error import InvalidRequestError, UpstreamDataError
+from src.utils.deadline import Deadline, deadline_from_headers
+from src.utils.helpers import convert_result_to_analysis, orchard_result_to_dict
+from src.utils.profiling import profile_stage
+from src.utils.structured_logging import REQUEST_ID_HEADER
+from src.validation.aerobotics import validate_survey_response
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnalysisRequest:
+    orchard_id: str
+    bearer_token: str
+    resolution: str
+    deadline_seconds: float
+
+
+def bearer_token_from_headers(headers) -> Optional[str]:
+    auth_header = headers.get("Authorization", "")
+    if not auth_header.startswith("Bearer "):
+        return None
+    return auth_header.replace("Bearer ", "")
+
+
+def request_id_from_headers(headers) -> str:
+    return headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+
+
+def parse_analysis_request(orchard_id: str, headers, query_params) -> AnalysisRequest:
+    bearer_token = bearer_token_from_headers(headers)
+    if not bearer_token:
+        raise InvalidRequestError(401, "Bearer token required")
+
+    resolution = query_params.get("resolution", DEFAULT_SEARCH_RESOLUTION)
+    if resolution not in SEARCH_RESOLUTIONS:
+        raise InvalidRequestError(400, f"'resolution' must be one of: {', '.join(SEARCH_RESOLUTIONS)}")
+
+    try:
+        deadline_seconds = deadline_from_headers(headers)
+    except ValueError as e:
+        raise InvalidRequestError(400, str(e))
+
+    return AnalysisRequest(orchard_id, bearer_token, resolution, deadline_seconds)
+
+
+def log_request_summary(view_name: str, status: int, started: float, deadline: Optional[Deadline]):
+    """The one record logged when an analysis request finishes, with its status and the stages it reached."""
+    elapsed_ms = (time.monotonic() - started) * 1000
+    logger.info(
+        "%s finished with %d in %.0fms",
+        view_name,
+        status,
+        elapsed_ms,
+        extra={"status": status, "elapsed_ms": round(elapsed_ms, 1), "stages": deadline.stages if deadline else []},
+    )
+
+
+class AnalysisLookup:
+    """Where a request's analysis comes from, in order: this worker's recent analyses, the analyses the
+    prefetcher stored, an identical analysis already in flight (in this worker or another), or a new one.
+
+    The survey fetch comes first, as it is the access check for the request's bearer token. The WSGI app calls
+    `get` with a SingleFlight, the ASGI app `get_async` with an AsyncSingleFlight. New analyses work within
+    `memory_budget_mb`, which only changes how they are chunked, not their results.
+    """
+
+    def __init__(
+        self,
+        flights,
+        cache: AnalysisCache = None,
+        recent: RecentAnalyses = None,
+        memory_budget_mb: int = ANALYSIS_MEMORY_BUDGET_MB,
+    ):
+        self.flights = flights
+        self.cache = cache or AnalysisCache()
+        # An empty RecentAnalyses is falsy
+        self.recent = recent if recent is not None else RecentAnalyses()
+        self.memory_budget_mb = memory_budget_mb
+
+    def get(self, client, analysis_request: AnalysisRequest) -> dict:
+        orchard_id, resolution = analysis_request.orchard_id, analysis_request.resolution
+        with profile_stage("fetch_survey"):
+            survey = client.get_survey(orchard_id)
+        key = self._key(analysis_request, survey)
+
+        analysis = self.recent.get(key)
+        if analysis is None:
+            analysis = self._prefetched(key)
+        if analysis is None:
+            analysis = self.flights.do(
+                key, lambda: analyse_orchard(client, orchard_id, survey, resolution, self.memory_budget_mb)
+            )
+        self.recent.put(key, analysis)
+        return analysis
+
+    async def get_async(self, client, analysis_request: AnalysisRequest, executor: Executor) -> dict:
+        """As `get`. The tree survey fetch starts as soon as the survey id is known, and the analysis runs in
+        `executor`."""
+        orchard_id, resolution = analysis_request.orchard_id, analysis_request.resolution
+        with profile_stage("fetch_survey"):
+            survey = await client.get_survey(orchard_id)
+        key = self._key(analysis_request, survey)
+
+        analysis = self.recent.get(key)
+        if analysis is None:
+            analysis = await asyncio.to_thread(self._prefetched, key)
+        if analysis is None:
+            survey_id = survey["results"][0]["id"]
+            analysis = await self.flights.do(
+                key,
+                lambda: analyse_orchard_async(
+                    orchard_id, survey, client.get_tree_survey(survey_id), executor, resolution, self.memory_budget_mb
+                ),
+            )
+        self.recent.put(key, analysis)
+        return analysis
+
+    def _key(self, analysis_request: AnalysisRequest, survey: dict) -> str:
+        valid, error_msg = validate_survey_response(survey)
+        if not valid:
+            raise UpstreamDataError(error_msg)
+        return analysis_key(analysis_request.orchard_id, survey["results"][0]["id"], analysis_request.resolution)
+
+    def _prefetched(self, key: str) -> Optional[dict]:
+        analysis = self.cache.get(key)
+        if analysis is not None:
+            logger.info("Serving prefetched analysis for %s", key)
+        return analysis
+
+
+def missing_trees_body(analysis: dict) -> dict:
+    return orchard_result_to_dict(convert_result_to_analysis(analysis["results"]))
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """If-None-Match matching, which compares entity tags weakly."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.partition(";")
+        if name.strip().lower() != "gzip":
+            continue
+        quality = parameters.strip().removeprefix("q=")
+        try:
+            return not quality or float(quality) > 0
+        except ValueError:
+            return True
+    return False
+
+
+def export_response_parts(payload: bytes, media_type: str, headers) -> tuple[bytes, int, dict]:
+    """The body, status and headers of an export: tagged with a weak ETag, 304 Not Modified when the client's
+    If-None-Match matches it, and gzip compressed for clients that accept it."""
+    etag = f'W/"{hashlib.sha256(payload).hexdigest()}"'
+    response_headers = {"Vary": "Accept-Encoding", "ETag": etag}
+    if etag_matches(etag, headers.get("If-None-Match")):
+        return b"", 304, response_headers
+
+    response_headers["Content-Type"] = media_type
+    if accepts_gzip(headers.get("Accept-Encoding", "")):
+        payload = gzip.compress(payload, compresslevel=EXPORT_GZIP_LEVEL)
+        response_headers["Content-Encoding"] = "gzip"
+    return payload, 200, response_headers
@@ -0,0 +1,143 @@
+"""Long-lived analysis workers for dispatcher mode (src/dispatcher.py).
+
+Each worker is the WSGI app in src/app.py under gunicorn with a single process, listening on its own unix socket.
+Workers are named by slot (worker-0, worker-1, ...) and keep their name across restarts, so the orchards a worker
+owned move to the others while it is down and come back to it once it is healthy again.
+"""
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+from typing import Optional
+
+import httpx
+
+from src.config.settings import (
+    DISPATCHER_RECENT_ANALYSES_MAX_ENTRIES,
+    DISPATCHER_SOCKET_DIR,
+    DISPATCHER_WORKER_THREADS,
+)
+from src.utils.affinity import RendezvousHash
+
+logger = logging.getLogger(__name__)
+
+# Workers enforce each request's deadline themselves, so the dispatcher only guards against a worker that hangs
+WORKER_REQUEST_TIMEOUT_SECONDS = 300
+WORKER_HEALTH_TIMEOUT_SECONDS = 2
+
+
+class AnalysisWorker:
+    def __init__(self, name: str, socket_path: str, threads: int, env: dict):
+        self.name = name
+        self.socket_path = socket_path
+        self.threads = threads
+        self.env = env
+        self.process = None
+        self.restarts = 0
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=socket_path),
+            base_url="http://analysis-worker",
+            timeout=WORKER_REQUEST_TIMEOUT_SECONDS,
+        )
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        command = [
+            sys.executable, "-m", "gunicorn",
+            "--workers", "1",
+            "--threads", str(self.threads),
+            "--bind", f"unix:{self.socket_path}",
+            "--timeout", str(WORKER_REQUEST_TIMEOUT_SECONDS),
+            "src.app:app",
+        ]
+        self.process = subprocess.Popen(command, env=self.env)
+        logger.info("Dispatcher: started %s (pid %d)", self.name, self.process.pid)
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    async def is_healthy(self) -> bool:
+        try:
+            response = await self.client.get("/health", timeout=WORKER_HEALTH_TIMEOUT_SECONDS)
+            return response.status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    def stop(self):
+        if self.is_running():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class AnalysisWorkerPool:
+    """A fixed set of analysis workers, with orchards assigned to the healthy ones by rendezvous hashing."""
+
+    def __init__(
+        self,
+        count: int,
+        threads: int = DISPATCHER_WORKER_THREADS,
+        socket_dir: str = DISPATCHER_SOCKET_DIR,
+        env: Optional[dict] = None,
+    ):
+        os.makedirs(socket_dir, exist_ok=True)
+        env = dict(os.environ if env is None else env)
+        # Off by default elsewhere, but here each orchard's analyses are only ever held by the worker that owns it
+        env.setdefault("RECENT_ANALYSES_MAX_ENTRIES", str(DISPATCHER_RECENT_ANALYSES_MAX_ENTRIES))
+        self.workers = {
+            f"worker-{slot}": AnalysisWorker(
+                f"worker-{slot}", os.path.join(socket_dir, f"worker-{slot}.sock"), threads, env
+            )
+            for slot in range(count)
+        }
+        # Only healthy workers are in the ring; a worker joins it once it answers its health check
+        self.ring = RendezvousHash()
+
+    def start(self):
+        for worker in self.workers.values():
+            worker.start()
+
+    def worker_for(self, key: str) -> Optional[AnalysisWorker]:
+        name = self.ring.owner(key)
+        return None if name is None else self.workers[name]
+
+    def mark_down(self, worker: AnalysisWorker):
+        """Take a worker out of the ring, moving its orchards to the others until it is healthy again."""
+        if worker.name in self.ring.members:
+            self.ring.remove(worker.name)
+            logger.warning("Dispatcher: %s is down, its orchards move to the other workers", worker.name)
+
+    async def check(self):
+        """Restart workers that exited and return healthy ones to the ring."""
+        for worker in self.workers.values():
+            if not worker.is_running():
+                self.mark_down(worker)
+                logger.warning(
+                    "Dispatcher: %s exited with %s, restarting", worker.name, worker.process.returncode
+                )
+                worker.restarts += 1
+                worker.start()
+            elif worker.name not in self.ring.members and await worker.is_healthy():
+                self.ring.add(worker.name)
+                logger.info("Dispatcher: %s is healthy, it owns its orchards again", worker.name)
+
+    def status(self) -> dict:
+        return {
+            name: {
+                "healthy": name in self.ring.members,
+                "pid": worker.process.pid if worker.process else None,
+                "restarts": worker.restarts,
+            }
+            for name, worker in self.workers.items()
+        }
+
+    async def stop(self):
+        # Idle keep-alive connections would hold up the workers' graceful shutdown, so they are closed first
+        for worker in self.workers.values():
+            await worker.client.aclose()
+        # Each stop waits up to 30 s for its worker to exit, so the workers stop in threads, side by side
+        await asyncio.gather(*(asyncio.to_thread(worker.stop) for worker in self.workers.values()))
@@ -0,0 +1,30 @@
+import logging
+
+from src.utils.admission import AdmissionRejected
+from src.utils.api_error import ApiError, InvalidRequestError, UpstreamDataError
+from src.utils.deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+
+def analysis_error_response(e: Exception, orchard_id: str) -> tuple[dict, int, dict]:
+    """The JSON body, status and headers returned when an analysis fails, shared by the WSGI and ASGI apps."""
+    if isinstance(e, InvalidRequestError):
+        return {"error": e.message}, e.status, {}
+
+    if isinstance(e, UpstreamDataError):
+        return {"error": f"The upstream data source did not return required fields: {e}"}, 500, {}
+
+    if isinstance(e, AdmissionRejected):
+        body = {"error": {"message": e.message, "status": e.status, "retry_after": e.retry_after}}
+        return body, e.status, {"Retry-After": str(e.retry_after)}
+
+    if isinstance(e, DeadlineExceeded):
+        logger.warning("Deadline exceeded for orchard %s: %s", orchard_id, e.body)
+        return {"error": {"message": e.message, "status": e.status, "diagnostics": e.body}}, e.status, {}
+
+    if isinstance(e, ApiError):
+        return {"error": {"message": e.message, "status": e.status}}, e.status, {}
+
+    logger.error("Unexpected error: %s", e, exc_info=e)
+    return {"error": {"message": "Internal server error", "status": 500}}, 500, {}
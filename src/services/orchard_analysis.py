@@ -0,0 +1,194 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import Executor
+from typing import Awaitable, Optional
+
+from src.clients.aerobotics_api_client import AeroboticsAPIClient
+from src.config.settings import ANALYSIS_MEMORY_BUDGET_MB, DEFAULT_SEARCH_RESOLUTION
+from src.utils.admission import AdmissionController, estimate_analysis_cost
+from src.utils.api_error import UpstreamDataError
+from src.utils.deadline import DeadlineExceeded, current_deadline, remaining_seconds, request_deadline
+from src.utils.profiling import memory_report, profile_stage
+from src.utils.spatial import (
+    build_outer_polygon_from_survey,
+    create_tree_polygons,
+    find_missing_tree_positions,
+    inner_boundary_visualisation,
+)
+from src.utils.structured_logging import current_log_context, in_log_context
+from src.utils.visualisation import create_orchard_map, draws_tree_polygons
+from src.validation.aerobotics import validate_tree_survey_response
+
+logger = logging.getLogger(__name__)
+
+admission_controller = AdmissionController()
+
+
+def analyse_orchard(
+    client: AeroboticsAPIClient,
+    orchard_id: str,
+    survey: dict,
+    resolution: str = DEFAULT_SEARCH_RESOLUTION,
+    memory_budget_mb: int = ANALYSIS_MEMORY_BUDGET_MB,
+) -> dict:
+    survey_id = survey["results"][0]["id"]
+
+    with profile_stage("fetch_tree_survey"):
+        tree_survey = client.get_tree_survey(survey_id)
+    valid, error_msg = validate_tree_survey_response(tree_survey)
+    if not valid:
+        raise UpstreamDataError(error_msg)
+
+    tree_data = tree_data_from_tree_survey(tree_survey)
+
+    logger.info("Kicking off spatial calculations...")
+    logger.info("...Creating outer polygon")
+    with profile_stage("build_outer_polygon"):
+        outer_polygon = build_outer_polygon_from_survey(survey)
+
+    with profile_stage("admission"):
+        estimate = estimate_analysis_cost(len(tree_data), outer_polygon)
+
+    with admission_controller.admit(estimate, f"orchard {orchard_id} survey {survey_id}"):
+        return analyse_tree_data(
+            orchard_id, survey_id, tree_data, outer_polygon, resolution, memory_budget_mb=memory_budget_mb
+        )
+
+
+async def analyse_orchard_async(
+    orchard_id: str,
+    survey: dict,
+    tree_survey_fetch: Awaitable[dict],
+    executor: Executor,
+    resolution: str = DEFAULT_SEARCH_RESOLUTION,
+    memory_budget_mb: int = ANALYSIS_MEMORY_BUDGET_MB,
+) -> dict:
+    """analyse_orchard for the ASGI app.
+
+    `tree_survey_fetch` is scheduled straight away, so the tree survey downloads while the outer polygon is built.
+    The CPU-bound work runs in `executor` (a process pool), so the event loop keeps serving other orchards meanwhile.
+    """
+    tree_survey_fetch = asyncio.ensure_future(tree_survey_fetch)
+    try:
+        survey_id = survey["results"][0]["id"]
+        outer_polygon = build_outer_polygon_from_survey(survey)
+
+        tree_survey = await tree_survey_fetch
+        valid, error_msg = validate_tree_survey_response(tree_survey)
+        if not valid:
+            raise UpstreamDataError(error_msg)
+
+        tree_data = tree_data_from_tree_survey(tree_survey)
+        estimate = estimate_analysis_cost(len(tree_data), outer_polygon)
+
+        async with admission_controller.admit_async(estimate, f"orchard {orchard_id} survey {survey_id}"):
+            deadline = current_deadline()
+            analyse = functools.partial(
+                in_log_context,
+                current_log_context(),
+                analyse_tree_data,
+                orchard_id,
+                survey_id,
+                tree_data,
+                outer_polygon,
+                resolution,
+                remaining_seconds(),
+                memory_budget_mb,
+            )
+            submitted_at_ms = deadline.elapsed_ms() if deadline else 0.0
+            try:
+                # The analysis only starts its own deadline once a process picks it up, so the wait for a free
+                # process is bounded here (which also drops it from the queue if it has not started)
+                return await asyncio.wait_for(
+                    asyncio.get_running_loop().run_in_executor(executor, analyse), remaining_seconds()
+                )
+            except TimeoutError:
+                raise DeadlineExceeded("analysis_pool_wait", deadline.diagnostics())
+            except DeadlineExceeded as e:
+                if deadline is None:
+                    raise
+                deadline.merge(e.body, submitted_at_ms)
+                raise DeadlineExceeded(e.stage, deadline.diagnostics())
+    finally:
+        tree_survey_fetch.cancel()
+
+
+def tree_data_from_tree_survey(tree_survey: dict) -> list[dict]:
+    return [
+        {
+            "lat": tree["lat"],
+            "lng": tree["lng"],
+            "area": tree["area"],
+        }
+        for tree in tree_survey["results"]
+    ]
+
+
+def analyse_tree_data(
+    orchard_id: str,
+    survey_id: int,
+    tree_data: list[dict],
+    outer_polygon,
+    resolution: str = DEFAULT_SEARCH_RESOLUTION,
+    deadline_seconds: Optional[float] = None,
+    memory_budget_mb: int = ANALYSIS_MEMORY_BUDGET_MB,
+) -> dict:
+    """The CPU-bound part of the analysis.
+
+    Takes and returns only picklable values, so it can run in another process. There, `deadline_seconds` stands in
+    for the caller's request deadline. `memory_budget_mb` sizes the chunks the spatial pipeline works in.
+    """
+    if deadline_seconds is not None:
+        with request_deadline(deadline_seconds):
+            return analyse_tree_data(
+                orchard_id, survey_id, tree_data, outer_polygon, resolution, memory_budget_mb=memory_budget_mb
+            )
+
+    with memory_report() as report:
+        logger.info("...Creating inner boundary")
+        with profile_stage("inner_boundary_visualisation"):
+            inner_boundary_geographic = inner_boundary_visualisation(outer_polygon)
+
+        tree_polygons = []
+        if draws_tree_polygons():
+            logger.info("...Creating tree polygons")
+            with profile_stage("create_tree_polygons"):
+                # The crowns are only drawn on the map, so they are returned in lat/lng (EPSG:4326)
+                tree_polygons = create_tree_polygons(tree_data, epsg=4326)
+
+        logger.info("...Finding missing trees")
+        with profile_stage("find_missing_tree_positions"):
+            results = find_missing_tree_positions(
+                tree_data, outer_polygon, resolution=resolution, memory_budget_mb=memory_budget_mb
+            )
+
+        logger.info("Creating orchard map...")
+        # {RL 28/06/2025} Purely for developer to help debug with visualization
+        with profile_stage("create_orchard_map"):
+            folium_map = create_orchard_map(
+                tree_polygons=tree_polygons,
+                outer_polygon=outer_polygon,
+                inner_boundary=inner_boundary_geographic,
+                missing_points=results["missing_coords"],
+                trees=tree_data,
+            )
+
+            output_dir = os.path.join(os.getcwd(), 'temp')
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, f"tree_gaps_map_{orchard_id}.html")
+            folium_map.save(output_path)
+
+    # Peaks are for the whole process, so they include any other analyses running alongside this one
+    logger.info(
+        "Analysis of orchard %s peaked at %s MB resident", orchard_id, report.peak_rss_mb,
+        extra={"memory_stages": report.stages},
+    )
+
+    return {
+        "survey_id": survey_id,
+        "results": results,
+        "outer_polygon": outer_polygon,
+        "inner_boundary": inner_boundary_geographic,
+    }
@@ -0,0 +1,108 @@
+"""Watch known orchards for new surveys and analyse them before anyone asks.
+
+Runs as its own process, next to the app, sharing ANALYSIS_CACHE_DIR with it:
+
+    PREFETCH_ORCHARD_IDS=216269,216270 PREFETCH_BEARER_TOKEN=... PYTHONPATH=. python -m src.services.prefetch
+"""
+import logging
+import os
+import threading
+from typing import Callable, Iterable
+
+from src.clients.aerobotics_api_client import AeroboticsAPIClient
+from src.config.settings import (
+    ANALYSIS_MEMORY_BUDGET_MB,
+    DEFAULT_SEARCH_RESOLUTION,
+    PREFETCH_BEARER_TOKEN,
+    PREFETCH_INTERVAL_SECONDS,
+    PREFETCH_NICENESS,
+    PREFETCH_ORCHARD_IDS,
+)
+from src.services.orchard_analysis import analyse_orchard
+from src.utils.analysis_cache import AnalysisCache, analysis_key
+from src.utils.single_flight import SingleFlight
+from src.utils.structured_logging import configure_logging
+from src.validation.aerobotics import validate_survey_response
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchScheduler:
+    def __init__(
+        self,
+        orchard_ids: Iterable[str],
+        bearer_token: str,
+        cache: AnalysisCache = None,
+        interval_seconds: float = PREFETCH_INTERVAL_SECONDS,
+        resolutions: Iterable[str] = (DEFAULT_SEARCH_RESOLUTION,),
+        client_factory: Callable[[str], AeroboticsAPIClient] = AeroboticsAPIClient,
+        flights: SingleFlight = None,
+        memory_budget_mb: int = ANALYSIS_MEMORY_BUDGET_MB,
+    ):
+        self.orchard_ids = list(orchard_ids)
+        self.client = client_factory(bearer_token)
+        self.cache = cache or AnalysisCache()
+        self.interval_seconds = interval_seconds
+        self.resolutions = list(resolutions)
+        # Shared with the app's workers, so a user request that arrives mid-analysis waits for this one
+        self.flights = flights or SingleFlight()
+        self.memory_budget_mb = memory_budget_mb
+        self._stop = threading.Event()
+
+    def poll_once(self) -> list:
+        """Analyse the latest survey of every orchard that is not cached yet. Returns the keys analysed."""
+        analysed = []
+        for orchard_id in self.orchard_ids:
+            if self._stop.is_set():
+                break
+            try:
+                analysed.extend(self._prefetch_orchard(orchard_id))
+            except Exception as e:
+                # One orchard failing (access revoked, bad upstream data) should not stop the others
+                logger.warning("Prefetch: orchard %s failed: %s", orchard_id, e)
+        return analysed
+
+    def _prefetch_orchard(self, orchard_id: str) -> list:
+        survey = self.client.get_survey(orchard_id)
+        valid, error_msg = validate_survey_response(survey)
+        if not valid:
+            logger.warning("Prefetch: orchard %s survey is invalid: %s", orchard_id, error_msg)
+            return []
+
+        survey_id = survey["results"][0]["id"]
+        analysed = []
+        for resolution in self.resolutions:
+            key = analysis_key(orchard_id, survey_id, resolution)
+            if key in self.cache:
+                continue
+
+            logger.info("Prefetch: new survey %s for orchard %s, analysing at %s", survey_id, orchard_id, resolution)
+            analysis = self.flights.do(
+                key, lambda: analyse_orchard(self.client, orchard_id, survey, resolution, self.memory_budget_mb)
+            )
+            self.cache.put(key, analysis)
+            analysed.append(key)
+        return analysed
+
+    def run_forever(self):
+        logger.info("Prefetch: watching %s orchards every %.0fs", len(self.orchard_ids), self.interval_seconds)
+        while not self._stop.is_set():
+            self.poll_once()
+            self._stop.wait(self.interval_seconds)
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    configure_logging()
+    if not PREFETCH_ORCHARD_IDS or not PREFETCH_BEARER_TOKEN:
+        raise SystemExit("Set PREFETCH_ORCHARD_IDS and PREFETCH_BEARER_TOKEN to prefetch orchards")
+
+    # Analyses here are a head start, never a user waiting, so this process gives way to the app's workers
+    os.nice(PREFETCH_NICENESS)
+    PrefetchScheduler(PREFETCH_ORCHARD_IDS, PREFETCH_BEARER_TOKEN).run_forever()
+
+
+if __name__ == "__main__":
+    main()
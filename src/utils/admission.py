@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import geopandas as gpd
+
+from src.config.settings import (
+    ADMISSION_FAST_LANE_MAX_MS,
+    ADMISSION_HEAVY_LANE_CONCURRENCY,
+    ADMISSION_HEAVY_LANE_WAIT_SECONDS,
+    ADMISSION_MS_PER_GRID_POINT,
+    ADMISSION_MS_PER_TREE,
+    DEFAULT_GEOGRAPHIC_CRS,
+    DEFAULT_PROJECTED_CRS,
+    GRID_SPACING_MULTIPLIER,
+    TREE_SPACING,
+)
+from src.utils.api_error import ApiError
+from src.utils.deadline import remaining_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(ApiError):
+    """The heavy lane stayed full. `retry_after` is a hint in whole seconds for when a slot should be free."""
+
+    def __init__(self, retry_after: int, estimate: "CostEstimate"):
+        super().__init__(
+            status=503,
+            message="The server is busy with other large orchards, please retry later",
+            body={"retry_after": retry_after, "estimated_ms": round(estimate.estimated_ms)},
+        )
+        self.retry_after = retry_after
+
+
+@dataclass
+class CostEstimate:
+    tree_count: int
+    area_m2: float
+    grid_points: int
+    estimated_ms: float
+
+
+def estimate_analysis_cost(tree_count: int, outer_polygon, tree_spacing: float = TREE_SPACING) -> CostEstimate:
+    """Estimate the analysis time from the size of the candidate grid and the number of trees.
+
+    The per tree work (formatting the results, drawing the map) dominates; every grid point inside the orchard is
+    also checked against the trees around it, which is cheap through the grid index.
+    """
+    area_m2 = (
+        gpd.GeoSeries([outer_polygon], crs=DEFAULT_GEOGRAPHIC_CRS)
+        .to_crs(epsg=DEFAULT_PROJECTED_CRS)
+        .area
+        .iloc[0]
+    )
+    grid_points = int(area_m2 / (tree_spacing * GRID_SPACING_MULTIPLIER) ** 2)
+    estimated_ms = grid_points * ADMISSION_MS_PER_GRID_POINT + tree_count * ADMISSION_MS_PER_TREE
+    return CostEstimate(tree_count, float(area_m2), grid_points, estimated_ms)
+
+
+class AdmissionController:
+    """Send cheap analyses straight through and limit how many expensive ones run at once in this worker.
+
+    Analyses estimated above `fast_lane_max_ms` wait up to `heavy_lane_wait_seconds` (or the request's
+    remaining deadline) for one of `heavy_lane_concurrency` slots, and are rejected with a retry hint if
+    none frees up. Analyses admitted with `admit_async` wait on the event loop, for slots of their own.
+    """
+
+    def __init__(
+        self,
+        fast_lane_max_ms: float = ADMISSION_FAST_LANE_MAX_MS,
+        heavy_lane_concurrency: int = ADMISSION_HEAVY_LANE_CONCURRENCY,
+        heavy_lane_wait_seconds: float = ADMISSION_HEAVY_LANE_WAIT_SECONDS,
+    ):
+        self.fast_lane_max_ms = fast_lane_max_ms
+        self.heavy_lane_concurrency = heavy_lane_concurrency
+        self.heavy_lane_wait_seconds = heavy_lane_wait_seconds
+        self._heavy_lane = threading.BoundedSemaphore(heavy_lane_concurrency)
+        # An asyncio semaphore only works on one event loop
+        self._async_heavy_lanes = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # Expected finish time (monotonic) of each analysis in the heavy lane, for the retry hint
+        self._heavy_finishes = {}
+
+    def lane(self, estimate: CostEstimate) -> str:
+        return "fast" if estimate.estimated_ms <= self.fast_lane_max_ms else "heavy"
+
+    @contextmanager
+    def admit(self, estimate: CostEstimate, label: str):
+        lane = self.lane(estimate)
+        heavy_lane_key = self._enter_heavy_lane(estimate, label) if lane == "heavy" else None
+
+        start = time.perf_counter()
+        try:
+            yield lane
+        finally:
+            self._leave(lane, heavy_lane_key, self._heavy_lane, estimate, label, start)
+
+    @asynccontextmanager
+    async def admit_async(self, estimate: CostEstimate, label: str):
+        """As `admit`, waiting for a heavy lane slot on the event loop.
+
+        Waiting holds no thread, so the requests queued for the heavy lane never hold up the threads that fast lane
+        requests need for their own blocking calls.
+        """
+        lane = self.lane(estimate)
+        heavy_lane = self._async_heavy_lane() if lane == "heavy" else None
+        heavy_lane_key = None
+        if lane == "heavy":
+            try:
+                await asyncio.wait_for(heavy_lane.acquire(), self._heavy_lane_wait_seconds())
+            except TimeoutError:
+                raise self._rejected(estimate, label)
+            heavy_lane_key = self._track_heavy_lane(estimate)
+
+        start = time.perf_counter()
+        try:
+            yield lane
+        finally:
+            self._leave(lane, heavy_lane_key, heavy_lane, estimate, label, start)
+
+    def _async_heavy_lane(self) -> asyncio.BoundedSemaphore:
+        loop = asyncio.get_running_loop()
+        heavy_lane = self._async_heavy_lanes.get(loop)
+        if heavy_lane is None:
+            heavy_lane = self._async_heavy_lanes[loop] = asyncio.BoundedSemaphore(self.heavy_lane_concurrency)
+        return heavy_lane
+
+    def _heavy_lane_wait_seconds(self) -> float:
+        wait_seconds = self.heavy_lane_wait_seconds
+        remaining = remaining_seconds()
+        if remaining is not None:
+            wait_seconds = min(wait_seconds, max(remaining, 0.0))
+        return wait_seconds
+
+    def _enter_heavy_lane(self, estimate: CostEstimate, label: str) -> object:
+        if not self._heavy_lane.acquire(timeout=self._heavy_lane_wait_seconds()):
+            raise self._rejected(estimate, label)
+        return self._track_heavy_lane(estimate)
+
+    def _rejected(self, estimate: CostEstimate, label: str) -> AdmissionRejected:
+        retry_after = self.retry_after()
+        logger.warning(
+            "Admission: rejected %s, heavy lane full, estimated_ms=%.0f retry_after=%d",
+            label, estimate.estimated_ms, retry_after,
+        )
+        return AdmissionRejected(retry_after, estimate)
+
+    def _track_heavy_lane(self, estimate: CostEstimate) -> object:
+        heavy_lane_key = object()
+        with self._lock:
+            self._heavy_finishes[heavy_lane_key] = time.monotonic() + estimate.estimated_ms / 1000
+        return heavy_lane_key
+
+    def _leave(self, lane: str, heavy_lane_key: object, heavy_lane, estimate: CostEstimate, label: str, start: float):
+        actual_ms = (time.perf_counter() - start) * 1000
+        if lane == "heavy":
+            with self._lock:
+                del self._heavy_finishes[heavy_lane_key]
+            heavy_lane.release()
+        # Logged together so the cost model can be calibrated against real orchards
+        logger.info(
+            "Admission: %s lane=%s trees=%d area_m2=%.0f grid_points=%d estimated_ms=%.0f actual_ms=%.0f",
+            label, lane, estimate.tree_count, estimate.area_m2, estimate.grid_points, estimate.estimated_ms, actual_ms,
+            extra={"lane": lane, "estimated_ms": round(estimate.estimated_ms), "actual_ms": round(actual_ms)},
+        )
+
+    def retry_after(self) -> int:
+        """Seconds until the first analysis in the heavy lane is expected to finish (at least 1)."""
+        with self._lock:
+            soonest: Optional[float] = min(self._heavy_finishes.values(), default=None)
+        if soonest is None:
+            return 1
+        return max(1, math.ceil(soonest - time.monotonic()))
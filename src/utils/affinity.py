@@ -0,0 +1,39 @@
+import hashlib
+import threading
+from typing import Iterable, Optional
+
+
+def _score(member: str, key: str) -> int:
+    # A stable hash (unlike hash()), so every process and every restart agrees on where a key belongs
+    return int.from_bytes(hashlib.blake2b(f"{member}\0{key}".encode(), digest_size=8).digest(), "big")
+
+
+class RendezvousHash:
+    """Assign keys to members by rendezvous (highest random weight) hashing.
+
+    Each key goes to the member that scores highest for it. Removing a member only moves the keys it owned, spread
+    evenly over the others, and adding it back returns exactly those keys to it.
+    """
+
+    def __init__(self, members: Iterable[str] = ()):
+        self._members = frozenset(members)
+        self._lock = threading.Lock()
+
+    @property
+    def members(self) -> frozenset:
+        return self._members
+
+    def add(self, member: str):
+        with self._lock:
+            self._members = self._members | {member}
+
+    def remove(self, member: str):
+        with self._lock:
+            self._members = self._members - {member}
+
+    def owner(self, key: str) -> Optional[str]:
+        """The member `key` belongs to, or None when there are no members."""
+        members = self._members
+        if not members:
+            return None
+        return max(members, key=lambda member: _score(member, key))
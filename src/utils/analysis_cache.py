@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from src.config.settings import ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MAX_ENTRIES, RECENT_ANALYSES_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+def analysis_key(orchard_id: str, survey_id, resolution: str) -> str:
+    return f"{orchard_id}:{survey_id}:{resolution}"
+
+
+class AnalysisCache:
+    """Analyses stored on disk by orchard, survey and resolution, shared by every worker and the prefetcher.
+
+    A survey never changes once published, so entries do not expire; the least recently written are pruned
+    beyond `max_entries`.
+    """
+
+    def __init__(self, directory: str = ANALYSIS_CACHE_DIR, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{hashlib.sha1(key.encode()).hexdigest()}.pickle")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str):
+        try:
+            with open(self._path(key), "rb") as cache_file:
+                return pickle.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.PickleError, EOFError) as e:
+            logger.warning("Analysis cache: could not read %s: %s", key, e)
+            return None
+
+    def put(self, key: str, analysis: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "wb") as cache_file:
+                pickle.dump(analysis, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, path)
+        except (OSError, pickle.PickleError, TypeError, AttributeError) as e:
+            logger.warning("Analysis cache: could not store %s: %s", key, e)
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return
+        self._prune()
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(".pickle"):
+                    entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                continue
+
+        for _, path in sorted(entries, reverse=True)[self.max_entries:]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+
+class RecentAnalyses:
+    """The analyses this worker used last, kept in memory and dropped least recently used first.
+
+    Each worker has its own, so with requests spread over workers at random every worker ends up holding the same
+    orchards. That is why it is only on by default in dispatcher mode, where each orchard goes to one worker, so it
+    is held once and stays hot there.
+    """
+
+    def __init__(self, max_entries: int = RECENT_ANALYSES_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str):
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is not None:
+                self._entries.move_to_end(key)
+            return analysis
+
+    def put(self, key: str, analysis: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = analysis
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
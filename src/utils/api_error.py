@@ -22,3 +22,11 @@ class ApiError(Exception):
             raise ValueError(
                 f"Cannot deserialize object that is not a {ApiError.__name__}")
         return ApiError(status=data.get("status", 500), message=data.get("message", "Invalid API request"))
+
+
+class UpstreamDataError(Exception):
+    """The upstream data source responded, but without the fields the analysis needs."""
+
+
+class InvalidRequestError(ApiError):
+    """The request itself is invalid (no bearer token, bad parameters), so nothing was fetched or analysed."""
@@ -0,0 +1,103 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from src.config.settings import MAX_REQUEST_DEADLINE_SECONDS, REQUEST_DEADLINE_SECONDS
+from src.utils.api_error import ApiError
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+_active_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(ApiError):
+    """The request ran out of its time budget. `body` holds how far the work got."""
+
+    def __init__(self, stage: str, diagnostics: dict):
+        super().__init__(status=504, message=f"Request deadline exceeded during {stage}", body=diagnostics)
+        self.stage = stage
+
+    def __reduce__(self):
+        # Raised in analysis worker processes too, so it has to survive the trip back to the request
+        return DeadlineExceeded, (self.stage, self.body)
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.budget_seconds = seconds
+        self._start = time.monotonic()
+        self.expires_at = self._start + seconds
+        self.stages = []
+        self.progress = {}
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self._start) * 1000
+
+    def check(self, stage: str, **progress):
+        """Raise DeadlineExceeded if the budget has run out, otherwise record that `stage` was reached."""
+        if progress:
+            self.progress[stage] = progress
+        if not self.stages or self.stages[-1]["stage"] != stage:
+            self.stages.append({"stage": stage, "started_at_ms": round(self.elapsed_ms(), 1)})
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(stage, self.diagnostics())
+
+    def merge(self, diagnostics: dict, offset_ms: float):
+        """Fold in the stages another process reached under this deadline, starting `offset_ms` into it."""
+        for stage in diagnostics["stages_reached"]:
+            self.stages.append(dict(stage, started_at_ms=round(stage["started_at_ms"] + offset_ms, 1)))
+        self.progress.update(diagnostics["progress"])
+
+    def diagnostics(self) -> dict:
+        return {
+            "budget_ms": round(self.budget_seconds * 1000, 1),
+            "elapsed_ms": round(self.elapsed_ms(), 1),
+            "stages_reached": list(self.stages),
+            "progress": dict(self.progress),
+        }
+
+
+def deadline_from_headers(headers) -> float:
+    """Seconds the request may run for, from the X-Request-Timeout-Ms header (capped) or the default."""
+    value = headers.get(DEADLINE_HEADER)
+    if value is None:
+        return REQUEST_DEADLINE_SECONDS
+
+    try:
+        milliseconds = float(value)
+    except ValueError:
+        raise ValueError(f"'{DEADLINE_HEADER}' must be a number of milliseconds")
+    if not milliseconds > 0:
+        raise ValueError(f"'{DEADLINE_HEADER}' must be greater than 0")
+    return min(milliseconds / 1000, MAX_REQUEST_DEADLINE_SECONDS)
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    deadline = Deadline(seconds)
+    token = _active_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _active_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _active_deadline.get()
+
+
+def check_deadline(stage: str, **progress):
+    """Stop the work if the request's deadline has passed. A no-op outside a request deadline."""
+    deadline = _active_deadline.get()
+    if deadline is not None:
+        deadline.check(stage, **progress)
+
+
+def remaining_seconds() -> Optional[float]:
+    """Seconds left before the request's deadline, or None outside a request deadline."""
+    deadline = _active_deadline.get()
+    return None if deadline is None else deadline.remaining()
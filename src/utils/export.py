@@ -0,0 +1,135 @@
+import json
+import struct
+
+import numpy as np
+import shapely
+
+from src.config.settings import MAP_COORDINATE_DECIMALS
+
+COLUMNAR_MAGIC = b"MTC1"
+COLUMNAR_MIMETYPE = "application/vnd.missing-trees.columnar"
+COLUMNAR_VERSION = 1
+CONFIDENCE_LEVELS = ["low", "medium", "high"]
+
+
+def analysis_to_arrays(analysis: dict) -> dict:
+    """Columns for every table in an export, built once from the analysis result."""
+    missing_coords = analysis["results"]["missing_coords"]
+    existing_coords = analysis["results"]["existing_tree_coords"]
+    confidence_codes = {level: code for code, level in enumerate(CONFIDENCE_LEVELS)}
+    # The inner boundary falls back to a plain negative buffer for some orchards, which can split it into several
+    # polygons or leave nothing at all, so it is exported as the outer ring of each of its parts
+    boundary_rings = shapely.get_exterior_ring(shapely.get_parts(analysis["inner_boundary"]))
+    boundary, boundary_part = shapely.get_coordinates(boundary_rings, return_index=True)
+
+    return {
+        "missing_trees": {
+            "lat": np.array([tree["lat"] for tree in missing_coords], dtype=np.float64),
+            "lng": np.array([tree["lng"] for tree in missing_coords], dtype=np.float64),
+            "confidence": np.array([confidence_codes[tree["confidence"]] for tree in missing_coords], dtype=np.uint8),
+            "distance_to_nearest": np.array(
+                [tree["distance_to_nearest"] for tree in missing_coords], dtype=np.float32
+            ),
+            # 0 for trees that were not merged from a cluster, as merged clusters always have 2 or more members
+            "merged_from": np.array([tree.get("merged_from") or 0 for tree in missing_coords], dtype=np.uint16),
+        },
+        "existing_trees": {
+            "lat": np.array([tree["lat"] for tree in existing_coords], dtype=np.float64),
+            "lng": np.array([tree["lng"] for tree in existing_coords], dtype=np.float64),
+        },
+        "inner_boundary": {
+            "lng": boundary[:, 0],
+            "lat": boundary[:, 1],
+            # Which polygon of the boundary each vertex belongs to
+            "part": boundary_part.astype(np.uint16),
+        },
+    }
+
+
+def _point_features(table: dict, kind: str, properties) -> list:
+    coordinates = np.column_stack([table["lng"], table["lat"]]).round(MAP_COORDINATE_DECIMALS).tolist()
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": point},
+            "properties": {"kind": kind, **properties(i)},
+        }
+        for i, point in enumerate(coordinates)
+    ]
+
+
+def to_geojson(arrays: dict) -> bytes:
+    missing = arrays["missing_trees"]
+    confidence = [CONFIDENCE_LEVELS[code] for code in missing["confidence"].tolist()]
+    distance = missing["distance_to_nearest"].astype(np.float64).round(1).tolist()
+    merged_from = missing["merged_from"].tolist()
+
+    boundary = arrays["inner_boundary"]
+    boundary_coordinates = np.column_stack([boundary["lng"], boundary["lat"]]).round(MAP_COORDINATE_DECIMALS)
+    boundary_polygons = [
+        [boundary_coordinates[boundary["part"] == part].tolist()] for part in np.unique(boundary["part"]).tolist()
+    ]
+    if len(boundary_polygons) == 1:
+        boundary_geometry = {"type": "Polygon", "coordinates": boundary_polygons[0]}
+    else:
+        boundary_geometry = {"type": "MultiPolygon", "coordinates": boundary_polygons}
+
+    def missing_tree_properties(i):
+        return {"confidence": confidence[i], "distance_to_nearest": distance[i], "merged_from": merged_from[i] or None}
+
+    features = _point_features(missing, "missing_tree", missing_tree_properties)
+    features.append({
+        "type": "Feature",
+        "geometry": boundary_geometry,
+        "properties": {"kind": "inner_boundary"},
+    })
+    features.extend(_point_features(arrays["existing_trees"], "existing_tree", lambda i: {}))
+
+    return json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")).encode()
+
+
+def to_columnar(arrays: dict) -> bytes:
+    """Pack the tables as little-endian columns behind a JSON header.
+
+    Layout: magic (4 bytes), header length (uint32), JSON header, then each column at the byte offset
+    the header gives, relative to the start of the data section and aligned to 8 bytes.
+    """
+    header = {"version": COLUMNAR_VERSION, "confidence_levels": CONFIDENCE_LEVELS, "tables": {}}
+    buffers, offset = [], 0
+    for table_name, columns in arrays.items():
+        table = header["tables"][table_name] = {"rows": 0, "columns": []}
+        for column_name, values in columns.items():
+            data = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<")).tobytes()
+            table["rows"] = len(values)
+            table["columns"].append({
+                "name": column_name,
+                "dtype": values.dtype.newbyteorder("<").str,
+                "offset": offset,
+                "length": len(data),
+            })
+            padding = -len(data) % 8
+            buffers.append(data + b"\0" * padding)
+            offset += len(data) + padding
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    header_bytes += b" " * (-(len(COLUMNAR_MAGIC) + 4 + len(header_bytes)) % 8)
+    return COLUMNAR_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(buffers)
+
+
+def read_columnar(payload: bytes) -> dict:
+    if payload[:4] != COLUMNAR_MAGIC:
+        raise ValueError("Not a missing trees columnar export")
+
+    (header_length,) = struct.unpack("<I", payload[4:8])
+    header = json.loads(payload[8:8 + header_length])
+    data_start = 8 + header_length
+
+    return {
+        table_name: {
+            column["name"]: np.frombuffer(
+                payload, dtype=np.dtype(column["dtype"]), count=table["rows"], offset=data_start + column["offset"]
+            )
+            for column in table["columns"]
+        }
+        for table_name, table in header["tables"].items()
+    }
@@ -0,0 +1,277 @@
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from src.config.settings import (
+    PROFILE_ADMIN_TOKENS,
+    PROFILE_ARTIFACT_DIR,
+    PROFILE_MAX_ARTIFACTS,
+    PROFILE_REQUESTS,
+)
+from src.utils.deadline import check_deadline
+
+PROFILE_REQUEST_HEADER = "X-Profile-Request"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+_active_session = contextvars.ContextVar("profiling_session", default=None)
+_active_memory_report = contextvars.ContextVar("memory_report", default=None)
+
+# cProfile and tracemalloc are process wide, so only one request is profiled at a time.
+_session_lock = threading.Lock()
+
+
+class ProfilingSession:
+    def __init__(self, label: str):
+        self.label = label
+        self.profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}_{_safe_label(label)}_{uuid.uuid4().hex[:8]}"
+        self.profiler = cProfile.Profile()
+        self.stages = []
+        self._stack = []
+        self._started_tracemalloc = False
+        self._start = 0.0
+        # Stages reset tracemalloc's peak, so the session's peak is kept here as each stage begins
+        self.peak_bytes = 0
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.total_ms = (time.perf_counter() - self._start) * 1000
+        self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    def enter_stage(self, name: str):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak_bytes = max(self.peak_bytes, peak)
+        if self._stack:
+            self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        self._stack.append({"name": name, "start": time.perf_counter(), "start_bytes": current, "peak": current})
+
+    def exit_stage(self):
+        _, peak = tracemalloc.get_traced_memory()
+        frame = self._stack.pop()
+        frame_peak = max(frame["peak"], peak)
+        if self._stack:
+            self._stack[-1]["peak"] = max(self._stack[-1]["peak"], frame_peak)
+
+        self.stages.append({
+            "stage": frame["name"],
+            "depth": len(self._stack),
+            "elapsed_ms": round((time.perf_counter() - frame["start"]) * 1000, 2),
+            "peak_bytes": frame_peak,
+            "peak_increase_bytes": frame_peak - frame["start_bytes"],
+        })
+
+    def summary(self) -> dict:
+        stats_output = io.StringIO()
+        pstats.Stats(self.profiler, stream=stats_output).sort_stats("cumulative").print_stats(25)
+        return {
+            "profile_id": self.profile_id,
+            "label": self.label,
+            "total_ms": round(self.total_ms, 2),
+            "peak_bytes": self.peak_bytes,
+            "stages": self.stages,
+            "top_functions": stats_output.getvalue(),
+        }
+
+    def write_artifacts(
+        self, directory: str = PROFILE_ARTIFACT_DIR, max_artifacts: int = PROFILE_MAX_ARTIFACTS
+    ) -> list:
+        os.makedirs(directory, exist_ok=True)
+        profile_path = os.path.join(directory, f"{self.profile_id}.prof")
+        summary_path = os.path.join(directory, f"{self.profile_id}.json")
+
+        self.profiler.dump_stats(profile_path)
+        with open(summary_path, "w") as summary_file:
+            json.dump(self.summary(), summary_file, indent=2)
+
+        prune_artifacts(directory, max_artifacts)
+        return [os.path.basename(profile_path), os.path.basename(summary_path)]
+
+
+def _resident_memory_kb() -> Optional[tuple[int, int]]:
+    """(current, peak) resident memory of this process in kB, or None where the kernel does not report it."""
+    try:
+        with open("/proc/self/status") as status_file:
+            fields = dict(line.split(":", 1) for line in status_file if line.startswith(("VmRSS", "VmHWM")))
+        return int(fields["VmRSS"].split()[0]), int(fields["VmHWM"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _reset_peak_resident_memory() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class MemoryReport:
+    """Resident memory (RSS) of the process by pipeline stage, from the kernel's counters (Linux only).
+
+    Each stage records the RSS when it ended and the peak RSS while it ran. The peak is reset as each stage starts,
+    and where it cannot be reset, only the RSS at the start and end of the stage count towards it. The counters are
+    for the whole process, so when other analyses run alongside in the same process their memory is included.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self._stack = []
+        self.available = _resident_memory_kb() is not None
+        self.resets_peak = self.available and _reset_peak_resident_memory()
+
+    @property
+    def peak_rss_mb(self) -> Optional[float]:
+        return max((stage["peak_rss_mb"] for stage in self.stages), default=None)
+
+    def _observed_peak_kb(self, current: int, peak: int) -> int:
+        return peak if self.resets_peak else current
+
+    def enter_stage(self, name: str):
+        if not self.available:
+            return
+        current, peak = _resident_memory_kb()
+        if self._stack:
+            self._stack[-1]["peak"] = max(self._stack[-1]["peak"], self._observed_peak_kb(current, peak))
+        if self.resets_peak:
+            _reset_peak_resident_memory()
+        self._stack.append({"name": name, "peak": current})
+
+    def exit_stage(self):
+        if not self.available:
+            return
+        current, peak = _resident_memory_kb()
+        frame = self._stack.pop()
+        frame_peak = max(frame["peak"], self._observed_peak_kb(current, peak))
+        if self._stack:
+            self._stack[-1]["peak"] = max(self._stack[-1]["peak"], frame_peak)
+
+        self.stages.append({
+            "stage": frame["name"],
+            "depth": len(self._stack),
+            "rss_mb": round(current / 1024, 1),
+            "peak_rss_mb": round(frame_peak / 1024, 1),
+        })
+
+
+def _safe_label(label: str) -> str:
+    return re.sub(r"[^A-Za-z0-9-]+", "-", label).strip("-")[:40] or "request"
+
+
+def is_profiling_admin(bearer_token: Optional[str], admin_tokens: list = PROFILE_ADMIN_TOKENS) -> bool:
+    return bool(bearer_token) and bearer_token in admin_tokens
+
+
+def profiling_requested(
+    bearer_token: Optional[str],
+    headers,
+    always_profile: bool = PROFILE_REQUESTS,
+    admin_tokens: list = PROFILE_ADMIN_TOKENS,
+) -> bool:
+    if always_profile:
+        return True
+    return bool(headers.get(PROFILE_REQUEST_HEADER)) and is_profiling_admin(bearer_token, admin_tokens)
+
+
+@contextmanager
+def profiling_session(label: str):
+    """Profile everything in the block. Yields None when another request is already being profiled."""
+    if not _session_lock.acquire(blocking=False):
+        yield None
+        return
+
+    session = ProfilingSession(label)
+    token = _active_session.set(session)
+    session.start()
+    try:
+        yield session
+    finally:
+        session.stop()
+        _active_session.reset(token)
+        _session_lock.release()
+
+
+@contextmanager
+def memory_report():
+    """Record the resident memory of every pipeline stage run in the block."""
+    report = MemoryReport()
+    token = _active_memory_report.set(report)
+    try:
+        yield report
+    finally:
+        _active_memory_report.reset(token)
+
+
+@contextmanager
+def profile_stage(name: str):
+    """Record timing and allocation peak for a pipeline stage, and its resident memory when a memory report is
+    active. A no-op unless a profiling session or memory report is active.
+
+    Entering a stage is also where the request deadline, if there is one, is checked.
+    """
+    check_deadline(name)
+
+    session = _active_session.get()
+    report = _active_memory_report.get()
+    if session is None and report is None:
+        yield
+        return
+
+    if session is not None:
+        session.enter_stage(name)
+    if report is not None:
+        report.enter_stage(name)
+    try:
+        yield
+    finally:
+        if report is not None:
+            report.exit_stage()
+        if session is not None:
+            session.exit_stage()
+
+
+def list_artifacts(directory: str = PROFILE_ARTIFACT_DIR) -> list:
+    if not os.path.isdir(directory):
+        return []
+
+    artifacts = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith((".prof", ".json")):
+            stat = entry.stat()
+            artifacts.append({"name": entry.name, "size_bytes": stat.st_size, "created": stat.st_mtime})
+    return sorted(artifacts, key=lambda artifact: artifact["created"], reverse=True)
+
+
+def prune_artifacts(directory: str = PROFILE_ARTIFACT_DIR, max_artifacts: int = PROFILE_MAX_ARTIFACTS):
+    # Each profiled request writes a .prof and a .json file, so keep both halves of the newest N.
+    profile_ids = []
+    for artifact in list_artifacts(directory):
+        profile_id = os.path.splitext(artifact["name"])[0]
+        if profile_id not in profile_ids:
+            profile_ids.append(profile_id)
+
+    for profile_id in profile_ids[max_artifacts:]:
+        for extension in (".prof", ".json"):
+            path = os.path.join(directory, f"{profile_id}{extension}")
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,179 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import Awaitable, Callable
+
+from src.config.settings import SINGLE_FLIGHT_DIR, SINGLE_FLIGHT_RESULT_TTL_SECONDS
+from src.utils.deadline import check_deadline, remaining_seconds
+
+logger = logging.getLogger(__name__)
+
+# How often a request waiting for another worker's lock checks whether its deadline has passed
+LOCK_POLL_INTERVAL_SECONDS = 0.05
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one computation per key at a time and share its result with everyone waiting on that key.
+
+    Threads in this worker wait on the in-flight call. Other workers wait on a lock file in `directory`
+    and pick up the result the leader leaves next to it, for up to `result_ttl_seconds`. Either way, a request
+    stops waiting when its deadline passes, with DeadlineExceeded.
+    """
+
+    def __init__(
+        self, directory: str = SINGLE_FLIGHT_DIR, result_ttl_seconds: float = SINGLE_FLIGHT_RESULT_TTL_SECONDS
+    ):
+        self.directory = directory
+        self.result_ttl_seconds = result_ttl_seconds
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: str, function: Callable):
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                is_leader = call is None
+                if is_leader:
+                    call = self._calls[key] = _Call()
+
+            if is_leader:
+                return self._lead(key, call, function)
+
+            if not call.done.wait(timeout=remaining_seconds()):
+                # Only times out at the request's deadline
+                check_deadline("single_flight_wait")
+                continue
+            if call.error is None:
+                logger.info("Single flight: shared in-flight result for %s", key)
+                return call.result
+
+            # The leader's failure may be specific to its bearer token, so the followers try again themselves
+            logger.info("Single flight: leader failed for %s, retrying", key)
+
+    def _lead(self, key: str, call: _Call, function: Callable):
+        try:
+            call.result = self._run_across_workers(key, function)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run_across_workers(self, key: str, function: Callable):
+        os.makedirs(self.directory, exist_ok=True)
+        file_stem = os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+        result_path = f"{file_stem}.pickle"
+
+        with open(f"{file_stem}.lock", "w") as lock_file:
+            self._lock_before_deadline(lock_file)
+            try:
+                result = self._read_fresh_result(result_path)
+                if result is not None:
+                    logger.info("Single flight: shared result from another worker for %s", key)
+                    return result[0]
+
+                result = function()
+                self._write_result(result_path, result)
+                self._prune_expired_results()
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lock_before_deadline(self, lock_file):
+        if remaining_seconds() is None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return
+
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                check_deadline("single_flight_wait")
+                time.sleep(max(min(LOCK_POLL_INTERVAL_SECONDS, remaining_seconds()), 0))
+
+    def _read_fresh_result(self, result_path: str):
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.result_ttl_seconds:
+                return None
+            with open(result_path, "rb") as result_file:
+                return (pickle.load(result_file),)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+
+    def _prune_expired_results(self):
+        expired_before = time.time() - self.result_ttl_seconds
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(".pickle") and entry.stat().st_mtime < expired_before:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+    def _write_result(self, result_path: str, result):
+        temporary_path = f"{result_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "wb") as result_file:
+                pickle.dump(result, result_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, result_path)
+        except (OSError, pickle.PickleError, TypeError) as e:
+            logger.warning("Single flight: could not share result across workers: %s", e)
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for the ASGI app: coroutines on this event loop share one task per key.
+
+    The task is shielded, so a client that disconnects, or whose deadline passes, does not cancel the work for
+    everyone else waiting on it.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key: str, function: Callable[[], Awaitable]):
+        while True:
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = asyncio.ensure_future(function())
+                task.add_done_callback(lambda done: self._forget(key, done))
+                return await asyncio.shield(task)
+
+            try:
+                result = await asyncio.wait_for(asyncio.shield(task), remaining_seconds())
+            except TimeoutError:
+                # Only times out at the request's deadline
+                check_deadline("single_flight_wait")
+                continue
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                logger.info("Single flight: leader cancelled for %s, retrying", key)
+                continue
+            except Exception:
+                # As with SingleFlight, the leader's failure may be specific to its bearer token
+                logger.info("Single flight: leader failed for %s, retrying", key)
+                continue
+
+            logger.info("Single flight: shared in-flight result for %s", key)
+            return result
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
@@ -1,28 +1,43 @@
 import pandas as pd
+import logging
 import math
-from shapely.geometry import Polygon, Point
-from shapely.strtree import STRtree
+import shapely
+from shapely.geometry import Polygon
 import geopandas as gpd
 import numpy as np
-from scipy.spatial import cKDTree
+from pyproj import Transformer
+from src.domain.spatial import CandidatePositions
 from src.config.settings import (
+    ANALYSIS_MEMORY_BUDGET_MB,
     BOTTOM_BUFFER_MULTIPLIER,
     DEFAULT_GEOGRAPHIC_CRS,
     DEFAULT_PROJECTED_CRS,
+    DEFAULT_SEARCH_RESOLUTION,
     GRID_SPACING_MULTIPLIER,
     HIGH_CONFIDENCE_DISTANCE_THRESHOLD,
     LEFT_BUFFER_MULTIPLIER,
     MAX_DISTANCE_MULTIPLIER,
     MAX_NEARBY_TREES,
+    MIN_CHUNK_SIZE,
     MIN_DISTANCE_MULTIPLIER,
     NEARBY_SEARCH_MULTIPLIER,
     NORMAL_BUFFER_MULTIPLIER,
     OVERLAP_THRESHOLD_METRES,
+    SEARCH_RESOLUTIONS,
+    SPATIAL_INDEX_CELL_MULTIPLIER,
     TREE_RADIUS_MULTIPLIER,
     TREE_SPACING,
 )
+from src.utils.deadline import check_deadline
+from src.utils.profiling import profile_stage
+from src.utils.spatial_index import UniformGridIndex
 from src.validation.spatial import validate_tree_data
 
+logger = logging.getLogger(__name__)
+
+# Working memory per grid point besides the index queries: the point itself, copies of it and masks over it
+GRID_POINT_BYTES = 64
+
 
 def build_outer_polygon_from_survey(survey: dict) -> Polygon:
     coords_str = survey["results"][0]["polygon"]
@@ -34,13 +49,31 @@ def build_outer_polygon_from_survey(survey: dict) -> Polygon:
     return Polygon(coords)
 
 
+def budgeted_chunk_size(memory_budget_mb, fixed_bytes, bytes_per_point, stage) -> int:
+    """How many points a stage can work on at once without going over the memory budget.
+
+    `fixed_bytes` is what the stage holds throughout (such as the tree index) and `bytes_per_point` the most working
+    memory a point takes while its chunk is processed.
+    """
+    chunk_size = int((memory_budget_mb * 1024 * 1024 - fixed_bytes) // bytes_per_point)
+    if chunk_size < MIN_CHUNK_SIZE:
+        logger.warning(
+            "%s needs more than its %d MB memory budget, working in chunks of %d points",
+            stage, memory_budget_mb, MIN_CHUNK_SIZE,
+        )
+    return max(chunk_size, MIN_CHUNK_SIZE)
+
+
 def cluster_missing_coords(missing_coords):
     if not missing_coords:
         return []
 
     # 🤖 Claude: Use spatial indexing for clustering
     points = np.array([[coord["x"], coord["y"]] for coord in missing_coords])
-    tree = cKDTree(points)
+    query_index, neighbour_index = UniformGridIndex(points, TREE_SPACING * SPATIAL_INDEX_CELL_MULTIPLIER).query_radius(
+        points, OVERLAP_THRESHOLD_METRES
+    )
+    neighbour_starts = np.searchsorted(query_index, np.arange(len(points) + 1))
 
     clustered = []
     used = set()
@@ -50,7 +83,7 @@ def cluster_missing_coords(missing_coords):
             continue
 
         # 🤖 Claude: Find all points within threshold distance
-        indices = tree.query_ball_point([coord1["x"], coord1["y"]], OVERLAP_THRESHOLD_METRES)
+        indices = np.sort(neighbour_index[neighbour_starts[i]:neighbour_starts[i + 1]]).tolist()
         cluster_indices = [idx for idx in indices if idx not in used]
 
         if not cluster_indices:
@@ -108,7 +141,7 @@ def create_custom_buffer(polygon, normal_buffer, bottom_buffer, left_buffer):
     try:
         return Polygon(buffered_coords)
     except Exception:
-        print("Custom buffer failed: Falling back to normal buffer")
+        logger.warning("Custom buffer failed: Falling back to normal buffer")
         return polygon.buffer(-normal_buffer)
 
 
@@ -143,17 +176,14 @@ def create_inner_boundary(outer_polygon, spacing):
 def create_tree_polygons(
     tree_data: list[dict], epsg: int = DEFAULT_PROJECTED_CRS
 ) -> list:
-    print(f"Total input trees: {len(tree_data)}")
+    logger.info("Total input trees: %d", len(tree_data))
     validate_tree_data(tree_data)
 
     tree_data_frame_projected = create_geodataframe_from_tree_data(tree_data)
 
-    def calculate_buffer_radius(area):
-        return math.sqrt(area / math.pi)
-
-    tree_data_frame_projected["geometry"] = tree_data_frame_projected.apply(
-        lambda row: row.geometry.buffer(calculate_buffer_radius(row["area"])), axis=1
-    )
+    # Buffer every crown in one vectorized call, with the radius of a circle of the crown's area
+    buffer_radii = np.sqrt(tree_data_frame_projected["area"].to_numpy() / math.pi)
+    tree_data_frame_projected["geometry"] = tree_data_frame_projected.geometry.buffer(buffer_radii)
 
     tree_geographic = tree_data_frame_projected.to_crs(epsg=epsg)
     return list(tree_geographic["geometry"])
@@ -171,39 +201,33 @@ def extract_existing_tree_coords(existing_trees, epsg_metric):
     return coords
 
 
-def extract_high_confidence_missing_coords(missing_positions, epsg_metric):
-    coords = []
-    for pos in missing_positions:
-        point_wgs = (
-            gpd.GeoSeries([pos["geometry"]], crs=epsg_metric)
-            .to_crs(DEFAULT_GEOGRAPHIC_CRS)
-            .iloc[0]
-        )
-
-        distance = pos["distance_to_nearest"]
-        nearby_count = pos.get("nearby_tree_count", 0)
-
-        if (
-            distance > HIGH_CONFIDENCE_DISTANCE_THRESHOLD
-            and nearby_count < MAX_NEARBY_TREES
-        ):
-            confidence = "high"
-        else:
-            continue
-
-        coords.append(
-            {
-                "confidence": confidence,
-                "distance_to_nearest": round(distance, 1),
-                "lat": point_wgs.y,
-                "lng": point_wgs.x,
-                "nearby_tree_count": nearby_count,
-                "x": pos["x"],
-                "y": pos["y"],
-            }
+def extract_high_confidence_missing_coords(candidates: CandidatePositions, epsg_metric):
+    high_confidence = candidates[
+        (candidates.distance_to_nearest > HIGH_CONFIDENCE_DISTANCE_THRESHOLD)
+        & (candidates.nearby_tree_count < MAX_NEARBY_TREES)
+    ]
+    transformer = Transformer.from_crs(epsg_metric, DEFAULT_GEOGRAPHIC_CRS, always_xy=True)
+    lngs, lats = transformer.transform(high_confidence.x, high_confidence.y)
+
+    return [
+        {
+            "confidence": "high",
+            "distance_to_nearest": round(distance, 1),
+            "lat": lat,
+            "lng": lng,
+            "nearby_tree_count": nearby_count,
+            "x": x,
+            "y": y,
+        }
+        for x, y, distance, nearby_count, lat, lng in zip(
+            high_confidence.x,
+            high_confidence.y,
+            high_confidence.distance_to_nearest,
+            high_confidence.nearby_tree_count.tolist(),
+            np.asarray(lats).tolist(),
+            np.asarray(lngs).tolist(),
         )
-
-    return coords
+    ]
 
 
 def extract_tree_coordinates(existing_trees):
@@ -211,127 +235,115 @@ def extract_tree_coordinates(existing_trees):
 
 
 def filter_positions_within_inner_boundary(
-    potential_positions, inner_boundary, existing_tree_spatial_index, tree_kdtree, existing_coords, spacing
-):
-    filtered_positions = []
+    candidates: CandidatePositions, inner_boundary, tree_index, spacing, memory_budget_mb=ANALYSIS_MEMORY_BUDGET_MB
+) -> CandidatePositions:
     final_check_radius = spacing * TREE_RADIUS_MULTIPLIER * MIN_DISTANCE_MULTIPLIER
 
     # {Rl 28/06/2025} Use a smaller buffer to avoid false positives near tree edges
     overlap_check_radius = spacing * TREE_RADIUS_MULTIPLIER * 0.5
 
-    for pos in potential_positions:
-        if not inner_boundary.contains(pos["geometry"]):
-            continue
-
-        # 🤖 Claude: Use spatial index for faster intersection checks
-        test_buffer = pos["geometry"].buffer(final_check_radius)
-        nearby_trees = list(existing_tree_spatial_index.query(test_buffer))
-
-        if not any(test_buffer.intersects(tree_geom.buffer(overlap_check_radius)) for tree_geom in nearby_trees):
-            filtered_positions.append(pos)
-
-    return filtered_positions
-
+    candidates = candidates[shapely.contains_xy(inner_boundary, candidates.x, candidates.y)]
 
-def find_gaps_in_orchard(existing_trees, outer_polygon, spacing):
-    existing_coords = extract_tree_coordinates(existing_trees)
-    existing_points = np.array(existing_coords)
+    # A candidate's buffer intersects a tree's buffer when the two are closer than the sum of the radii
+    check_radius = final_check_radius + overlap_check_radius
+    chunk_size = budgeted_chunk_size(
+        memory_budget_mb,
+        tree_index.nbytes + len(candidates) * CandidatePositions.BYTES_PER_POSITION,
+        tree_index.query_bytes(check_radius) + GRID_POINT_BYTES,
+        "filter_candidates",
+    )
+    overlapping = np.concatenate([
+        tree_index.count_radius(candidates[start:start + chunk_size].points(), check_radius) > 0
+        for start in range(0, len(candidates), chunk_size)
+    ] or [np.empty(0, dtype=bool)])
+    return candidates[~overlapping]
 
-    print("......Creating tree buffers")
-    tree_geometries = [Point(x, y) for x, y in existing_coords]
-    existing_tree_spatial_index = STRtree(tree_geometries)
-    tree_kdtree = cKDTree(existing_points)
 
-    print("......Generating candidate positions")
-    potential_positions = generate_candidate_positions_optimized(
-        outer_polygon, existing_tree_spatial_index, tree_kdtree, existing_points, spacing
-    )
+def find_gaps_in_orchard(
+    existing_trees,
+    outer_polygon,
+    spacing,
+    resolution=DEFAULT_SEARCH_RESOLUTION,
+    memory_budget_mb=ANALYSIS_MEMORY_BUDGET_MB,
+) -> CandidatePositions:
+    if resolution not in SEARCH_RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {SEARCH_RESOLUTIONS}, not '{resolution}'")
+    existing_points = np.array(extract_tree_coordinates(existing_trees))
+
+    logger.info("......Creating tree index")
+    with profile_stage("build_tree_index"):
+        # One index serves every proximity query on the trees, all of which are within a few tree spacings
+        tree_index = UniformGridIndex(existing_points, spacing * SPATIAL_INDEX_CELL_MULTIPLIER)
+
+    logger.info("......Generating candidate positions")
+    with profile_stage("generate_candidates"):
+        candidates = generate_candidate_positions_optimized(
+            outer_polygon, tree_index, spacing, memory_budget_mb
+        )
 
-    print("......Generating inner boundary")
-    inner_boundary = create_inner_boundary(outer_polygon, spacing)
+    logger.info("......Generating inner boundary")
+    with profile_stage("create_inner_boundary"):
+        inner_boundary = create_inner_boundary(outer_polygon, spacing)
 
-    print("......Filtering positions within inner boundary")
-    return filter_positions_within_inner_boundary(
-        potential_positions, inner_boundary, existing_tree_spatial_index, tree_kdtree, existing_coords, spacing
-    )
+    logger.info("......Filtering positions within inner boundary")
+    with profile_stage("filter_candidates"):
+        return filter_positions_within_inner_boundary(
+            candidates, inner_boundary, tree_index, spacing, memory_budget_mb
+        )
 
 
 def generate_candidate_positions_optimized(
-    outer_polygon, existing_tree_spatial_index, tree_kdtree, existing_points, spacing
-):
+    outer_polygon, tree_index, spacing, memory_budget_mb=ANALYSIS_MEMORY_BUDGET_MB
+) -> CandidatePositions:
     """Optimized version using spatial indexing and vectorized operations"""
     grid_spacing = spacing * GRID_SPACING_MULTIPLIER
-    minx, miny, maxx, maxy = outer_polygon.bounds
-
-    # 🤖 Claude: Create grid points
-    x_coords = np.arange(minx, maxx + grid_spacing, grid_spacing)
-    y_coords = np.arange(miny, maxy + grid_spacing, grid_spacing)
-
-    # 🤖 Claude: Create meshgrid for vectorized operations
-    X, Y = np.meshgrid(x_coords, y_coords)
-    grid_points = np.column_stack([X.ravel(), Y.ravel()])
 
     tree_radius = spacing * TREE_RADIUS_MULTIPLIER
     min_threshold = spacing * MIN_DISTANCE_MULTIPLIER
     max_threshold = spacing * MAX_DISTANCE_MULTIPLIER
     nearby_threshold = spacing * NEARBY_SEARCH_MULTIPLIER
 
-    potential_positions = []
-
-    # 🤖 Claude: Process in chunks to manage memory
-    chunk_size = 10000
-    for i in range(0, len(grid_points), chunk_size):
-        chunk = grid_points[i:i + chunk_size]
-
-        # 🤖 Claude: Vectorized polygon containment check
-        chunk_points = [Point(x, y) for x, y in chunk]
-        contained_mask = np.array([outer_polygon.contains(pt) for pt in chunk_points])
-
-        if not np.any(contained_mask):
-            continue
+    # The nearest tree search can widen to max_threshold, the largest radius queried per grid point
+    chunk_size = budgeted_chunk_size(
+        memory_budget_mb,
+        tree_index.nbytes,
+        tree_index.query_bytes(max_threshold) + GRID_POINT_BYTES,
+        "generate_candidates",
+    )
 
-        valid_chunk = chunk[contained_mask]
-        valid_points = [chunk_points[j] for j, mask in enumerate(contained_mask) if mask]
+    chunks = []
+    candidates_found = 0
 
+    # Only grid points inside the polygon are generated, in chunks sized to the memory budget
+    grid_chunks = rasterize_polygon_grid(outer_polygon, grid_spacing, chunk_size=chunk_size)
+    for chunk_index, valid_chunk in enumerate(grid_chunks):
+        check_deadline("generate_candidates", chunks_processed=chunk_index, candidates_found=candidates_found)
         # 🤖 Claude: Batch query for tree overlaps using spatial index
-        tree_buffers = [pt.buffer(tree_radius) for pt in valid_points]
-        overlap_mask = np.array([
-            len(list(existing_tree_spatial_index.query(buffer))) > 0
-            for buffer in tree_buffers
-        ])
-
-        non_overlapping_mask = ~overlap_mask
+        non_overlapping_mask = tree_index.count_radius(valid_chunk, tree_radius) == 0
         if not np.any(non_overlapping_mask):
             continue
 
         final_chunk = valid_chunk[non_overlapping_mask]
-        final_points = [valid_points[j] for j, mask in enumerate(non_overlapping_mask) if mask]
 
-        # 🤖 Claude: Vectorized distance calculations using KDTree
-        if len(final_chunk) > 0:
-            distances, _ = tree_kdtree.query(final_chunk)
+        # Nothing beyond max_threshold can pass the distance check, so the nearest tree search stops there
+        distances, _ = tree_index.nearest(final_chunk, max_threshold)
 
-            # 🤖 Claude: Apply distance thresholds
-            distance_mask = (distances > min_threshold) & (distances < max_threshold)
-
-            for j, (point, (x, y), distance) in enumerate(zip(final_points, final_chunk, distances)):
-                if not distance_mask[j]:
-                    continue
+        # 🤖 Claude: Apply distance thresholds
+        distance_mask = (distances > min_threshold) & (distances < max_threshold)
+        if not np.any(distance_mask):
+            continue
 
-                # 🤖 Claude: Count nearby trees
-                nearby_indices = tree_kdtree.query_ball_point([x, y], nearby_threshold)
-                nearby_count = len(nearby_indices)
+        # 🤖 Claude: Count nearby trees
+        final_chunk, distances = final_chunk[distance_mask], distances[distance_mask]
+        nearby_counts = tree_index.count_radius(final_chunk, nearby_threshold)
 
-                if nearby_count < MAX_NEARBY_TREES:
-                    potential_positions.append({
-                        "geometry": point,
-                        "x": x,
-                        "y": y,
-                        "distance_to_nearest": distance,
-                        "nearby_tree_count": nearby_count,
-                    })
+        few_nearby = nearby_counts < MAX_NEARBY_TREES
+        chunks.append(
+            CandidatePositions.from_points(final_chunk[few_nearby], distances[few_nearby], nearby_counts[few_nearby])
+        )
+        candidates_found += len(chunks[-1])
 
-    return potential_positions
+    return CandidatePositions.concatenate(chunks)
 
 
 def find_missing_tree_positions(
@@ -339,28 +351,39 @@ def find_missing_tree_positions(
     outer_polygon,
     epsg: int = DEFAULT_PROJECTED_CRS,
     tree_spacing: float = TREE_SPACING,
+    resolution: str = DEFAULT_SEARCH_RESOLUTION,
+    memory_budget_mb: int = ANALYSIS_MEMORY_BUDGET_MB,
 ) -> dict:
-    tree_gdf = create_geodataframe_from_tree_data(tree_data, to_projected_crs=True)
-    outer_polygon_projected = (
-        gpd.GeoSeries([outer_polygon], crs=DEFAULT_GEOGRAPHIC_CRS)
-        .to_crs(epsg=epsg)
-        .iloc[0]
-    )
+    with profile_stage("project_inputs"):
+        tree_gdf = create_geodataframe_from_tree_data(tree_data, to_projected_crs=True)
+        outer_polygon_projected = (
+            gpd.GeoSeries([outer_polygon], crs=DEFAULT_GEOGRAPHIC_CRS)
+            .to_crs(epsg=epsg)
+            .iloc[0]
+        )
 
-    missing_positions = find_gaps_in_orchard(
-        tree_gdf, outer_polygon_projected, tree_spacing
-    )
-    return format_results(tree_gdf, missing_positions, epsg)
+    with profile_stage("find_gaps"):
+        missing_positions = find_gaps_in_orchard(
+            tree_gdf, outer_polygon_projected, tree_spacing, resolution, memory_budget_mb
+        )
+
+    with profile_stage("format_results"):
+        return format_results(tree_gdf, missing_positions, epsg)
 
 
 def format_results(existing_trees, missing_positions, epsg_metric):
-    existing_coords = extract_existing_tree_coords(existing_trees, epsg_metric)
-    missing_coords = extract_high_confidence_missing_coords(
-        missing_positions, epsg_metric
-    )
-    clustered_coords = cluster_missing_coords(missing_coords)
+    with profile_stage("extract_existing_coords"):
+        existing_coords = extract_existing_tree_coords(existing_trees, epsg_metric)
 
-    print(f"Identified {len(clustered_coords)} missing trees")
+    with profile_stage("extract_missing_coords"):
+        missing_coords = extract_high_confidence_missing_coords(
+            missing_positions, epsg_metric
+        )
+
+    with profile_stage("cluster_missing_coords"):
+        clustered_coords = cluster_missing_coords(missing_coords)
+
+    logger.info("Identified %d missing trees", len(clustered_coords))
 
     return {
         "missing_coords": clustered_coords,
@@ -404,4 +427,77 @@ def inner_boundary_visualisation(outer_polygon):
         gpd.GeoSeries([inner_boundary], crs=DEFAULT_PROJECTED_CRS)
         .to_crs(DEFAULT_GEOGRAPHIC_CRS)
         .iloc[0]
-    )
\ No newline at end of file
+    )
+
+
+def polygon_edges(polygon) -> np.ndarray:
+    edges = []
+    for ring in [polygon.exterior, *polygon.interiors]:
+        ring_coords = np.asarray(ring.coords)[:, :2]
+        edges.append(np.hstack([ring_coords[:-1], ring_coords[1:]]))
+    return np.vstack(edges)
+
+
+def rasterize_polygon_grid(polygon, grid_spacing, chunk_size, origin=None):
+    """Yield (n, 2) arrays of the grid points strictly inside the polygon, scanning one grid row at a time"""
+    minx, miny, maxx, maxy = polygon.bounds
+
+    if origin is None:
+        # Same grid origin and spacing as the bounding box meshgrid, so the points are identical
+        x_coords = np.arange(minx, maxx + grid_spacing, grid_spacing)
+        y_coords = np.arange(miny, maxy + grid_spacing, grid_spacing)
+    else:
+        origin_x, origin_y = origin
+        x_coords = origin_x + grid_spacing * np.arange(
+            math.ceil((minx - origin_x) / grid_spacing), math.floor((maxx - origin_x) / grid_spacing) + 1
+        )
+        y_coords = origin_y + grid_spacing * np.arange(
+            math.ceil((miny - origin_y) / grid_spacing), math.floor((maxy - origin_y) / grid_spacing) + 1
+        )
+
+    edges = polygon_edges(polygon)
+    x0, y0, x1, y1 = edges.T
+    vertex_ys = set(y0.tolist())
+    # Crossings are computed in floating point, so points this close to an edge are checked exactly
+    tolerance = grid_spacing * 1e-6
+
+    pending, pending_count = [], 0
+    for y in y_coords:
+        # Half-open rule so a vertex on the scanline is counted by exactly one of its edges
+        crossing = (y0 <= y) != (y1 <= y)
+        if not np.any(crossing):
+            continue
+
+        t = (y - y0[crossing]) / (y1[crossing] - y0[crossing])
+        crossings = np.sort(x0[crossing] + t * (x1[crossing] - x0[crossing]))
+        starts = np.searchsorted(x_coords, crossings[0::2] - tolerance, side="right")
+        ends = np.searchsorted(x_coords, crossings[1::2] + tolerance, side="left")
+
+        row_x = np.concatenate([x_coords[start:end] for start, end in zip(starts, ends)])
+        if not len(row_x):
+            continue
+
+        row = np.column_stack([row_x, np.full(len(row_x), y)])
+        if y in vertex_ys:
+            # Rows through a vertex can run along a horizontal edge, and boundary points are not interior
+            uncertain = np.ones(len(row), dtype=bool)
+        else:
+            nearest = np.searchsorted(crossings, row_x).clip(1, len(crossings) - 1)
+            gap_to_edge = np.minimum(np.abs(row_x - crossings[nearest - 1]), np.abs(row_x - crossings[nearest]))
+            uncertain = gap_to_edge <= tolerance
+        if np.any(uncertain):
+            inside = shapely.contains_xy(polygon, row[uncertain, 0], row[uncertain, 1])
+            keep = np.ones(len(row), dtype=bool)
+            keep[np.flatnonzero(uncertain)[~inside]] = False
+            row = row[keep]
+
+        pending.append(row)
+        pending_count += len(row)
+        while pending_count >= chunk_size:
+            rows = np.vstack(pending)
+            yield rows[:chunk_size]
+            pending = [rows[chunk_size:]]
+            pending_count = len(pending[0])
+
+    if pending_count:
+        yield np.vstack(pending)
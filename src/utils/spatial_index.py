@@ -0,0 +1,139 @@
+import math
+
+import numpy as np
+
+
+class UniformGridIndex:
+    """Points bucketed into square cells, for batch queries over radii of a few cells.
+
+    Every proximity query in the pipeline uses a radius that is a small multiple of the tree spacing, so with cells
+    about a tree spacing wide a query only looks at the few cells around each query point. The buckets are stored as
+    arrays (the point indices sorted by cell, and where each cell starts), so queries are vectorized over a whole
+    batch of query points rather than run one at a time. Only occupied cells are stored, so a stray point far from
+    the rest costs one more cell rather than a table over all the empty space in between.
+
+    Radius queries include points at exactly `radius`, like scipy's query_ball_point.
+    """
+
+    def __init__(self, points: np.ndarray, cell_size: float):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.cell_size = float(cell_size)
+
+        if len(self.points):
+            self.origin = self.points.min(axis=0)
+            extent = self.points.max(axis=0) - self.origin
+        else:
+            self.origin = np.zeros(2)
+            extent = np.zeros(2)
+        self.columns, self.rows = (np.floor(extent / self.cell_size).astype(np.int64) + 1).tolist()
+
+        columns, rows = self._cells(self.points)
+        keys = rows * self.columns + columns
+        self._order = np.argsort(keys, kind="stable")
+        # Points of the i-th occupied cell, self._cell_keys[i], are
+        # self._order[self._cell_starts[i]:self._cell_starts[i + 1]]
+        self._cell_keys, counts = np.unique(keys, return_counts=True)
+        self._cell_starts = np.zeros(len(self._cell_keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._cell_starts[1:])
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @property
+    def nbytes(self) -> int:
+        return self.points.nbytes + self._order.nbytes + self._cell_keys.nbytes + self._cell_starts.nbytes
+
+    def query_bytes(self, radius: float) -> int:
+        """Roughly the most memory a query of `radius` takes per query point.
+
+        About ten int64/float64 arrays hold an entry per visited cell, and about ten more an entry per point found
+        in those cells, of which there are as many as the points' density (over the occupied cells) over the visited
+        cells' area.
+        """
+        span = math.floor(2 * radius / self.cell_size) + 2
+        density = len(self) / (max(len(self._cell_keys), 1) * self.cell_size ** 2)
+        points_visited = density * (2 * radius + self.cell_size) ** 2
+        return int(10 * 8 * (span * span + points_visited)) + 1
+
+    def _cells(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        cells = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        return cells[:, 0], cells[:, 1]
+
+    def _pairs_within(self, points: np.ndarray, radius: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(query index, point index, squared distance) of every point within `radius`, grouped by query index."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+
+        # Only the cells overlapping each query's bounding box are visited
+        first_columns, first_rows = self._cells(points - radius)
+        last_columns, last_rows = self._cells(points + radius)
+        span = math.floor(2 * radius / self.cell_size) + 2
+        offset_columns, offset_rows = (offset.ravel() for offset in np.meshgrid(np.arange(span), np.arange(span)))
+
+        columns = first_columns[:, None] + offset_columns[None, :]
+        rows = first_rows[:, None] + offset_rows[None, :]
+        visited = (
+            (columns <= last_columns[:, None]) & (rows <= last_rows[:, None])
+            & (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+        )
+        keys = np.where(visited, rows * self.columns + columns, -1)
+
+        # Visited cells that hold no points are not in the table, and count as empty
+        cells = np.minimum(np.searchsorted(self._cell_keys, keys), len(self._cell_keys) - 1)
+        occupied = visited & (self._cell_keys[cells] == keys) if len(self._cell_keys) else np.zeros_like(visited)
+        starts = np.where(occupied, self._cell_starts[cells], 0).ravel()
+        counts = np.where(occupied, self._cell_starts[cells + 1], 0).ravel() - starts
+
+        # One entry per (query, point in a visited cell), in query order
+        query_index = np.repeat(np.repeat(np.arange(len(points)), len(offset_columns)), counts)
+        position_in_cell = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        point_index = self._order[np.repeat(starts, counts) + position_in_cell]
+
+        squared_distances = np.sum((points[query_index] - self.points[point_index]) ** 2, axis=1)
+        within = squared_distances <= radius * radius
+        return query_index[within], point_index[within], squared_distances[within]
+
+    def query_radius(self, points: np.ndarray, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """Indices of the points within `radius` of each query point, as (query index, point index) pairs.
+
+        The pairs are grouped by query index, so the neighbours of query i are
+        `point_index[np.searchsorted(query_index, i):np.searchsorted(query_index, i + 1)]`.
+        """
+        query_index, point_index, _ = self._pairs_within(points, radius)
+        return query_index, point_index
+
+    def count_radius(self, points: np.ndarray, radius: float) -> np.ndarray:
+        """Number of points within `radius` of each query point."""
+        query_index, _, _ = self._pairs_within(points, radius)
+        return np.bincount(query_index, minlength=len(np.asarray(points).reshape(-1, 2)))
+
+    def nearest(self, points: np.ndarray, max_distance: float) -> tuple[np.ndarray, np.ndarray]:
+        """Distance to, and index of, the nearest point within `max_distance` of each query point.
+
+        Query points with nothing that close get an infinite distance and the index len(self), as with
+        scipy's cKDTree.query(distance_upper_bound=...).
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        distances = np.full(len(points), np.inf)
+        indices = np.full(len(points), len(self), dtype=np.int64)
+
+        # Most query points have a neighbour within a cell, so search that far first and only widen the search
+        # for the ones that did not. The nearest point within any radius is the nearest point overall.
+        unresolved = np.arange(len(points))
+        radius = min(self.cell_size, max_distance)
+        while len(unresolved):
+            query_index, point_index, squared_distances = self._pairs_within(points[unresolved], radius)
+            if len(query_index):
+                group_starts = np.flatnonzero(np.r_[True, query_index[1:] != query_index[:-1]])
+                group_minima = np.minimum.reduceat(squared_distances, group_starts)
+                group_sizes = np.diff(np.r_[group_starts, len(query_index)])
+                is_minimum = squared_distances == np.repeat(group_minima, group_sizes)
+                _, first_minimum = np.unique(query_index[is_minimum], return_index=True)
+                closest = np.flatnonzero(is_minimum)[first_minimum]
+                found = unresolved[query_index[closest]]
+                distances[found] = np.sqrt(squared_distances[closest])
+                indices[found] = point_index[closest]
+                unresolved = unresolved[np.bincount(query_index, minlength=len(unresolved)) == 0]
+            if radius >= max_distance:
+                break
+            radius = min(radius * 2, max_distance)
+        return distances, indices
@@ -0,0 +1,142 @@
+"""Logging that stays off the request thread.
+
+Records go onto a bounded queue and a background listener formats them as JSON lines on stdout. The request
+thread only captures the record and the request context (request id, orchard id); the %-style message is
+formatted by the listener, so pass arguments rather than f-strings, and do not mutate them after logging.
+When the queue is full, records are dropped and counted rather than blocking the request.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable
+
+from src.config.settings import LOG_LEVEL, LOG_QUEUE_SIZE
+
+REQUEST_ID_HEADER = "X-Request-Id"
+
+_log_context = contextvars.ContextVar("log_context", default={})
+_listener = None
+_configure_lock = threading.Lock()
+
+# Attributes every LogRecord has; anything else on a record came from `extra` and is written as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the request context while still on the thread that logged them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field, value in _log_context.get().items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener is in this process, so the record is passed as is and formatted over there
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return
+
+        if self.dropped:
+            with self._dropped_lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                self._report_dropped(dropped)
+
+    def _report_dropped(self, dropped: int):
+        record = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0, "Dropped %d log records under back-pressure", (dropped,), None
+        )
+        record.dropped = dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += dropped
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field, value in vars(record).items():
+            if field not in _RECORD_ATTRIBUTES:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, queue_size: int = LOG_QUEUE_SIZE, stream=None):
+    """Route every logger in this process through the queue. Safe to call more than once."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        writer = logging.StreamHandler(stream or sys.stdout)
+        writer.setFormatter(JsonFormatter())
+        _listener = QueueListener(log_queue, writer, respect_handler_level=False)
+        _listener.start()
+        atexit.register(stop_logging)
+
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(ContextFilter())
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+
+def stop_logging():
+    """Write out whatever is still queued. Called at exit."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+@contextmanager
+def log_context(**fields):
+    """Add `fields` (e.g. request_id, orchard_id) to every record logged inside the block."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def current_log_context() -> dict:
+    return dict(_log_context.get())
+
+
+def in_log_context(fields: dict, function: Callable, *args):
+    """Call `function` inside `fields`, for work handed to another process along with its request context."""
+    with log_context(**fields):
+        return function(*args)
@@ -2,7 +2,6 @@ import asyncio
 import time
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -21,4 +20,4 @@ def elapsed_time_in_ms(start_time_in_ms: float) -> float:
 
 def log_elapsed_time_in_ms(start_time_in_ms: float, message: str):
     elapsed = elapsed_time_in_ms(start_time_in_ms)
-    logger.info(f"TIMING: {message}: {elapsed:.2f} ms")
+    logger.info("TIMING: %s: %.2f ms", message, elapsed, extra={"elapsed_ms": round(elapsed, 2)})
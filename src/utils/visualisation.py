@@ -1,6 +1,96 @@
 import folium
+import math
+import numpy as np
+import shapely
+from folium.utilities import JsCode
 from typing import List, Dict, Optional
 from shapely.geometry import Polygon
+from src.config.settings import (
+    MAP_COORDINATE_DECIMALS,
+    MAP_RENDER_MODE,
+    MAP_RENDER_MODES,
+    MAP_SIMPLIFY_TOLERANCE_DEGREES,
+    MAP_SMOOTH_FACTOR,
+)
+
+TREE_CROWN_STYLE = {
+    "color": "darkgreen",
+    "weight": 1,
+    "fillColor": "green",
+    "fillOpacity": 0.3,
+}
+
+
+def draws_tree_polygons(render_mode: str = MAP_RENDER_MODE) -> bool:
+    """Whether the map draws the crowns as polygons. In circles mode it only needs each tree's centre and area."""
+    return render_mode != "circles"
+
+
+def add_tree_crowns_per_layer(tree_polygons: List, folium_map: folium.Map):
+    tree_polygon_group = folium.FeatureGroup(name="Tree Crowns")
+    for i, tree_area in enumerate(tree_polygons):
+        folium.GeoJson(
+            tree_area,
+            style_function=lambda x: TREE_CROWN_STYLE,
+            tooltip=f"Tree Crown {i+1}",
+        ).add_to(tree_polygon_group)
+    tree_polygon_group.add_to(folium_map)
+
+
+def add_tree_crown_collection(tree_polygons: List, folium_map: folium.Map):
+    # Simplify every crown in one vectorized pass; Leaflet's smoothFactor simplifies further when zoomed out
+    tree_polygons = np.asarray(tree_polygons)
+    crowns = shapely.simplify(tree_polygons, MAP_SIMPLIFY_TOLERANCE_DEGREES, preserve_topology=False)
+    # Crowns smaller than the tolerance simplify away entirely, so they are drawn as they are. Topology preserving
+    # simplification would keep them, but takes about 2.5 times as long.
+    collapsed = shapely.is_empty(crowns)
+    crowns[collapsed] = tree_polygons[collapsed]
+    # Numbered as in the input, leaving out any crown with no area at all
+    crown_numbers = np.flatnonzero(~shapely.is_empty(crowns)) + 1
+    rings = shapely.get_exterior_ring(crowns[crown_numbers - 1])
+    coordinates = shapely.get_coordinates(rings).round(MAP_COORDINATE_DECIMALS)
+    ring_coordinates = np.split(coordinates, np.cumsum(shapely.get_num_coordinates(rings))[:-1])
+
+    collection = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [ring.tolist()]},
+                "properties": {"crown": int(i)},
+            }
+            for i, ring in zip(crown_numbers, ring_coordinates)
+        ],
+    }
+
+    folium.GeoJson(
+        collection,
+        name="Tree Crowns",
+        style=TREE_CROWN_STYLE,
+        smooth_factor=MAP_SMOOTH_FACTOR,
+        tooltip=folium.GeoJsonTooltip(fields=["crown"], aliases=["Tree Crown"]),
+    ).add_to(folium_map)
+
+
+def add_tree_crown_circles(trees: List[Dict], folium_map: folium.Map):
+    lat = np.array([tree["lat"] for tree in trees]).round(MAP_COORDINATE_DECIMALS).tolist()
+    lng = np.array([tree["lng"] for tree in trees]).round(MAP_COORDINATE_DECIMALS).tolist()
+    radius = np.sqrt(np.array([tree["area"] for tree in trees]) / math.pi).round(1).tolist()
+    collection = {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [x, y]}, "properties": {"r": r}}
+            for x, y, r in zip(lng, lat, radius)
+        ],
+    }
+
+    # Circles are sized in metres, so they shrink with the map when zoomed out
+    folium.GeoJson(
+        collection,
+        name="Tree Crowns",
+        marker=folium.Circle(radius=1, **TREE_CROWN_STYLE),
+        on_each_feature=JsCode("function(feature, layer) { layer.setRadius(feature.properties.r); }"),
+    ).add_to(folium_map)
 
 
 def create_orchard_map(
@@ -8,12 +98,19 @@ def create_orchard_map(
     outer_polygon: Polygon,
     inner_boundary: Polygon,
     missing_points: Optional[List[Dict]] = None,
+    trees: Optional[List[Dict]] = None,
+    render_mode: str = MAP_RENDER_MODE,
 ) -> folium.Map:
+    if render_mode not in MAP_RENDER_MODES:
+        raise ValueError(f"Unknown map render mode '{render_mode}', expected one of {MAP_RENDER_MODES}")
+
     centroid = outer_polygon.centroid
     folium_map = folium.Map(
         location=[centroid.y, centroid.x],
         zoom_start=18,
         tiles="Esri.WorldImagery",
+        # Canvas draws tens of thousands of shapes far faster than one SVG element each
+        prefer_canvas=render_mode != "per_crown",
     )
 
     folium.GeoJson(
@@ -38,20 +135,12 @@ def create_orchard_map(
         },
     ).add_to(folium_map)
 
-    if tree_polygons:
-        tree_polygon_group = folium.FeatureGroup(name="Tree Crowns")
-        for i, tree_area in enumerate(tree_polygons):
-            folium.GeoJson(
-                tree_area,
-                style_function=lambda x: {
-                    "color": "darkgreen",
-                    "weight": 1,
-                    "fillColor": "green",
-                    "fillOpacity": 0.3,
-                },
-                tooltip=f"Tree Crown {i+1}",
-            ).add_to(tree_polygon_group)
-        tree_polygon_group.add_to(folium_map)
+    if render_mode == "circles" and trees:
+        add_tree_crown_circles(trees, folium_map)
+    elif render_mode == "per_crown" and tree_polygons:
+        add_tree_crowns_per_layer(tree_polygons, folium_map)
+    elif tree_polygons:
+        add_tree_crown_collection(tree_polygons, folium_map)
 
     if missing_points:
         missing_group = folium.FeatureGroup(name="Missing Trees")
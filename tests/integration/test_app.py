@@ -0,0 +1,97 @@
+import functools
+import gzip
+import json
+from typing import Mapping, NamedTuple
+from unittest import mock
+
+import pytest
+from starlette.testclient import TestClient
+
+from benchmarks.aerobotics_stub import AeroboticsStub
+from src import app as wsgi
+from src import asgi
+from src.clients.aerobotics_api_client import AeroboticsAPIClient, AsyncAeroboticsAPIClient
+from src.config.settings import SEARCH_RESOLUTIONS
+from src.services.analysis_requests import AnalysisLookup
+from src.utils.export import COLUMNAR_MIMETYPE, read_columnar
+from src.utils.single_flight import AsyncSingleFlight, SingleFlight
+
+# httpx asks for gzip unless told otherwise, Flask's test client doesn't
+HEADERS = {"Authorization": "Bearer token", "Accept-Encoding": "identity"}
+
+
+class RawResponse(NamedTuple):
+    status_code: int
+    headers: Mapping[str, str]
+    body: bytes
+
+
+def wsgi_get(test_client, url, headers) -> RawResponse:
+    response = test_client.get(url, headers=headers)
+    return RawResponse(response.status_code, response.headers, response.data)
+
+
+def asgi_get(test_client, url, headers) -> RawResponse:
+    # httpx decompresses gzip bodies on read, so read the raw bytes as sent
+    with test_client.stream("GET", url, headers=headers) as response:
+        return RawResponse(response.status_code, response.headers, b"".join(response.iter_raw()))
+
+
+@pytest.fixture(params=["wsgi", "asgi"])
+def get(request, tmp_path, monkeypatch):
+    """GET against either app; both go through src/services/analysis_requests.py."""
+    monkeypatch.chdir(tmp_path)
+    with AeroboticsStub(latency_ms=5, trees_per_orchard=100) as stub:
+        if request.param == "wsgi":
+            # Other tests analyse the same orchard against other stubs, so each test gets its own lookup
+            monkeypatch.setattr(wsgi, "analyses", AnalysisLookup(SingleFlight(str(tmp_path))))
+            monkeypatch.setattr(wsgi, "AeroboticsAPIClient", functools.partial(AeroboticsAPIClient, base_url=stub.url))
+            yield functools.partial(wsgi_get, wsgi.app.test_client())
+            return
+
+        monkeypatch.setattr(asgi, "analyses", AnalysisLookup(AsyncSingleFlight()))
+        with mock.patch.object(asgi, "ASGI_ANALYSIS_PROCESSES", 1), \
+                mock.patch.object(asgi, "AsyncAeroboticsAPIClient",
+                                  functools.partial(AsyncAeroboticsAPIClient, base_url=stub.url)):
+            with TestClient(asgi.app) as test_client:
+                yield functools.partial(asgi_get, test_client)
+
+
+def test_geojson_export_is_gzipped_for_clients_that_accept_it(get):
+    response = get("/api/orchards/216269/missing-trees/geojson", dict(HEADERS, **{"Accept-Encoding": "gzip"}))
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/geo+json"
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(response.body))["type"] == "FeatureCollection"
+
+
+def test_export_is_not_modified_for_a_matching_etag(get):
+    url = "/api/orchards/216269/missing-trees/geojson"
+    response = get(url, HEADERS)
+    unchanged = get(url, dict(HEADERS, **{"If-None-Match": response.headers["ETag"]}))
+
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('W/"')
+    assert "Content-Encoding" not in response.headers
+    assert unchanged.status_code == 304
+    assert unchanged.body == b""
+
+
+def test_columnar_export(get):
+    response = get("/api/orchards/216269/missing-trees/columnar", HEADERS)
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == COLUMNAR_MIMETYPE
+    assert set(read_columnar(response.body)) == {"missing_trees", "existing_trees", "inner_boundary"}
+
+
+def test_invalid_requests_get_the_same_error_from_both_apps(get):
+    assert get("/api/orchards/216269/missing-trees", {}).status_code == 401
+    invalid_resolution = get("/api/orchards/216269/missing-trees?resolution=coarse", HEADERS)
+
+    assert invalid_resolution.status_code == 400
+    assert json.loads(invalid_resolution.body) == {
+        "error": f"'resolution' must be one of: {', '.join(SEARCH_RESOLUTIONS)}"
+    }
@@ -0,0 +1,76 @@
+import functools
+from unittest import mock
+
+import pytest
+from starlette.testclient import TestClient
+
+from benchmarks.aerobotics_stub import AeroboticsStub
+from src import app as wsgi
+from src import asgi
+from src.clients.aerobotics_api_client import AeroboticsAPIClient, AsyncAeroboticsAPIClient
+from src.services.analysis_requests import AnalysisLookup
+from src.utils.deadline import DEADLINE_HEADER
+from src.utils.single_flight import SingleFlight
+from src.utils.structured_logging import REQUEST_ID_HEADER
+
+HEADERS = {"Authorization": "Bearer token"}
+
+
+@pytest.fixture(scope="module")
+def stub():
+    with AeroboticsStub(latency_ms=20, trees_per_orchard=200) as stub:
+        yield stub
+
+
+@pytest.fixture(scope="module")
+def asgi_client(stub, tmp_path_factory):
+    with mock.patch.object(asgi, "ASGI_ANALYSIS_PROCESSES", 1), \
+            mock.patch.object(asgi, "AsyncAeroboticsAPIClient",
+                              functools.partial(AsyncAeroboticsAPIClient, base_url=stub.url)):
+        with TestClient(asgi.app) as client:
+            yield client
+
+
+def test_asgi_and_wsgi_apps_return_the_same_analysis(stub, asgi_client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(wsgi, "AeroboticsAPIClient", functools.partial(AeroboticsAPIClient, base_url=stub.url))
+    monkeypatch.setattr(wsgi, "analyses", AnalysisLookup(SingleFlight(str(tmp_path), result_ttl_seconds=0)))
+
+    asgi_response = asgi_client.get("/api/orchards/216269/missing-trees", headers=HEADERS)
+    wsgi_response = wsgi.app.test_client().get("/api/orchards/216269/missing-trees", headers=HEADERS)
+
+    assert asgi_response.status_code == wsgi_response.status_code == 200
+    assert asgi_response.json() == wsgi_response.get_json()
+    assert asgi_response.json()["missing_trees"]
+
+
+def test_asgi_export_is_conditional(asgi_client):
+    url = "/api/orchards/216269/missing-trees/geojson"
+    response = asgi_client.get(url, headers=HEADERS)
+    unchanged = asgi_client.get(url, headers=dict(HEADERS, **{"If-None-Match": response.headers["ETag"]}))
+
+    assert response.status_code == 200
+    assert response.json()["type"] == "FeatureCollection"
+    assert unchanged.status_code == 304
+
+
+def test_asgi_errors_match_the_wsgi_app(asgi_client):
+    assert asgi_client.get("/api/orchards/216269/missing-trees").status_code == 401
+    assert asgi_client.get("/api/orchards/216269/missing-trees?resolution=coarse", headers=HEADERS).status_code == 400
+    assert asgi_client.get("/api/orchards/216269/missing-trees/csv", headers=HEADERS).json() == {
+        "error": "Endpoint not found"
+    }
+
+    timed_out = asgi_client.get("/api/orchards/216270/missing-trees", headers=dict(HEADERS, **{DEADLINE_HEADER: "5"}))
+    assert timed_out.status_code == 504
+    assert timed_out.json()["error"]["diagnostics"]["budget_ms"] == 5.0
+
+
+def test_both_apps_echo_or_assign_a_request_id(asgi_client):
+    for client in (asgi_client, wsgi.app.test_client()):
+        echoed = client.get("/api/orchards/216269/missing-trees", headers={REQUEST_ID_HEADER: "abc123"})
+        assigned = client.get("/api/orchards/216269/missing-trees")
+
+        assert echoed.status_code == assigned.status_code == 401
+        assert echoed.headers[REQUEST_ID_HEADER] == "abc123"
+        assert len(assigned.headers[REQUEST_ID_HEADER]) == 32
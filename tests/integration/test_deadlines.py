@@ -0,0 +1,97 @@
+import asyncio
+import functools
+import threading
+import time
+from unittest import mock
+
+import pytest
+from starlette.testclient import TestClient
+
+from benchmarks.aerobotics_stub import AeroboticsStub
+from src import app as wsgi
+from src import asgi
+from src.clients.aerobotics_api_client import AeroboticsAPIClient, AsyncAeroboticsAPIClient
+from src.services import analysis_requests
+from src.services.analysis_requests import AnalysisLookup
+from src.utils.deadline import DEADLINE_HEADER
+from src.utils.single_flight import AsyncSingleFlight, SingleFlight
+
+HEADERS = {"Authorization": "Bearer token"}
+LEADER_SECONDS = 1.0
+
+
+@pytest.fixture(scope="module")
+def stub():
+    with AeroboticsStub(latency_ms=5, trees_per_orchard=50) as stub:
+        yield stub
+
+
+def json_body(response) -> dict:
+    # Flask's test responses and httpx's differ here
+    return response.get_json() if hasattr(response, "get_json") else response.json()
+
+
+def assert_follower_times_out_while_the_leader_runs(leader_request, follower_request, leader_started):
+    leader_response = []
+    leader = threading.Thread(target=lambda: leader_response.append(leader_request()))
+    leader.start()
+    assert leader_started.wait(10)
+
+    started = time.monotonic()
+    follower_response = follower_request()
+    waited = time.monotonic() - started
+
+    assert follower_response.status_code == 504
+    assert waited < LEADER_SECONDS
+    assert leader.is_alive()
+    stages = [stage["stage"] for stage in json_body(follower_response)["error"]["diagnostics"]["stages_reached"]]
+    assert stages[-1] == "single_flight_wait"
+
+    leader.join(30)
+    assert leader_response[0].status_code == 200
+
+
+def test_wsgi_follower_with_a_short_deadline_stops_waiting_for_a_slow_leader(stub, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(wsgi, "AeroboticsAPIClient", functools.partial(AeroboticsAPIClient, base_url=stub.url))
+    monkeypatch.setattr(wsgi, "analyses", AnalysisLookup(SingleFlight(str(tmp_path))))
+    leader_started = threading.Event()
+    analyse_orchard = analysis_requests.analyse_orchard
+
+    def slow_analysis(*args, **kwargs):
+        leader_started.set()
+        time.sleep(LEADER_SECONDS)
+        return analyse_orchard(*args, **kwargs)
+
+    monkeypatch.setattr(analysis_requests, "analyse_orchard", slow_analysis)
+    url = "/api/orchards/216271/missing-trees"
+
+    assert_follower_times_out_while_the_leader_runs(
+        lambda: wsgi.app.test_client().get(url, headers=HEADERS),
+        lambda: wsgi.app.test_client().get(url, headers=dict(HEADERS, **{DEADLINE_HEADER: "200"})),
+        leader_started,
+    )
+
+
+def test_asgi_follower_with_a_short_deadline_stops_waiting_for_a_slow_leader(stub, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(asgi, "analyses", AnalysisLookup(AsyncSingleFlight()))
+    leader_started = threading.Event()
+    analyse_orchard_async = analysis_requests.analyse_orchard_async
+
+    async def slow_analysis(*args, **kwargs):
+        leader_started.set()
+        await asyncio.sleep(LEADER_SECONDS)
+        return await analyse_orchard_async(*args, **kwargs)
+
+    url = "/api/orchards/216271/missing-trees"
+    with mock.patch.object(asgi, "ASGI_ANALYSIS_PROCESSES", 1), \
+            mock.patch.object(analysis_requests, "analyse_orchard_async", slow_analysis), \
+            mock.patch.object(asgi, "AsyncAeroboticsAPIClient",
+                              functools.partial(AsyncAeroboticsAPIClient, base_url=stub.url)):
+        with TestClient(asgi.app) as client:
+            assert_follower_times_out_while_the_leader_runs(
+                lambda: client.get(url, headers=HEADERS),
+                lambda: client.get(url, headers=dict(HEADERS, **{DEADLINE_HEADER: "200"})),
+                leader_started,
+            )
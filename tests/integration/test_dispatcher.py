@@ -0,0 +1,108 @@
+import functools
+import os
+import signal
+import time
+from unittest import mock
+
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+from benchmarks.aerobotics_stub import AeroboticsStub
+from src import dispatcher
+from src.services.analysis_workers import AnalysisWorkerPool
+
+HEADERS = {"Authorization": "Bearer token"}
+ORCHARD_IDS = [str(216269 + i) for i in range(8)]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    working_directory = tmp_path_factory.mktemp("dispatcher")
+    with AeroboticsStub(latency_ms=5, trees_per_orchard=100) as stub:
+        env = dict(os.environ, AEROBOTICS_BASE_URL=stub.url, PYTHONPATH=REPO_ROOT, LOG_LEVEL="WARNING")
+        pool = functools.partial(AnalysisWorkerPool, socket_dir=str(working_directory / "sockets"), env=env)
+        # The workers run in this directory, so their maps, caches and lock files stay out of the repo
+        original_directory = os.getcwd()
+        os.chdir(working_directory)
+        try:
+            with mock.patch.object(dispatcher, "DISPATCHER_WORKERS", 2), \
+                    mock.patch.object(dispatcher, "AnalysisWorkerPool", pool):
+                with TestClient(dispatcher.app) as client:
+                    yield client
+        finally:
+            os.chdir(original_directory)
+
+
+def owners(client) -> dict:
+    responses = {
+        orchard_id: client.get(f"/api/orchards/{orchard_id}/missing-trees", headers=HEADERS)
+        for orchard_id in ORCHARD_IDS
+    }
+    assert all(response.status_code == 200 for response in responses.values())
+    return {orchard_id: response.headers[dispatcher.WORKER_HEADER] for orchard_id, response in responses.items()}
+
+
+def wait_for(condition, timeout_seconds: float = 60):
+    deadline = time.monotonic() + timeout_seconds
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.1)
+
+
+def test_each_orchard_sticks_to_one_worker(client):
+    first = owners(client)
+
+    assert set(first.values()) == {"worker-0", "worker-1"}
+    assert owners(client) == first
+
+
+def test_responses_pass_through_unchanged(client):
+    response = client.get(
+        f"/api/orchards/{ORCHARD_IDS[0]}/missing-trees/geojson", headers=dict(HEADERS, **{"Accept-Encoding": "gzip"})
+    )
+
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.json()["type"] == "FeatureCollection"
+    assert client.get(f"/api/orchards/{ORCHARD_IDS[0]}/missing-trees").status_code == 401
+
+
+def test_orchards_move_off_a_dead_worker_and_back_once_it_restarts(client):
+    pool = client.app.state.pool
+    before = owners(client)
+    worker = pool.workers["worker-0"]
+
+    worker.process.send_signal(signal.SIGKILL)
+    wait_for(lambda: worker.restarts == 1)
+    assert set(owners(client).values()) == {"worker-1"}
+
+    wait_for(lambda: client.get("/health").json()["workers"]["worker-0"]["healthy"])
+    assert owners(client) == before
+
+
+def test_a_slow_worker_gets_a_504_rather_than_a_rerun(client):
+    pool = client.app.state.pool
+    owner = pool.worker_for(ORCHARD_IDS[0])
+    sends = []
+
+    async def read_timeout(request, **kwargs):
+        sends.append(request)
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    with mock.patch.object(pool.workers["worker-0"].client, "send", read_timeout), \
+            mock.patch.object(pool.workers["worker-1"].client, "send", read_timeout):
+        response = client.get(f"/api/orchards/{ORCHARD_IDS[0]}/missing-trees", headers=HEADERS)
+
+    assert response.status_code == 504
+    assert len(sends) == 1
+    assert pool.worker_for(ORCHARD_IDS[0]) is owner
+
+
+@pytest.mark.parametrize("env, expected", [({}, "32"), ({"RECENT_ANALYSES_MAX_ENTRIES": "4"}, "4")])
+def test_workers_keep_recent_analyses_unless_configured_otherwise(tmp_path, env, expected):
+    with mock.patch("src.services.analysis_workers.DISPATCHER_RECENT_ANALYSES_MAX_ENTRIES", 32):
+        pool = AnalysisWorkerPool(2, socket_dir=str(tmp_path), env=env)
+
+    assert {worker.env["RECENT_ANALYSES_MAX_ENTRIES"] for worker in pool.workers.values()} == {expected}
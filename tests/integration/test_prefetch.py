@@ -0,0 +1,79 @@
+import functools
+from unittest import mock
+
+import pytest
+
+from benchmarks.aerobotics_stub import AeroboticsStub
+from src import app as wsgi
+from src.clients.aerobotics_api_client import AeroboticsAPIClient
+from src.services import analysis_requests
+from src.services.analysis_requests import AnalysisLookup
+from src.services.prefetch import PrefetchScheduler
+from src.utils.analysis_cache import AnalysisCache, analysis_key
+from src.utils.single_flight import SingleFlight
+
+HEADERS = {"Authorization": "Bearer token"}
+
+
+@pytest.fixture
+def stub():
+    with AeroboticsStub(trees_per_orchard=150) as stub:
+        yield stub
+
+
+@pytest.fixture
+def scheduler(stub, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return PrefetchScheduler(
+        ["216269", "216270"],
+        "token",
+        cache=AnalysisCache(str(tmp_path / "cache")),
+        client_factory=functools.partial(AeroboticsAPIClient, base_url=stub.url),
+        flights=SingleFlight(str(tmp_path / "single_flight")),
+    )
+
+
+def test_new_surveys_are_analysed_once(stub, scheduler):
+    first_survey_ids = [stub.orchards.publish_survey(orchard_id) for orchard_id in ("216269", "216270")]
+
+    assert scheduler.poll_once() == [
+        analysis_key("216269", first_survey_ids[0], "fine"),
+        analysis_key("216270", first_survey_ids[1], "fine"),
+    ]
+    assert scheduler.poll_once() == []
+
+    new_survey_id = stub.orchards.publish_survey("216270")
+    assert scheduler.poll_once() == [analysis_key("216270", new_survey_id, "fine")]
+    assert scheduler.cache.get(analysis_key("216270", new_survey_id, "fine"))["survey_id"] == new_survey_id
+
+
+def test_failing_orchard_does_not_stop_the_others(stub, scheduler):
+    scheduler.orchard_ids = ["", "216269"]
+
+    analysed = scheduler.poll_once()
+
+    assert len(analysed) == 1
+    assert analysed[0].startswith("216269:")
+
+
+def test_first_request_after_prefetch_is_served_from_cache(stub, scheduler, monkeypatch):
+    scheduler.orchard_ids = ["216269"]
+    scheduler.poll_once()
+
+    monkeypatch.setattr(wsgi, "AeroboticsAPIClient", functools.partial(AeroboticsAPIClient, base_url=stub.url))
+    monkeypatch.setattr(wsgi, "analyses", AnalysisLookup(scheduler.flights, cache=scheduler.cache))
+    with mock.patch.object(
+        analysis_requests, "analyse_orchard", side_effect=AssertionError("should be served from cache")
+    ):
+        response = wsgi.app.test_client().get("/api/orchards/216269/missing-trees", headers=HEADERS)
+
+    assert response.status_code == 200
+    assert "missing_trees" in response.get_json()
+
+
+def test_run_forever_stops(scheduler):
+    scheduler.interval_seconds = 60
+    with mock.patch.object(scheduler, "poll_once", side_effect=scheduler.stop) as poll_once:
+        scheduler.run_forever()
+
+    poll_once.assert_called_once()
@@ -0,0 +1,63 @@
+import httpx
+import pytest
+
+from benchmarks.aerobotics_stub import AeroboticsStub
+from src.clients.aerobotics_api_client import AeroboticsAPIClient, AsyncAeroboticsAPIClient
+from src.utils.api_error import ApiError
+from src.validation.aerobotics import validate_survey_response, validate_tree_survey_response
+
+pytest_plugins = ("pytest_asyncio",)
+
+
+@pytest.fixture
+def stub():
+    with AeroboticsStub(trees_per_orchard=50) as stub:
+        yield stub
+
+
+def test_client_reads_survey_and_tree_survey_from_base_url(stub):
+    client = AeroboticsAPIClient("token", base_url=f"{stub.url}/")
+
+    survey = client.get_survey("216269")
+    tree_survey = client.get_tree_survey(survey["results"][0]["id"])
+
+    assert validate_survey_response(survey) == (True, None)
+    assert validate_tree_survey_response(tree_survey)[0]
+    assert tree_survey["count"] == len(tree_survey["results"]) > 0
+
+
+def test_published_survey_replaces_the_latest_survey(stub):
+    client = AeroboticsAPIClient("token", base_url=stub.url)
+    first_survey_id = client.get_survey("216269")["results"][0]["id"]
+
+    published_survey_id = stub.orchards.publish_survey("216269")
+
+    assert published_survey_id != first_survey_id
+    assert client.get_survey("216269")["results"][0]["id"] == published_survey_id
+
+
+def test_upstream_errors_raise_api_error(stub):
+    client = AeroboticsAPIClient("token", base_url=stub.url)
+
+    with pytest.raises(ApiError) as error:
+        client.get_tree_survey("999")
+
+    assert error.value.status == 404
+    assert error.value.message == "Not found."
+
+
+@pytest.mark.asyncio
+async def test_async_client_matches_the_sync_client(stub):
+    client = AeroboticsAPIClient("token", base_url=stub.url)
+
+    async with httpx.AsyncClient() as http_client:
+        async_client = AsyncAeroboticsAPIClient("token", http_client, base_url=stub.url)
+        survey = await async_client.get_survey("216269")
+        tree_survey = await async_client.get_tree_survey(survey["results"][0]["id"])
+
+        with pytest.raises(ApiError) as error:
+            await async_client.get_tree_survey("999")
+
+    assert survey == client.get_survey("216269")
+    assert tree_survey == client.get_tree_survey(survey["results"][0]["id"])
+    assert error.value.status == 404
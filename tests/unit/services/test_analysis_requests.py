@@ -0,0 +1,120 @@
+import gzip
+from unittest import mock
+
+import pytest
+
+from benchmarks.synthetic_orchard import generate_orchard
+from src.config.settings import DEFAULT_SEARCH_RESOLUTION
+from src.services import orchard_analysis
+from src.services.analysis_requests import (
+    AnalysisLookup,
+    AnalysisRequest,
+    accepts_gzip,
+    etag_matches,
+    export_response_parts,
+    parse_analysis_request,
+)
+from src.utils.analysis_cache import AnalysisCache, RecentAnalyses, analysis_key
+from src.utils.api_error import InvalidRequestError, UpstreamDataError
+from src.utils.deadline import DEADLINE_HEADER
+
+HEADERS = {"Authorization": "Bearer token"}
+SURVEY = {"results": [{"id": 1000, "polygon": "18.0,-33.0 18.1,-33.0 18.1,-33.1"}]}
+
+
+def test_parse_analysis_request_defaults():
+    analysis_request = parse_analysis_request("216269", HEADERS, {})
+
+    assert analysis_request.bearer_token == "token"
+    assert analysis_request.resolution == DEFAULT_SEARCH_RESOLUTION
+
+
+@pytest.mark.parametrize(
+    "headers, query_params, status",
+    [
+        ({}, {}, 401),
+        ({"Authorization": "Basic token"}, {}, 401),
+        (HEADERS, {"resolution": "coarse"}, 400),
+        (HEADERS, {"resolution": "multires"}, 400),
+        (dict(HEADERS, **{DEADLINE_HEADER: "soon"}), {}, 400),
+    ],
+)
+def test_parse_analysis_request_rejects_invalid_requests(headers, query_params, status):
+    with pytest.raises(InvalidRequestError) as raised:
+        parse_analysis_request("216269", headers, query_params)
+
+    assert raised.value.status == status
+
+
+@pytest.mark.parametrize(
+    "if_none_match, matches",
+    [
+        (None, False),
+        ('W/"abc"', True),
+        ('"abc"', True),
+        ('"other", W/"abc"', True),
+        ("*", True),
+        ('W/"other"', False),
+    ],
+)
+def test_etag_matches_weakly(if_none_match, matches):
+    assert etag_matches('W/"abc"', if_none_match) is matches
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, accepted",
+    [("", False), ("gzip", True), ("deflate, GZIP;q=0.5", True), ("gzip;q=0", False), ("br", False)],
+)
+def test_accepts_gzip(accept_encoding, accepted):
+    assert accepts_gzip(accept_encoding) is accepted
+
+
+def test_export_response_parts():
+    body, status, headers = export_response_parts(b"payload", "application/geo+json", {"Accept-Encoding": "gzip"})
+    unchanged = export_response_parts(b"payload", "application/geo+json", {"If-None-Match": headers["ETag"]})
+
+    assert status == 200
+    assert gzip.decompress(body) == b"payload"
+    assert headers["Content-Type"] == "application/geo+json"
+    assert unchanged == (b"", 304, {"Vary": "Accept-Encoding", "ETag": headers["ETag"]})
+
+
+def test_lookup_prefers_recent_then_prefetched_analyses(tmp_path):
+    flights = mock.Mock()
+    lookup = AnalysisLookup(flights, AnalysisCache(str(tmp_path)), RecentAnalyses(max_entries=4))
+    client = mock.Mock(get_survey=mock.Mock(return_value=SURVEY))
+    analysis_request = AnalysisRequest("216269", "token", "fine", 30.0)
+    key = analysis_key("216269", 1000, "fine")
+
+    lookup.cache.put(key, {"source": "prefetch"})
+    assert lookup.get(client, analysis_request) == {"source": "prefetch"}
+
+    lookup.cache.put(key, {"source": "newer prefetch"})
+    assert lookup.get(client, analysis_request) == {"source": "prefetch"}
+    flights.do.assert_not_called()
+
+
+def test_lookup_rejects_an_invalid_survey(tmp_path):
+    lookup = AnalysisLookup(mock.Mock(), AnalysisCache(str(tmp_path)), RecentAnalyses())
+    client = mock.Mock(get_survey=mock.Mock(return_value={"results": []}))
+
+    with pytest.raises(UpstreamDataError):
+        lookup.get(client, AnalysisRequest("216269", "token", "fine", 30.0))
+
+
+def test_lookup_analyses_within_its_memory_budget(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    orchard = generate_orchard(rows=10, trees_per_row=10)
+    client = mock.Mock(
+        get_survey=mock.Mock(return_value=orchard["survey"]),
+        get_tree_survey=mock.Mock(return_value=orchard["tree_survey"]),
+    )
+    flights = mock.Mock(do=lambda key, analyse: analyse())
+    lookup = AnalysisLookup(flights, AnalysisCache(str(tmp_path)), RecentAnalyses(), memory_budget_mb=1)
+
+    with mock.patch.object(
+        orchard_analysis, "find_missing_tree_positions", wraps=orchard_analysis.find_missing_tree_positions
+    ) as find_missing_tree_positions:
+        lookup.get(client, AnalysisRequest("216269", "token", "fine", 30.0))
+
+    assert find_missing_tree_positions.call_args.kwargs["memory_budget_mb"] == 1
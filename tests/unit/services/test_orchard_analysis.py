@@ -0,0 +1,23 @@
+from unittest import mock
+
+import pytest
+
+from benchmarks.synthetic_orchard import generate_orchard
+from src.services import orchard_analysis
+from src.utils import visualisation
+
+
+@pytest.mark.parametrize("render_mode, draws_polygons", [("circles", False), ("collection", True), ("per_crown", True)])
+def test_tree_polygons_are_only_built_when_the_map_draws_them(tmp_path, monkeypatch, render_mode, draws_polygons):
+    monkeypatch.chdir(tmp_path)
+    orchard = generate_orchard(rows=5, trees_per_row=5)
+    create_tree_polygons = mock.Mock(wraps=orchard_analysis.create_tree_polygons)
+    create_orchard_map = mock.Mock()
+    monkeypatch.setattr(orchard_analysis, "draws_tree_polygons", lambda: visualisation.draws_tree_polygons(render_mode))
+    monkeypatch.setattr(orchard_analysis, "create_tree_polygons", create_tree_polygons)
+    monkeypatch.setattr(orchard_analysis, "create_orchard_map", create_orchard_map)
+
+    orchard_analysis.analyse_tree_data("216269", 1, orchard["tree_data"], orchard["outer_polygon"])
+
+    assert create_tree_polygons.called is draws_polygons
+    assert bool(create_orchard_map.call_args.kwargs["tree_polygons"]) is draws_polygons
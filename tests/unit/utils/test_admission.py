@@ -0,0 +1,158 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.synthetic_orchard import generate_orchard
+from src.utils.admission import AdmissionController, AdmissionRejected, CostEstimate, estimate_analysis_cost
+from src.utils.deadline import request_deadline
+
+pytest_plugins = ("pytest_asyncio",)
+
+CHEAP = CostEstimate(tree_count=100, area_m2=3000, grid_points=300, estimated_ms=100)
+HEAVY = CostEstimate(tree_count=20000, area_m2=600000, grid_points=60000, estimated_ms=15000)
+
+
+def test_estimate_grows_with_orchard_size():
+    small = generate_orchard(rows=10, trees_per_row=10)
+    large = generate_orchard(rows=40, trees_per_row=40)
+
+    small_estimate = estimate_analysis_cost(len(small["tree_data"]), small["outer_polygon"])
+    large_estimate = estimate_analysis_cost(len(large["tree_data"]), large["outer_polygon"])
+
+    # 10x10 trees at 5m x 6m spacing, plus the headland around them
+    assert 2500 < small_estimate.area_m2 < 4000
+    assert large_estimate.grid_points > 10 * small_estimate.grid_points
+    assert large_estimate.estimated_ms > 10 * small_estimate.estimated_ms
+
+
+def test_cheap_analyses_take_the_fast_lane_while_the_heavy_lane_is_busy():
+    controller = AdmissionController(fast_lane_max_ms=1000, heavy_lane_concurrency=1, heavy_lane_wait_seconds=0)
+
+    with controller.admit(HEAVY, "large") as heavy_lane:
+        with controller.admit(CHEAP, "small") as fast_lane:
+            assert (heavy_lane, fast_lane) == ("heavy", "fast")
+
+
+def test_full_heavy_lane_rejects_with_retry_hint():
+    controller = AdmissionController(fast_lane_max_ms=1000, heavy_lane_concurrency=1, heavy_lane_wait_seconds=0.05)
+
+    with controller.admit(HEAVY, "first"):
+        with pytest.raises(AdmissionRejected) as error:
+            with controller.admit(HEAVY, "second"):
+                pytest.fail("the heavy lane should be full")
+
+    assert error.value.status == 503
+    assert 10 <= error.value.retry_after <= 15
+
+    # The slot is released once the first analysis finishes
+    with controller.admit(HEAVY, "third") as lane:
+        assert lane == "heavy"
+
+
+def test_heavy_lane_waits_for_a_slot():
+    controller = AdmissionController(fast_lane_max_ms=1000, heavy_lane_concurrency=1, heavy_lane_wait_seconds=5)
+    first_admitted, release_first = threading.Event(), threading.Event()
+
+    def first():
+        with controller.admit(HEAVY, "first"):
+            first_admitted.set()
+            release_first.wait(5)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    first_admitted.wait(5)
+    threading.Timer(0.1, release_first.set).start()
+
+    with controller.admit(HEAVY, "second") as lane:
+        assert lane == "heavy"
+    thread.join()
+
+
+def test_heavy_lane_wait_is_bounded_by_the_request_deadline():
+    controller = AdmissionController(fast_lane_max_ms=1000, heavy_lane_concurrency=1, heavy_lane_wait_seconds=60)
+
+    with controller.admit(HEAVY, "first"), request_deadline(0.05):
+        with pytest.raises(AdmissionRejected):
+            with controller.admit(HEAVY, "second"):
+                pass
+
+
+def test_estimated_and_actual_cost_are_logged(caplog):
+    controller = AdmissionController(fast_lane_max_ms=1000)
+
+    with caplog.at_level(logging.INFO, logger="src.utils.admission"):
+        with controller.admit(CHEAP, "orchard 216269"):
+            pass
+
+    assert "orchard 216269 lane=fast" in caplog.text
+    assert "estimated_ms=100 actual_ms=" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_async_admission_rejects_without_blocking_the_event_loop():
+    controller = AdmissionController(fast_lane_max_ms=1000, heavy_lane_concurrency=1, heavy_lane_wait_seconds=0.2)
+    ticks = []
+
+    async def tick():
+        for _ in range(5):
+            ticks.append(1)
+            await asyncio.sleep(0.02)
+
+    async with controller.admit_async(HEAVY, "first"):
+        ticker = asyncio.ensure_future(tick())
+        with pytest.raises(AdmissionRejected):
+            async with controller.admit_async(HEAVY, "second"):
+                pass
+        await ticker
+
+    assert len(ticks) == 5
+
+
+@pytest.mark.asyncio
+async def test_cancelled_async_wait_hands_the_slot_back():
+    controller = AdmissionController(fast_lane_max_ms=1000, heavy_lane_concurrency=1, heavy_lane_wait_seconds=5)
+
+    async def second():
+        async with controller.admit_async(HEAVY, "second"):
+            pytest.fail("the request was cancelled while it waited")
+
+    async with controller.admit_async(HEAVY, "first"):
+        waiting = asyncio.ensure_future(second())
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+    # The cancelled wait must not pick up the slot the first analysis released
+    await asyncio.sleep(0.1)
+
+    async with controller.admit_async(HEAVY, "third") as lane:
+        assert lane == "heavy"
+
+
+@pytest.mark.asyncio
+async def test_queued_heavy_analyses_do_not_hold_up_fast_requests():
+    controller = AdmissionController(fast_lane_max_ms=1000, heavy_lane_concurrency=1, heavy_lane_wait_seconds=5)
+    # Fewer threads than queued heavy analyses, as on a small box
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+
+    async def heavy(label):
+        with contextlib.suppress(AdmissionRejected):
+            async with controller.admit_async(HEAVY, label):
+                await asyncio.sleep(0.5)
+
+    async with controller.admit_async(HEAVY, "running"):
+        queued = [asyncio.ensure_future(heavy(f"queued {i}")) for i in range(6)]
+        await asyncio.sleep(0.05)
+
+        started = time.monotonic()
+        async with controller.admit_async(CHEAP, "fast") as lane:
+            await asyncio.to_thread(lambda: None)
+        waited = time.monotonic() - started
+
+    for waiting in queued:
+        waiting.cancel()
+    assert lane == "fast"
+    assert waited < 0.2
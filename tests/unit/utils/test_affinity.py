@@ -0,0 +1,33 @@
+from collections import Counter
+
+from src.utils.affinity import RendezvousHash
+
+ORCHARD_IDS = [str(216269 + i) for i in range(2000)]
+
+
+def test_orchards_are_spread_evenly_and_consistently():
+    ring = RendezvousHash(["worker-0", "worker-1", "worker-2", "worker-3"])
+
+    owners = {orchard_id: ring.owner(orchard_id) for orchard_id in ORCHARD_IDS}
+
+    assert owners == {orchard_id: RendezvousHash(ring.members).owner(orchard_id) for orchard_id in ORCHARD_IDS}
+    assert all(400 < count < 600 for count in Counter(owners.values()).values())
+
+
+def test_only_a_removed_workers_orchards_move_and_they_come_back():
+    ring = RendezvousHash(["worker-0", "worker-1", "worker-2"])
+    before = {orchard_id: ring.owner(orchard_id) for orchard_id in ORCHARD_IDS}
+
+    ring.remove("worker-1")
+    during = {orchard_id: ring.owner(orchard_id) for orchard_id in ORCHARD_IDS}
+    ring.add("worker-1")
+    after = {orchard_id: ring.owner(orchard_id) for orchard_id in ORCHARD_IDS}
+
+    moved = [orchard_id for orchard_id in ORCHARD_IDS if before[orchard_id] != during[orchard_id]]
+    assert moved and all(before[orchard_id] == "worker-1" for orchard_id in moved)
+    assert "worker-1" not in during.values()
+    assert after == before
+
+
+def test_no_owner_without_members():
+    assert RendezvousHash().owner("216269") is None
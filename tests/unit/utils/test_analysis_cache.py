@@ -0,0 +1,51 @@
+import os
+
+from src.utils.analysis_cache import AnalysisCache, RecentAnalyses, analysis_key
+
+
+def test_round_trip_and_miss(tmp_path):
+    cache = AnalysisCache(str(tmp_path))
+    key = analysis_key("216269", 1, "fine")
+
+    assert cache.get(key) is None
+    assert key not in cache
+
+    cache.put(key, {"survey_id": 1})
+
+    assert key in cache
+    assert cache.get(key) == {"survey_id": 1}
+    assert cache.get(analysis_key("216269", 1, "multires")) is None
+
+
+def test_oldest_entries_are_pruned(tmp_path):
+    cache = AnalysisCache(str(tmp_path), max_entries=2)
+    keys = [analysis_key("216269", survey_id, "fine") for survey_id in range(3)]
+
+    for age, key in enumerate(keys):
+        cache.put(key, {"survey_id": age})
+        os.utime(cache._path(key), (age, age))
+    cache.put(keys[2], {"survey_id": 2})
+
+    assert keys[0] not in cache
+    assert keys[1] in cache and keys[2] in cache
+
+
+def test_unpicklable_analysis_is_not_stored(tmp_path):
+    cache = AnalysisCache(str(tmp_path))
+
+    cache.put("216269:1:fine", {"callback": lambda: None})
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_recent_analyses_drop_the_least_recently_used():
+    recent = RecentAnalyses(max_entries=2)
+    recent.put("a", {"survey_id": 1})
+    recent.put("b", {"survey_id": 2})
+
+    assert recent.get("a") == {"survey_id": 1}
+    recent.put("c", {"survey_id": 3})
+
+    assert recent.get("b") is None
+    assert recent.get("a") == {"survey_id": 1} and recent.get("c") == {"survey_id": 3}
+    assert len(recent) == 2
@@ -0,0 +1,86 @@
+import pickle
+from unittest import mock
+
+import pytest
+
+from benchmarks.aerobotics_stub import AeroboticsStub
+from benchmarks.synthetic_orchard import generate_orchard
+from src.clients.aerobotics_api_client import AeroboticsAPIClient
+from src.config.settings import MAX_REQUEST_DEADLINE_SECONDS, REQUEST_DEADLINE_SECONDS
+from src.utils import spatial
+from src.utils.deadline import (
+    DEADLINE_HEADER,
+    DeadlineExceeded,
+    check_deadline,
+    current_deadline,
+    deadline_from_headers,
+    remaining_seconds,
+    request_deadline,
+)
+from src.utils.profiling import profile_stage
+
+
+def test_deadline_from_headers():
+    assert deadline_from_headers({}) == REQUEST_DEADLINE_SECONDS
+    assert deadline_from_headers({DEADLINE_HEADER: "1500"}) == 1.5
+    assert deadline_from_headers({DEADLINE_HEADER: str(10**9)}) == MAX_REQUEST_DEADLINE_SECONDS
+
+    for invalid in ("soon", "0", "-5"):
+        with pytest.raises(ValueError):
+            deadline_from_headers({DEADLINE_HEADER: invalid})
+
+
+def test_checks_are_noops_without_deadline():
+    check_deadline("anything")
+    assert remaining_seconds() is None
+
+
+def test_expired_deadline_stops_at_the_next_stage_with_diagnostics():
+    with request_deadline(0.01) as deadline:
+        with profile_stage("first"):
+            pass
+        deadline.expires_at = 0
+
+        with pytest.raises(DeadlineExceeded) as error:
+            with profile_stage("second"):
+                pytest.fail("the stage should not run")
+
+    assert error.value.status == 504
+    assert error.value.stage == "second"
+    assert [stage["stage"] for stage in error.value.body["stages_reached"]] == ["first", "second"]
+
+
+def test_expired_deadline_stops_candidate_generation_between_chunks():
+    orchard = generate_orchard(rows=10, trees_per_row=10)
+    rasterize_polygon_grid = spatial.rasterize_polygon_grid
+
+    def expire_after_first_chunk(*args, **kwargs):
+        chunks = rasterize_polygon_grid(*args, **dict(kwargs, chunk_size=5))
+        yield next(chunks)
+        current_deadline().expires_at = 0
+        yield from chunks
+
+    with mock.patch("src.utils.spatial.rasterize_polygon_grid", expire_after_first_chunk):
+        with request_deadline(60) as deadline:
+            with pytest.raises(DeadlineExceeded) as error:
+                spatial.find_missing_tree_positions(orchard["tree_data"], orchard["outer_polygon"])
+
+    assert error.value.stage == "generate_candidates"
+    assert error.value.body["progress"]["generate_candidates"]["chunks_processed"] == 1
+    assert "filter_candidates" not in [stage["stage"] for stage in deadline.stages]
+
+
+def test_deadline_exceeded_survives_pickling_from_worker_processes():
+    error = pickle.loads(pickle.dumps(DeadlineExceeded("generate_candidates", {"elapsed_ms": 12.0})))
+
+    assert (error.status, error.stage, error.body) == (504, "generate_candidates", {"elapsed_ms": 12.0})
+
+
+def test_upstream_call_times_out_with_the_remaining_budget():
+    with AeroboticsStub(latency_ms=500, trees_per_orchard=10) as stub:
+        client = AeroboticsAPIClient("token", base_url=stub.url)
+        with request_deadline(0.1):
+            with pytest.raises(DeadlineExceeded) as error:
+                client.get_survey("216269")
+
+    assert error.value.stage == "Get survey 216269"
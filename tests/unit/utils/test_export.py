@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+import pytest
+from shapely.geometry import MultiPolygon, Polygon
+
+from src.utils.export import analysis_to_arrays, read_columnar, to_columnar, to_geojson
+
+
+@pytest.fixture
+def analysis():
+    return {
+        "results": {
+            "missing_coords": [
+                {"lat": -32.32890222, "lng": 18.82584059, "confidence": "high", "distance_to_nearest": 4.9},
+                {
+                    "lat": -32.32880447,
+                    "lng": 18.82644837,
+                    "confidence": "high",
+                    "distance_to_nearest": 4.8,
+                    "merged_from": 4,
+                },
+            ],
+            "existing_tree_coords": [
+                {"lat": -32.3287, "lng": 18.8259, "id": 0},
+                {"lat": -32.3288, "lng": 18.8260, "id": 1},
+                {"lat": -32.3289, "lng": 18.8261, "id": 2},
+            ],
+        },
+        "inner_boundary": Polygon([(18.825, -32.329), (18.827, -32.329), (18.827, -32.328), (18.825, -32.329)]),
+    }
+
+
+def test_columnar_round_trip(analysis):
+    arrays = analysis_to_arrays(analysis)
+
+    payload = to_columnar(arrays)
+    tables = read_columnar(payload)
+
+    assert set(tables) == {"missing_trees", "existing_trees", "inner_boundary"}
+    for table_name, columns in arrays.items():
+        for column_name, values in columns.items():
+            np.testing.assert_array_equal(tables[table_name][column_name], values)
+    assert tables["missing_trees"]["merged_from"].tolist() == [0, 4]
+    assert tables["missing_trees"]["confidence"].tolist() == [2, 2]
+
+
+def test_columnar_rejects_other_payloads():
+    with pytest.raises(ValueError):
+        read_columnar(b'{"type": "FeatureCollection"}')
+
+
+def test_geojson_feature_collection(analysis):
+    collection = json.loads(to_geojson(analysis_to_arrays(analysis)))
+
+    kinds = [feature["properties"]["kind"] for feature in collection["features"]]
+    assert collection["type"] == "FeatureCollection"
+    assert kinds == [
+        "missing_tree", "missing_tree", "inner_boundary", "existing_tree", "existing_tree", "existing_tree"
+    ]
+
+    first, merged = collection["features"][:2]
+    assert first["geometry"] == {"type": "Point", "coordinates": [18.8258406, -32.3289022]}
+    assert first["properties"] == {
+        "kind": "missing_tree", "confidence": "high", "distance_to_nearest": 4.9, "merged_from": None
+    }
+    assert merged["properties"]["merged_from"] == 4
+    assert collection["features"][2]["geometry"]["type"] == "Polygon"
+
+
+@pytest.mark.parametrize("parts", [0, 2])
+def test_inner_boundary_with_no_parts_or_several(analysis, parts):
+    triangles = [Polygon([(18.825 + i, -32.329), (18.826 + i, -32.329), (18.826 + i, -32.328)]) for i in range(parts)]
+    analysis["inner_boundary"] = MultiPolygon(triangles) if parts else Polygon()
+
+    arrays = analysis_to_arrays(analysis)
+    boundary = json.loads(to_geojson(arrays))["features"][2]["geometry"]
+
+    assert arrays["inner_boundary"]["part"].tolist() == [part for part in range(parts) for _ in range(4)]
+    assert boundary["type"] == "MultiPolygon"
+    assert len(boundary["coordinates"]) == parts
+    tables = read_columnar(to_columnar(arrays))
+    np.testing.assert_array_equal(tables["inner_boundary"]["part"], arrays["inner_boundary"]["part"])
@@ -0,0 +1,98 @@
+import json
+import os
+import pstats
+
+import numpy as np
+
+from src.utils.profiling import (
+    PROFILE_REQUEST_HEADER,
+    list_artifacts,
+    memory_report,
+    profile_stage,
+    profiling_requested,
+    profiling_session,
+)
+
+
+def test_profile_stage_is_noop_without_session():
+    with profile_stage("nothing_to_see"):
+        value = sum(range(10))
+    assert value == 45
+
+
+def test_session_records_nested_stages_with_allocation_peaks():
+    with profiling_session("orchard 216269") as session:
+        with profile_stage("outer"):
+            with profile_stage("inner"):
+                buffer = bytearray(2_000_000)
+            del buffer
+
+    stages = {stage["stage"]: stage for stage in session.stages}
+    assert stages["inner"]["depth"] == 1
+    assert stages["outer"]["depth"] == 0
+    assert stages["inner"]["peak_increase_bytes"] >= 2_000_000
+    assert stages["outer"]["peak_bytes"] >= stages["inner"]["peak_bytes"]
+    assert "orchard-216269" in session.profile_id
+
+
+def test_session_peak_covers_allocations_in_earlier_stages():
+    with profiling_session("orchard 216269") as session:
+        with profile_stage("large"):
+            buffer = bytearray(50_000_000)
+            del buffer
+        with profile_stage("small"):
+            sum(range(1000))
+
+    assert session.peak_bytes >= 50_000_000
+    assert session.summary()["peak_bytes"] == session.peak_bytes
+
+
+def test_memory_report_records_resident_peaks_of_nested_stages():
+    with memory_report() as report:
+        with profile_stage("outer"):
+            with profile_stage("inner"):
+                buffer = np.ones(50 * 1024 * 1024, dtype=np.uint8)
+            del buffer
+
+    if not report.available:
+        return
+    stages = {stage["stage"]: stage for stage in report.stages}
+    assert stages["inner"]["depth"] == 1
+    # The buffer is freed by the time the outer stage ends, but its pages stay in the peak
+    assert stages["inner"]["peak_rss_mb"] - stages["outer"]["rss_mb"] >= 45
+    assert stages["outer"]["peak_rss_mb"] >= stages["inner"]["peak_rss_mb"]
+    assert report.peak_rss_mb == stages["outer"]["peak_rss_mb"]
+
+
+def test_only_one_session_at_a_time():
+    with profiling_session("first") as first:
+        with profiling_session("second") as second:
+            assert first is not None
+            assert second is None
+
+
+def test_write_artifacts_is_bounded(tmp_path):
+    profile_ids = []
+    for i in range(4):
+        with profiling_session(f"orchard-{i}") as session:
+            with profile_stage("work"):
+                sum(range(1000))
+        names = session.write_artifacts(directory=str(tmp_path), max_artifacts=2)
+        for name in names:
+            os.utime(tmp_path / name, (i, i))
+        profile_ids.append(session.profile_id)
+
+    names = {artifact["name"] for artifact in list_artifacts(str(tmp_path))}
+    assert names == {f"{profile_id}{extension}" for profile_id in profile_ids[2:] for extension in (".prof", ".json")}
+
+    summary = json.loads((tmp_path / f"{session.profile_id}.json").read_text())
+    assert summary["stages"][0]["stage"] == "work"
+    pstats.Stats(str(tmp_path / f"{session.profile_id}.prof"))
+
+
+def test_profiling_requested_requires_admin_token_for_header():
+    headers = {PROFILE_REQUEST_HEADER: "1"}
+    assert profiling_requested("admin-token", headers, always_profile=False, admin_tokens=["admin-token"])
+    assert not profiling_requested("user-token", headers, always_profile=False, admin_tokens=["admin-token"])
+    assert not profiling_requested("admin-token", {}, always_profile=False, admin_tokens=["admin-token"])
+    assert profiling_requested(None, {}, always_profile=True, admin_tokens=[])
@@ -0,0 +1,210 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.utils.deadline import DeadlineExceeded, request_deadline
+from src.utils.single_flight import AsyncSingleFlight, SingleFlight
+
+pytest_plugins = ("pytest_asyncio",)
+
+
+def run_concurrently(targets):
+    results, errors = [None] * len(targets), []
+
+    def run(index, target):
+        try:
+            results[index] = target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i, target)) for i, target in enumerate(targets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results, errors
+
+
+def slow_counter(calls, value="result"):
+    def compute():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return {"value": value}
+    return compute
+
+
+def test_concurrent_calls_in_one_worker_share_one_computation(tmp_path):
+    flights = SingleFlight(directory=str(tmp_path))
+    calls = []
+
+    results, errors = run_concurrently([lambda: flights.do("216269:1", slow_counter(calls))] * 5)
+
+    assert not errors
+    assert len(calls) == 1
+    assert all(result == {"value": "result"} for result in results)
+
+
+def test_different_keys_are_not_coalesced(tmp_path):
+    flights = SingleFlight(directory=str(tmp_path))
+    calls = []
+
+    run_concurrently([
+        lambda: flights.do("216269:1", slow_counter(calls)),
+        lambda: flights.do("216269:2", slow_counter(calls)),
+    ])
+
+    assert len(calls) == 2
+
+
+def test_workers_share_a_result_through_the_lock_directory(tmp_path):
+    # Two instances stand in for two gunicorn workers sharing the same directory
+    first_worker, second_worker = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    calls = []
+
+    results, errors = run_concurrently([
+        lambda: first_worker.do("216269:1", slow_counter(calls)),
+        lambda: (time.sleep(0.05), second_worker.do("216269:1", slow_counter(calls)))[1],
+    ])
+
+    assert not errors
+    assert len(calls) == 1
+    assert results[0] == results[1] == {"value": "result"}
+
+
+def test_expired_results_are_recomputed(tmp_path):
+    flights = SingleFlight(directory=str(tmp_path), result_ttl_seconds=0)
+    calls = []
+
+    flights.do("216269:1", slow_counter(calls, "first"))
+    time.sleep(0.01)
+
+    assert flights.do("216269:1", slow_counter(calls, "second")) == {"value": "second"}
+    assert len(calls) == 2
+
+
+def test_followers_retry_when_the_leader_fails(tmp_path):
+    flights = SingleFlight(directory=str(tmp_path))
+    calls = []
+
+    def failing_leader():
+        time.sleep(0.2)
+        raise PermissionError("token has no access")
+
+    results, errors = run_concurrently([
+        lambda: flights.do("216269:1", failing_leader),
+        lambda: (time.sleep(0.05), flights.do("216269:1", slow_counter(calls)))[1],
+    ])
+
+    assert len(errors) == 1 and isinstance(errors[0], PermissionError)
+    assert results[1] == {"value": "result"}
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("same_worker", [True, False])
+def test_followers_stop_waiting_at_their_deadline(tmp_path, same_worker):
+    leader_flights = SingleFlight(str(tmp_path))
+    follower_flights = leader_flights if same_worker else SingleFlight(str(tmp_path))
+    calls = []
+
+    def slow_leader():
+        calls.append("leader")
+        time.sleep(1.0)
+        return "result"
+
+    waited = []
+
+    def follower():
+        started = time.monotonic()
+        try:
+            with request_deadline(0.1):
+                return follower_flights.do("216269:1", slow_counter(calls))
+        finally:
+            waited.append(time.monotonic() - started)
+
+    results, errors = run_concurrently([
+        lambda: leader_flights.do("216269:1", slow_leader),
+        lambda: (time.sleep(0.05), follower())[1],
+    ])
+
+    assert results[0] == "result"
+    assert len(errors) == 1 and isinstance(errors[0], DeadlineExceeded)
+    assert errors[0].stage == "single_flight_wait"
+    assert waited[0] < 0.5
+    assert calls == ["leader"]
+
+
+@pytest.mark.asyncio
+async def test_async_followers_stop_waiting_at_their_deadline():
+    flights = AsyncSingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.5)
+        return "result"
+
+    leader = asyncio.ensure_future(flights.do("216269:1", compute))
+    await asyncio.sleep(0)
+    with request_deadline(0.05):
+        with pytest.raises(DeadlineExceeded):
+            await flights.do("216269:1", compute)
+
+    assert not leader.done()
+    assert await leader == "result"
+
+
+@pytest.mark.asyncio
+async def test_async_calls_share_one_task():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return {"value": "result"}
+
+    results = await asyncio.gather(*[flights.do("216269:1", compute) for _ in range(5)])
+
+    assert len(calls) == 1
+    assert all(result == {"value": "result"} for result in results)
+
+
+@pytest.mark.asyncio
+async def test_async_followers_retry_when_the_leader_fails():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append("leader")
+        await asyncio.sleep(0.05)
+        raise ValueError("token not allowed")
+
+    async def compute():
+        calls.append("follower")
+        return "result"
+
+    leader = asyncio.ensure_future(flights.do("216269:1", fail))
+    await asyncio.sleep(0)
+    follower = await flights.do("216269:1", compute)
+
+    with pytest.raises(ValueError):
+        await leader
+    assert follower == "result"
+    assert calls == ["leader", "follower"]
+
+
+@pytest.mark.asyncio
+async def test_async_leader_disconnecting_does_not_cancel_the_shared_task():
+    flights = AsyncSingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.1)
+        return "result"
+
+    leader = asyncio.ensure_future(flights.do("216269:1", compute))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flights.do("216269:1", compute))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    assert await follower == "result"
@@ -1,7 +1,18 @@
+import tracemalloc
 import unittest
+from unittest import mock
+import numpy as np
+import shapely
 from shapely.geometry import Polygon
+from benchmarks.synthetic_orchard import generate_orchard
 from src.config.settings import DEFAULT_PROJECTED_CRS
-from src.utils.spatial import build_outer_polygon_from_survey, create_tree_polygons
+from src.utils import spatial
+from src.utils.spatial import (
+    build_outer_polygon_from_survey,
+    create_tree_polygons,
+    find_missing_tree_positions,
+    rasterize_polygon_grid,
+)
 
 class TestBuildOuterPolygonFromSurvey(unittest.TestCase):
     def test_valid_polygon(self):
@@ -50,5 +61,88 @@ class TestCreateTreePolygons(unittest.TestCase):
             create_tree_polygons(incomplete_data, DEFAULT_PROJECTED_CRS)
         self.assertIn("Invalid tree data at indices", str(cm.exception))
 
+class TestRasterizePolygonGrid(unittest.TestCase):
+    def assert_matches_bounding_box_grid(self, polygon, grid_spacing, chunk_size=50):
+        minx, miny, maxx, maxy = polygon.bounds
+        X, Y = np.meshgrid(
+            np.arange(minx, maxx + grid_spacing, grid_spacing),
+            np.arange(miny, maxy + grid_spacing, grid_spacing),
+        )
+        grid_points = np.column_stack([X.ravel(), Y.ravel()])
+        expected = grid_points[shapely.contains_xy(polygon, grid_points[:, 0], grid_points[:, 1])]
+
+        chunks = list(rasterize_polygon_grid(polygon, grid_spacing, chunk_size=chunk_size))
+
+        self.assertTrue(all(len(chunk) <= chunk_size for chunk in chunks))
+        np.testing.assert_array_equal(np.vstack(chunks), expected)
+
+    def test_concave_polygon_with_hole(self):
+        polygon = Polygon(
+            [(0, 0), (100, 0), (100, 50), (50, 50), (50, 100), (0, 100)],
+            [[(10, 10), (20, 10), (20, 20), (10, 20)]],
+        )
+        self.assert_matches_bounding_box_grid(polygon, 3.0)
+
+    def test_thin_diagonal_polygon_in_projected_coordinates(self):
+        polygon = Polygon([
+            (300000, 6420000), (300300, 6420300), (300303, 6420296), (300003, 6419996)
+        ])
+        self.assert_matches_bounding_box_grid(polygon, 3.0)
+        self.assert_matches_bounding_box_grid(polygon, 0.75)
+
+    def test_points_on_horizontal_edges_are_excluded(self):
+        polygon = Polygon([(0, 0), (12, 0), (12, 3), (24, 3), (24, 0), (30, 0), (30, 9), (0, 9)])
+        self.assert_matches_bounding_box_grid(polygon, 1.0)
+
+class TestSearchResolution(unittest.TestCase):
+    def test_retired_multires_search_is_rejected(self):
+        orchard = generate_orchard(rows=5, trees_per_row=5)
+
+        with self.assertRaises(ValueError):
+            find_missing_tree_positions(orchard["tree_data"], orchard["outer_polygon"], resolution="multires")
+
+
+class TestMemoryBudget(unittest.TestCase):
+    def test_smaller_budget_works_in_smaller_chunks_with_the_same_results(self):
+        orchard = generate_orchard(rows=20, trees_per_row=25, missing_fraction=0.05, seed=3)
+        chunk_sizes = []
+
+        def recording_rasterize(*args, **kwargs):
+            chunk_sizes.append(kwargs["chunk_size"])
+            return rasterize_polygon_grid(*args, **kwargs)
+
+        results = {}
+        with mock.patch.object(spatial, "rasterize_polygon_grid", recording_rasterize):
+            for budget_mb in (64, 1):
+                results[budget_mb] = find_missing_tree_positions(
+                    orchard["tree_data"], orchard["outer_polygon"], memory_budget_mb=budget_mb
+                )
+
+        self.assertGreater(chunk_sizes[0], chunk_sizes[1])
+        self.assertEqual(results[64], results[1])
+
+    def test_a_far_outlier_tree_does_not_blow_the_budget(self):
+        orchard = generate_orchard(rows=20, trees_per_row=25, missing_fraction=0.05, seed=3)
+        # About 150 km from the orchard
+        outlier = {"lat": -33.5, "lng": 20.5, "area": 10.0}
+
+        tracemalloc.start()
+        try:
+            results = find_missing_tree_positions(orchard["tree_data"] + [outlier], orchard["outer_polygon"])
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(peak, 64 * 1024 * 1024)
+        self.assertEqual(
+            results["summary"]["total_missing"],
+            find_missing_tree_positions(orchard["tree_data"], orchard["outer_polygon"])["summary"]["total_missing"],
+        )
+
+    def test_chunks_never_shrink_below_the_minimum(self):
+        with self.assertLogs("src.utils.spatial", level="WARNING"):
+            chunk_size = spatial.budgeted_chunk_size(1, 2 * 1024 * 1024, 100, "generate_candidates")
+        self.assertEqual(chunk_size, spatial.MIN_CHUNK_SIZE)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,86 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from src.utils.spatial_index import UniformGridIndex
+
+
+@pytest.fixture
+def points():
+    return np.random.default_rng(7).uniform(0, 100, size=(500, 2))
+
+
+@pytest.fixture
+def queries():
+    # Some well outside the indexed points, which must still find their neighbours at the edges
+    return np.random.default_rng(8).uniform(-20, 120, size=(300, 2))
+
+
+@pytest.mark.parametrize("cell_size", [2.0, 4.0, 15.0])
+@pytest.mark.parametrize("radius", [1.6, 6.0, 10.0])
+def test_radius_queries_match_cKDTree(points, queries, cell_size, radius):
+    index = UniformGridIndex(points, cell_size)
+    expected = cKDTree(points).query_ball_point(queries, radius)
+
+    query_index, point_index = index.query_radius(queries, radius)
+
+    assert np.all(np.diff(query_index) >= 0)
+    for i, neighbours in enumerate(expected):
+        found = point_index[np.searchsorted(query_index, i):np.searchsorted(query_index, i + 1)]
+        assert sorted(found.tolist()) == sorted(neighbours)
+    np.testing.assert_array_equal(index.count_radius(queries, radius), [len(neighbours) for neighbours in expected])
+
+
+@pytest.mark.parametrize("max_distance", [1.0, 4.0, 25.0])
+def test_nearest_matches_cKDTree(points, queries, max_distance):
+    expected_distances, expected_indices = cKDTree(points).query(queries, distance_upper_bound=max_distance)
+
+    distances, indices = UniformGridIndex(points, 4.0).nearest(queries, max_distance)
+
+    np.testing.assert_allclose(distances, expected_distances)
+    np.testing.assert_array_equal(indices, expected_indices)
+
+
+def test_points_exactly_at_the_radius_are_included():
+    index = UniformGridIndex(np.array([[0.0, 0.0], [4.0, 0.0], [8.0, 0.0]]), 4.0)
+
+    np.testing.assert_array_equal(index.count_radius(np.array([[4.0, 0.0]]), 4.0), [3])
+    np.testing.assert_array_equal(index.nearest(np.array([[12.0, 0.0]]), 4.0)[0], [4.0])
+
+
+def test_empty_index():
+    index = UniformGridIndex(np.empty((0, 2)), 4.0)
+    queries = np.array([[0.0, 0.0], [10.0, 10.0]])
+
+    np.testing.assert_array_equal(index.count_radius(queries, 5.0), [0, 0])
+    distances, indices = index.nearest(queries, 5.0)
+    assert np.all(np.isinf(distances))
+    np.testing.assert_array_equal(indices, [0, 0])
+
+
+@pytest.mark.parametrize("radius", [1.6, 6.0, 10.0])
+def test_query_bytes_bounds_the_memory_a_query_takes(points, queries, radius):
+    index = UniformGridIndex(points, 4.0)
+
+    tracemalloc.start()
+    try:
+        index.count_radius(queries, radius)
+        index.nearest(queries, radius)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert peak <= index.query_bytes(radius) * len(queries)
+
+
+def test_a_far_outlier_adds_one_cell_not_the_space_in_between(points, queries):
+    # One point about 150 km from the rest
+    with_outlier = np.vstack([points, [[150_000.0, -100_000.0]]])
+
+    index = UniformGridIndex(with_outlier, 4.0)
+    expected = cKDTree(with_outlier).query_ball_point(queries, 6.0)
+
+    assert index.nbytes < 2 * UniformGridIndex(points, 4.0).nbytes
+    np.testing.assert_array_equal(index.count_radius(queries, 6.0), [len(neighbours) for neighbours in expected])
@@ -0,0 +1,105 @@
+import io
+import json
+import logging
+import pathlib
+import queue
+from logging.handlers import QueueListener
+
+from src.utils.structured_logging import (
+    ContextFilter,
+    DroppingQueueHandler,
+    JsonFormatter,
+    current_log_context,
+    in_log_context,
+    log_context,
+)
+
+
+def make_logger(name: str, log_queue: queue.Queue) -> tuple[logging.Logger, DroppingQueueHandler]:
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger, handler
+
+
+def drain(log_queue: queue.Queue) -> list[dict]:
+    stream = io.StringIO()
+    writer = logging.StreamHandler(stream)
+    writer.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, writer)
+    listener.start()
+    listener.stop()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_are_json_with_request_context():
+    log_queue = queue.Queue()
+    logger, _ = make_logger("test_structured_logging.context", log_queue)
+
+    with log_context(request_id="abc123", orchard_id="216269"):
+        logger.info("Analysed %d trees", 42, extra={"elapsed_ms": 12.5})
+    logger.info("Outside the request")
+
+    inside, outside = drain(log_queue)
+    assert inside["message"] == "Analysed 42 trees"
+    assert inside["level"] == "INFO"
+    assert inside["request_id"] == "abc123" and inside["orchard_id"] == "216269"
+    assert inside["elapsed_ms"] == 12.5
+    assert "request_id" not in outside
+
+
+def test_messages_are_formatted_by_the_listener_not_the_caller():
+    class CountingArgument:
+        formatted = 0
+
+        def __str__(self):
+            CountingArgument.formatted += 1
+            return "argument"
+
+    log_queue = queue.Queue()
+    logger, _ = make_logger("test_structured_logging.lazy", log_queue)
+
+    logger.info("Formatted later: %s", CountingArgument())
+    logger.debug("Never formatted: %s", CountingArgument())
+    assert CountingArgument.formatted == 0
+
+    (record,) = drain(log_queue)
+    assert record["message"] == "Formatted later: argument"
+    assert CountingArgument.formatted == 1
+
+
+def test_records_are_dropped_and_counted_when_the_queue_is_full():
+    log_queue = queue.Queue(maxsize=2)
+    logger, handler = make_logger("test_structured_logging.dropping", log_queue)
+
+    for number in range(5):
+        logger.info("Record %d", number)
+    assert handler.dropped == 3
+
+    drain(log_queue)
+    logger.info("After the backlog cleared")
+
+    records = drain(log_queue)
+    assert [record["message"] for record in records] == [
+        "After the backlog cleared",
+        "Dropped 3 log records under back-pressure",
+    ]
+    assert records[1]["dropped"] == 3
+    assert handler.dropped == 0
+
+
+def test_context_can_be_carried_into_other_work():
+    with log_context(request_id="abc123"):
+        fields = current_log_context()
+
+    assert current_log_context() == {}
+    assert in_log_context(fields, current_log_context) == {"request_id": "abc123"}
+
+
+def test_src_does_not_print():
+    src = pathlib.Path(__file__).parents[3] / "src"
+    printing = [str(path) for path in src.rglob("*.py") if "print(" in path.read_text()]
+    assert printing == []
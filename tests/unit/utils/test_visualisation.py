@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import folium
+from shapely.geometry import Point, Polygon
+
+from src.utils.visualisation import create_orchard_map
+
+
+class TestCreateOrchardMap(unittest.TestCase):
+    def setUp(self):
+        self.outer_polygon = Polygon([(18.82, -32.33), (18.83, -32.33), (18.83, -32.32), (18.82, -32.32)])
+        self.inner_boundary = self.outer_polygon.buffer(-0.001)
+        self.trees = [
+            {"lat": -32.325 + i * 0.0001, "lng": 18.825 + i * 0.0001, "area": 10.0 + i} for i in range(20)
+        ]
+        self.tree_polygons = [Point(tree["lng"], tree["lat"]).buffer(0.00002) for tree in self.trees]
+
+    def create_map(self, render_mode):
+        return create_orchard_map(
+            tree_polygons=self.tree_polygons,
+            outer_polygon=self.outer_polygon,
+            inner_boundary=self.inner_boundary,
+            missing_points=[{"lat": -32.326, "lng": 18.826, "confidence": "high"}],
+            trees=self.trees,
+            render_mode=render_mode,
+        )
+
+    def geojson_layers(self, folium_map):
+        return [child for child in folium_map._children.values() if isinstance(child, folium.GeoJson)]
+
+    def test_collection_mode_draws_every_crown_in_one_layer(self):
+        layers = self.geojson_layers(self.create_map("collection"))
+        crown_layers = [layer for layer in layers if layer.layer_name == "Tree Crowns"]
+
+        self.assertEqual(len(crown_layers), 1)
+        features = crown_layers[0].data["features"]
+        self.assertEqual(len(features), len(self.tree_polygons))
+        self.assertEqual(features[0]["geometry"]["type"], "Polygon")
+        self.assertLess(len(features[0]["geometry"]["coordinates"][0]), 65)
+
+    def test_collection_mode_draws_crowns_smaller_than_the_tolerance(self):
+        # Simplified on their own, crowns this small collapse to empty polygons
+        self.tree_polygons = [Point(tree["lng"], tree["lat"]).buffer(0.000001) for tree in self.trees]
+        self.tree_polygons[-1] = Polygon()
+
+        layers = self.geojson_layers(self.create_map("collection"))
+        features = next(layer for layer in layers if layer.layer_name == "Tree Crowns").data["features"]
+
+        self.assertEqual([feature["properties"]["crown"] for feature in features], list(range(1, len(self.trees))))
+        self.assertTrue(all(len(feature["geometry"]["coordinates"][0]) >= 4 for feature in features))
+
+    def test_circles_mode_sizes_circles_by_crown_area(self):
+        folium_map = self.create_map("circles")
+        crown_layer = next(layer for layer in self.geojson_layers(folium_map) if layer.layer_name == "Tree Crowns")
+
+        self.assertEqual(crown_layer.data["features"][0]["properties"]["r"], 1.8)
+        self.assertIn("setRadius", folium_map.get_root().render())
+
+    def test_per_crown_mode_keeps_one_layer_per_crown(self):
+        folium_map = self.create_map("per_crown")
+        crown_group = next(
+            child for child in folium_map._children.values() if getattr(child, "layer_name", None) == "Tree Crowns"
+        )
+        self.assertEqual(len(crown_group._children), len(self.tree_polygons))
+
+    def test_unknown_render_mode_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.create_map("svg")
+
+    def test_unknown_configured_render_mode_fails_at_startup(self):
+        result = subprocess.run(
+            [sys.executable, "-c", "import src.config.settings"],
+            env=dict(os.environ, MAP_RENDER_MODE="svg"),
+            capture_output=True,
+            text=True,
+        )
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("MAP_RENDER_MODE must be one of", result.stderr)
+
+if __name__ == "__main__":
+    unittest.main()